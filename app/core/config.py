@@ -1,8 +1,32 @@
 # app/core/config.py
 
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Dict, List, Optional
 import os
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+class SMTPBackendSettings(BaseModel):
+    """
+    One SMTP account used to send emails. Fields left as None fall back to
+    the global SMTP_* settings.
+    """
+    name: str
+    host: str
+    port: int = 587
+    user: str
+    password: str
+    sender: Optional[str] = None # Defaults to 'AD Academy <user>'
+    weight: float = 1.0
+    start_tls: bool = True
+    pool_size: Optional[int] = None
+    rate_per_second: Optional[float] = None
+    rate_burst: Optional[int] = None
+    daily_limit: Optional[int] = None
+
+
 class Settings(BaseSettings):
     """
     Manages the application's configuration settings by loading them
@@ -15,7 +39,72 @@ class Settings(BaseSettings):
         SMTP_PORT (int): The port for the SMTP server.
         SMTP_USER (str): The username for SMTP authentication.
         SMTP_PASSWORD (str): The password for SMTP authentication.
+        SMTP_TIMEOUT (float): Timeout in seconds for SMTP network operations.
+        SMTP_POOL_SIZE (int): Maximum number of simultaneous SMTP connections.
+        SMTP_POOL_IDLE_TIMEOUT (float): Seconds an idle SMTP connection is kept open.
+        SMTP_POOL_MAX_MESSAGES (int): Messages sent per connection before it is recycled.
+        SMTP_POOL_HEALTHCHECK_INTERVAL (float): Idle seconds after which a NOOP is sent before reuse.
+        SMTP_GOVERNOR_ENABLED (bool): Pace SMTP sends with the adaptive governor (rate, daily budget, AIMD concurrency).
+        SMTP_RATE_PER_SECOND (float): Sustained messages per second allowed by the token bucket, per process (0 disables it); with several workers, divide the provider's rate by the worker count.
+        SMTP_RATE_BURST (int): Messages that may be sent back to back before the per-second rate applies.
+        SMTP_DAILY_LIMIT (int): Recipients per calendar day allowed by the provider (0 disables the budget), shared by the processes on the host.
+        SMTP_MIN_CONCURRENCY (int): Lowest number of concurrent sends the governor backs off to.
+        SMTP_LATENCY_TARGET (float): Send latency in seconds above which the governor reduces concurrency.
+        SMTP_THROTTLE_COOLDOWN (float): Seconds sending pauses after a throttling response, and minimum time between two backoffs.
+        SMTP_MAX_SEND_WAIT (float): Seconds a send may wait for a token before it is deferred back to the outbox.
+        SMTP_BACKENDS (List[SMTPBackendSettings]): JSON list of SMTP accounts to balance sends across; empty uses the single SMTP_HOST account.
+        SMTP_BACKEND_RETRY_BASE (float): Seconds an SMTP account is taken out of rotation after its first connection failure (doubles on each further failure).
+        SMTP_BACKEND_RETRY_MAX (float): Longest time an SMTP account stays out of rotation; authentication failures use it directly.
+        SUPPRESSION_REFRESH_INTERVAL (float): Seconds the in-memory copy of the email suppression list is reused before reloading it.
         FRONTEND_URL (str): The base URL for the frontend application.
+        CRON_CONCURRENCY (int): Maximum number of students processed in parallel by a cron job.
+        CRON_TASK_TIMEOUT (float): Timeout in seconds for each per-student unit of a cron job.
+        CRON_JOB_TIMEOUT (float): Timeout in seconds for a whole scheduled job run.
+        CRON_MISFIRE_GRACE_TIME (int): Seconds a missed scheduled run may still be executed late.
+        CLUSTER_MODE (str): 'single', 'leader' (one instance runs scheduled jobs) or 'sharded' (all live workers split the work).
+        CLUSTER_BACKEND (str): 'file' (single host, flock) or 'firestore' (lease document shared by replicas).
+        CLUSTER_WORKER_ID (str): Identifier of this worker; defaults to '<hostname>-<pid>'.
+        CLUSTER_LOCK_DIR (str): Directory for the file lease and worker heartbeats.
+        CLUSTER_LEASE_TTL (float): Seconds a lease or worker heartbeat stays valid without renewal.
+        CLUSTER_HEARTBEAT_INTERVAL (float): Seconds between lease renewals and heartbeats.
+        CLUSTER_PLAN_TIMEOUT (float): Seconds a sharded worker waits for the reader to publish its share of a run.
+        FIRESTORE_PAGE_SIZE (int): Documents read per page when paginating Firestore queries with cursors.
+        AUTH_THREAD_POOL_SIZE (int): Threads dedicated to blocking Firebase Auth Admin SDK calls.
+        AUTH_TOKEN_CACHE_SIZE (int): Maximum number of verified ID tokens kept in memory.
+        AUTH_ROLE_CACHE_SIZE (int): Maximum number of user roles kept in memory.
+        AUTH_ROLE_CACHE_TTL (float): Seconds a cached user role stays valid.
+        LOCAL_DB_PATH (str): Path of the local SQLite database used for the backend's own state.
+        OUTBOX_WORKERS (int): Number of async workers draining the email outbox.
+        OUTBOX_MAX_ATTEMPTS (int): Delivery attempts before an email is moved to the dead-letter table.
+        OUTBOX_BACKOFF_BASE (float): Base delay in seconds for the exponential retry backoff.
+        OUTBOX_BACKOFF_MAX (float): Maximum delay in seconds between two delivery attempts.
+        OUTBOX_POLL_INTERVAL (float): Seconds an idle worker waits before polling the outbox again.
+        OUTBOX_LEASE_SECONDS (float): Seconds a claimed email stays locked before another worker may retry it.
+        EMAIL_BATCH_CHUNK_SIZE (int): Valid items of a batch email request inserted into the outbox per transaction.
+        STUDENT_INDEX_ENABLED (bool): Keep an in-memory copy of the students collection updated by a snapshot listener.
+        STUDENT_INDEX_LOAD_TIMEOUT (float): Seconds startup waits for the initial students snapshot.
+        STUDENT_INDEX_RETRY_MAX (float): Longest wait in seconds between attempts to resubscribe a failed index listener.
+        DELINQUENCY_REMINDER_GRACE_DAYS (int): Days after the payment date before a payment reminder is sent.
+        DELINQUENCY_DEACTIVATION_GRACE_DAYS (int): Days after the payment date before an account is deactivated.
+        DELINQUENCY_MIN_DEBT (float): Debt must be greater than this amount for a student to count as overdue.
+        DELINQUENCY_EXEMPT_SCHOLARSHIPS (bool): Whether students with a scholarship in effect are never overdue.
+        IDEMPOTENCY_KEY_TTL (float): Seconds a stored Idempotency-Key response is replayed to retries.
+        IDEMPOTENCY_LOCK_TIMEOUT (float): Seconds an in-flight Idempotency-Key blocks retries before it is considered abandoned.
+        IDEMPOTENCY_PATH_PREFIXES (str): Comma-separated path prefixes where the Idempotency-Key header is honoured.
+        SEND_LEDGER_TTL (float): Seconds a cron email stays recorded as sent for its student, template and billing period.
+        STARTUP_BLOCKING_WARMUP (bool): Wait for Firebase initialization and the warm-up before serving, instead of warming up in the background.
+        LOG_LEVEL (str): Minimum level of the application's log records.
+        LOG_FORMAT (str): 'json' (one structured object per line) or 'text'.
+        LOG_QUEUE_SIZE (int): Log records waiting to be written before new ones are dropped.
+        LOG_SAMPLE_RATES (Dict[str, float]): JSON map of logger name (or prefix) to the fraction of its INFO/DEBUG records kept.
+        LOG_RATE_LIMIT (float): INFO/DEBUG records per second each logger may write (0 disables the limit).
+        LOG_RATE_BURST (int): INFO/DEBUG records a logger may write back to back before LOG_RATE_LIMIT applies.
+        PROFILE_SAMPLE_RATE (float): Fraction of requests and job runs profiled without being asked to (0 disables sampling).
+        PROFILE_INTERVAL (float): Seconds between two stack samples of a profile.
+        PROFILE_LOOP_LAG_THRESHOLD (float): Event loop lag in seconds above which the loop is considered blocked by a synchronous call.
+        PROFILE_DIR (str): Directory where profiles are saved (collapsed stacks and a JSON summary).
+        PROFILE_MAX_FILES (int): Most recent profiles kept in PROFILE_DIR.
+        METRICS_TOKEN (str): Bearer token required by /metrics; if empty the endpoint is open and must only be reachable from an internal interface.
     """
     # --- Firebase Configuration ---
     FIREBASE_SERVICE_ACCOUNT_KEY_PATH: str
@@ -26,12 +115,111 @@ class Settings(BaseSettings):
     SMTP_PORT: int
     SMTP_USER: str
     SMTP_PASSWORD: str
+    SMTP_TIMEOUT: float = 30.0
+
+    # --- SMTP Connection Pool ---
+    SMTP_POOL_SIZE: int = 4
+    SMTP_POOL_IDLE_TIMEOUT: float = 60.0
+    SMTP_POOL_MAX_MESSAGES: int = 100
+    SMTP_POOL_HEALTHCHECK_INTERVAL: float = 15.0
+
+    # --- SMTP Sending Governor ---
+    SMTP_GOVERNOR_ENABLED: bool = True
+    SMTP_RATE_PER_SECOND: float = 1.0
+    SMTP_RATE_BURST: int = 10
+    SMTP_DAILY_LIMIT: int = 2000
+    SMTP_MIN_CONCURRENCY: int = 1
+    SMTP_LATENCY_TARGET: float = 5.0
+    SMTP_THROTTLE_COOLDOWN: float = 60.0
+    SMTP_MAX_SEND_WAIT: float = 30.0
+
+    # --- SMTP Backends ---
+    SMTP_BACKENDS: List[SMTPBackendSettings] = []
+    SMTP_BACKEND_RETRY_BASE: float = 30.0
+    SMTP_BACKEND_RETRY_MAX: float = 900.0
+
+    # --- Email Suppression List ---
+    SUPPRESSION_REFRESH_INTERVAL: float = 60.0
 
     # --- Frontend Configuration ---
     FRONTEND_URL: str
 
+    # --- Cron Jobs ---
+    CRON_CONCURRENCY: int = 10
+    CRON_TASK_TIMEOUT: float = 60.0
+    CRON_JOB_TIMEOUT: float = 3600.0
+    CRON_MISFIRE_GRACE_TIME: int = 3600
+    FIRESTORE_PAGE_SIZE: int = 500
+
+    # --- Multi-worker Scheduling ---
+    CLUSTER_MODE: str = "single"
+    CLUSTER_BACKEND: str = "file"
+    CLUSTER_WORKER_ID: str = ""
+    CLUSTER_LOCK_DIR: str = os.path.join(BASE_DIR, 'data', 'cluster')
+    CLUSTER_LEASE_TTL: float = 60.0
+    CLUSTER_HEARTBEAT_INTERVAL: float = 15.0
+    CLUSTER_PLAN_TIMEOUT: float = 300.0
+
+    # --- Firebase Auth ---
+    AUTH_THREAD_POOL_SIZE: int = 16
+
+    # --- Auth Cache ---
+    AUTH_TOKEN_CACHE_SIZE: int = 1024
+    AUTH_ROLE_CACHE_SIZE: int = 1024
+    AUTH_ROLE_CACHE_TTL: float = 60.0
+
+    # --- Local Storage ---
+    LOCAL_DB_PATH: str = os.path.join(BASE_DIR, 'data', 'aurora_mentis.db')
+
+    # --- Email Outbox ---
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_BACKOFF_BASE: float = 30.0
+    OUTBOX_BACKOFF_MAX: float = 3600.0
+    OUTBOX_POLL_INTERVAL: float = 5.0
+    OUTBOX_LEASE_SECONDS: float = 300.0
+    EMAIL_BATCH_CHUNK_SIZE: int = 500
+
+    # --- Student Index ---
+    STUDENT_INDEX_ENABLED: bool = False
+    STUDENT_INDEX_LOAD_TIMEOUT: float = 60.0
+    STUDENT_INDEX_RETRY_MAX: float = 300.0
+
+    # --- Delinquency Policy ---
+    DELINQUENCY_REMINDER_GRACE_DAYS: int = 0
+    DELINQUENCY_DEACTIVATION_GRACE_DAYS: int = 0
+    DELINQUENCY_MIN_DEBT: float = 0.0
+    DELINQUENCY_EXEMPT_SCHOLARSHIPS: bool = True
+
+    # --- Idempotency ---
+    IDEMPOTENCY_KEY_TTL: float = 86400.0
+    IDEMPOTENCY_LOCK_TIMEOUT: float = 300.0
+    IDEMPOTENCY_PATH_PREFIXES: str = "/emails,/users"
+    SEND_LEDGER_TTL: float = 45 * 86400.0
+
+    # --- Startup ---
+    STARTUP_BLOCKING_WARMUP: bool = False
+
+    # --- Logging ---
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+    LOG_RATE_LIMIT: float = 20.0
+    LOG_RATE_BURST: int = 200
+
+    # --- Profiling ---
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL: float = 0.005
+    PROFILE_LOOP_LAG_THRESHOLD: float = 0.05
+    PROFILE_DIR: str = os.path.join(BASE_DIR, 'data', 'profiles')
+    PROFILE_MAX_FILES: int = 100
+
+    # --- Metrics ---
+    METRICS_TOKEN: str = ""
+
     model_config = SettingsConfigDict(
-        env_file=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env'),
+        env_file=os.path.join(BASE_DIR, '.env'),
         env_file_encoding='utf-8',
         extra='ignore'
     )
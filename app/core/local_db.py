@@ -0,0 +1,36 @@
+# app/core/local_db.py
+
+import os
+import sqlite3
+from app.core.config import settings
+
+
+def connect_local_db(path: str = None) -> sqlite3.Connection:
+    """
+    Abre la base SQLite local usada para el estado propio del backend
+    (outbox de correos, historiales, etc.) en modo WAL.
+
+    La conexión puede compartirse entre hilos; quien la use debe serializar
+    el acceso con su propio lock.
+    """
+    path = path or settings.LOCAL_DB_PATH
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def ensure_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    """
+    Agrega a una tabla existente las columnas que le falten ({nombre: tipo}).
+    Permite evolucionar el esquema sin borrar la base local.
+    """
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
@@ -0,0 +1,236 @@
+# app/core/logs.py
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.metrics import metrics, LOG_RECORDS_DROPPED, QUEUE_DEPTH
+
+# Identificadores de correlación: la petición HTTP o la ejecución de una
+# tarea programada en curso. Las tareas asyncio heredan el contexto.
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+run_id_var: ContextVar[Optional[str]] = ContextVar("run_id", default=None)
+
+_CONTEXT_VARS = {"request_id": request_id_var, "run_id": run_id_var}
+
+# Atributos propios de un LogRecord; el resto llega por `extra=` y se emite como campo
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: Optional[queue.Queue] = None
+_output: Optional[logging.Handler] = None
+
+
+@contextmanager
+def log_context(**values: Optional[str]):
+    """
+    Asocia `request_id` y/o `run_id` a los logs emitidos dentro del bloque.
+    """
+    tokens = [(_CONTEXT_VARS[name], _CONTEXT_VARS[name].set(value)) for name, value in values.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Un objeto JSON por línea con la hora, el nivel, el logger, el mensaje,
+    los identificadores de correlación y los campos pasados con `extra=`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formato legible para desarrollo; los campos extra se agregan al final
+    como `clave=valor`.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in record.__dict__.items() if key not in _RESERVED and value is not None)
+        return f"{text} [{fields}]" if fields else text
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copia los identificadores de correlación al registro. Corre en el hilo
+    que emite el log, que es donde están las variables de contexto.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.run_id = run_id_var.get()
+        return True
+
+
+class LogSampler(logging.Filter):
+    """
+    Muestreo y límite de frecuencia por logger de los registros por debajo
+    de WARNING (los avisos y errores siempre pasan):
+
+    - `sample_rates` asocia un nombre de logger, o el prefijo de varios
+      ('app.services'), a la fracción de registros que se conserva.
+    - Cada logger tiene un token bucket de `rate_limit` registros por
+      segundo con ráfagas de hasta `burst`. El primer registro que pasa tras
+      un descarte lleva en `suppressed` cuántos se omitieron.
+
+    Así una tarea que procesa miles de alumnos no genera miles de escrituras.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limit: float, burst: int):
+        super().__init__()
+        self.sample_rates = dict(sample_rates)
+        self.rate_limit = rate_limit
+        self.burst = max(1, burst)
+        self._rates: Dict[str, float] = {}
+        self._buckets: Dict[str, list] = {} # logger -> [tokens, última recarga, descartados]
+        self._lock = threading.Lock()
+
+    def _sample_rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            matches = [prefix for prefix in self.sample_rates if name == prefix or name.startswith(prefix + ".")]
+            rate = self.sample_rates[max(matches, key=len)] if matches else 1.0
+            self._rates[name] = rate
+        return rate
+
+    def _take(self, name: str) -> Optional[int]:
+        """
+        Consume un token del logger. Devuelve los registros descartados desde
+        el último que pasó, o None si no quedan tokens.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                bucket = self._buckets[name] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_limit)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return None
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+            return suppressed
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._sample_rate(record.name)
+        if rate < 1 and random.random() >= rate:
+            LOG_RECORDS_DROPPED.labels(record.name, "sampled").inc()
+            return False
+        if self.rate_limit > 0:
+            suppressed = self._take(record.name)
+            if suppressed is None:
+                LOG_RECORDS_DROPPED.labels(record.name, "rate_limited").inc()
+                return False
+            if suppressed:
+                record.suppressed = suppressed
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el registro sin formatearlo: el listener corre en el mismo
+    proceso, así que el mensaje (`msg % args`) y las trazas se formatean en
+    su hilo y no en el event loop. Si la cola está llena el registro se
+    descarta en lugar de bloquear.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(record.name, "queue_full").inc()
+
+
+def configure_logging(level: str = settings.LOG_LEVEL, format: str = settings.LOG_FORMAT, stream=None):
+    """
+    Configura el logger raíz una sola vez: los registros pasan por los
+    filtros de contexto y muestreo en el hilo que los emite, y un
+    `QueueListener` los escribe en `stream` (stderr) desde su propio hilo.
+    Reemplaza los handlers que hubiera instalado `logging.basicConfig`.
+    """
+    global _listener, _queue, _output
+    if _listener is not None:
+        return
+    _output = logging.StreamHandler(stream or sys.stderr)
+    _output.setFormatter(JsonFormatter() if format == "json" else TextFormatter())
+
+    _queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    handler = _QueueHandler(_queue)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(LogSampler(settings.LOG_SAMPLE_RATES, settings.LOG_RATE_LIMIT, settings.LOG_RATE_BURST))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(_queue, _output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Escribe los registros pendientes y detiene el listener. Los logs
+    posteriores (p. ej. los del servidor al terminar) se escriben
+    directamente, sin cola.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        if isinstance(existing, _QueueHandler):
+            root.removeHandler(existing)
+            for log_filter in existing.filters:
+                _output.addFilter(log_filter)
+    root.addHandler(_output)
+
+
+def _collect_log_queue():
+    if _queue is not None:
+        QUEUE_DEPTH.labels("log_records").set(_queue.qsize())
+
+
+metrics.add_collector(_collect_log_queue)
@@ -0,0 +1,262 @@
+# app/core/metrics.py
+
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Buckets por defecto (segundos), los mismos que usa el cliente oficial de Prometheus.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """
+    Base de las métricas. Los hijos por combinación de etiquetas se crean una
+    vez y se guardan en un dict, de modo que `labels(...)` es una búsqueda.
+
+    Las actualizaciones no toman locks: casi todas ocurren en el hilo del
+    event loop, y un incremento concurrente desde un hilo del pool puede, en
+    el peor caso, perderse, lo que es aceptable para métricas.
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+        return child
+
+    def _samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].value += amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", _format_labels(self.labelnames, values), child.value
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].value = value
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].value -= amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "", _format_labels(self.labelnames, values), child.value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # El último es +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """
+    Histograma con buckets fijos. Cada observación incrementa un solo bucket;
+    los acumulados que exige el formato de Prometheus se calculan al exportar.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), list(child.counts)):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"'), cumulative
+            yield "_sum", _format_labels(self.labelnames, values), child.sum
+            yield "_count", _format_labels(self.labelnames, values), cumulative
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso. Los `collectors` son funciones que se
+    ejecutan solo al exportar (p. ej. para leer el tamaño de una cola) y no
+    en cada request.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Optional[Iterable[float]] = None) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), e)
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# --- Métricas de la aplicación ---
+
+HTTP_REQUESTS = metrics.counter("http_requests", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = metrics.histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+
+EMAILS_SENT = metrics.counter("email_send", "Emails handed to the SMTP server, by outcome.", ("outcome",))
+EMAIL_SEND_DURATION = metrics.histogram("email_send_duration_seconds", "Time to build and send one email over SMTP.", ("outcome",))
+EMAIL_RECIPIENTS = metrics.counter("email_recipients", "Recipients of the emails accepted by the SMTP server.")
+EMAIL_SUPPRESSED = metrics.counter("email_suppressed_recipients", "Recipients dropped before sending because they are on the suppression list.")
+EMAIL_SUPPRESSIONS_ADDED = metrics.counter("email_suppressions_added", "Addresses added to the suppression list, by source (bounce or manual).", ("source",))
+REPORT_ROWS = metrics.counter("report_rows", "Rows streamed by the student reports, by report and format.", ("report", "format"))
+
+FIRESTORE_READS = metrics.counter("firestore_reads", "Firestore documents read.", ("operation",))
+FIRESTORE_WRITES = metrics.counter("firestore_writes", "Firestore documents written.", ("operation",))
+AUTH_RPCS = metrics.counter("firebase_auth_rpcs", "Firebase Auth Admin SDK calls.", ("method", "outcome"))
+AUTH_RPC_DURATION = metrics.histogram("firebase_auth_rpc_duration_seconds", "Firebase Auth Admin SDK call latency.", ("method",))
+AUTH_CACHE = metrics.counter("auth_cache_lookups", "ID token and role cache lookups.", ("cache", "result"))
+
+CRON_RUNS = metrics.counter("cron_job_runs", "Scheduled job runs, by final status.", ("job", "status"))
+CRON_DURATION = metrics.gauge("cron_job_last_duration_seconds", "Duration of the last run of each job.", ("job",))
+CRON_THROUGHPUT = metrics.gauge("cron_job_last_throughput", "Students processed per second in the last run of each job.", ("job",))
+CRON_ITEMS = metrics.gauge("cron_job_last_items", "Students processed in the last run of each job, by outcome.", ("job", "outcome"))
+CRON_LAST_RUN = metrics.gauge("cron_job_last_run_timestamp_seconds", "Unix time at which the last run of each job finished.", ("job",))
+
+STUDENT_INDEX_SIZE = metrics.gauge("student_index_students", "Students held by the in-memory student index.")
+STUDENT_INDEX_STALENESS = metrics.gauge("student_index_last_event_age_seconds", "Seconds since the student index received its last snapshot (-1 if never).")
+
+IDEMPOTENCY_REQUESTS = metrics.counter("idempotency_requests", "Requests carrying an Idempotency-Key, by outcome.", ("outcome",))
+SEND_LEDGER_CHECKS = metrics.counter("send_ledger_checks", "Cron emails checked against the send ledger, by result.", ("template", "result"))
+
+STARTUP_PHASE_SECONDS = metrics.gauge("startup_phase_seconds", "Duration of each startup phase (imports, Firebase initialization, warm-up).", ("phase",))
+
+SMTP_DAILY_RECIPIENTS = metrics.gauge("smtp_daily_recipients", "Recipients sent to today, counted against each SMTP account's daily budget.", ("backend",))
+SMTP_DAILY_BUDGET_REMAINING = metrics.gauge("smtp_daily_budget_remaining", "Recipients left in today's budget of each SMTP account (-1 if unlimited).", ("backend",))
+SMTP_CONCURRENCY_LIMIT = metrics.gauge("smtp_concurrency_limit", "Concurrent sends currently allowed by each SMTP account's adaptive governor.", ("backend",))
+SMTP_DEFERRED = metrics.counter("smtp_deferred", "Sends deferred by the SMTP governor, by account and reason.", ("backend", "reason"))
+SMTP_BACKEND_SENDS = metrics.counter("smtp_backend_sends", "Send attempts per SMTP account, by outcome.", ("backend", "outcome"))
+SMTP_BACKEND_UP = metrics.gauge("smtp_backend_up", "Whether each SMTP account is currently accepting sends (1) or cooling down after a failure (0).", ("backend",))
+SMTP_FAILOVERS = metrics.counter("smtp_failovers", "Sends retried on another SMTP account after a connection or authentication failure.")
+
+QUEUE_DEPTH = metrics.gauge("background_queue_depth", "Items waiting in a background queue.", ("queue",))
+
+PROFILES_RECORDED = metrics.counter("profiles_recorded", "Sampled profiles saved, by kind (request, job) and trigger.", ("kind", "trigger"))
+EVENT_LOOP_LAG = metrics.histogram("event_loop_lag_seconds", "Event loop scheduling lag measured while a profile is running.", buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+LOG_RECORDS_DROPPED = metrics.counter("log_records_dropped", "Log records discarded before being written, by logger and reason (sampled, rate_limited, queue_full).", ("logger", "reason"))
@@ -0,0 +1,265 @@
+# app/core/profiling.py
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+from app.core.config import settings
+from app.core.logs import request_id_var, run_id_var
+from app.core.metrics import EVENT_LOOP_LAG, PROFILES_RECORDED
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se despierta el monitor de lag del event loop
+LOOP_LAG_INTERVAL = 0.01
+
+# Pilas que más tiempo bloquearon el event loop incluidas en el resumen
+TOP_BLOCKING_STACKS = 20
+
+# Un administrador pidió perfilar la petición en curso; lo heredan las
+# tareas que lance (p. ej. la ejecución de un cron disparada por HTTP)
+profile_requested_var: ContextVar[bool] = ContextVar("profile_requested", default=False)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    name = getattr(code, "co_qualname", code.co_name)
+    # ';' separa los marcos en el formato de pilas colapsadas
+    return f"{name} ({'/'.join(path[-2:])}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _collapse(thread_name: str, frame) -> str:
+    frames = []
+    while frame is not None:
+        frames.append(_frame_name(frame))
+        frame = frame.f_back
+    frames.append(thread_name.replace(";", ":"))
+    return ";".join(reversed(frames))
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class ProfileSession:
+    """
+    Perfil de una petición o de una ejecución de tarea programada.
+
+    Un hilo toma cada `interval` segundos la pila de todos los hilos del
+    proceso (el del event loop y los del pool donde corren las llamadas a
+    Firebase) y cuenta las pilas colapsadas, el formato de `flamegraph.pl`
+    y speedscope. Es un perfil de tiempo real del proceso entero: incluye
+    lo que hicieron otras peticiones concurrentes en la misma ventana.
+
+    En paralelo, una tarea del event loop mide su lag (cuánto tarda en
+    volver a ejecutarse tras dormir `LOOP_LAG_INTERVAL`). Mientras el loop
+    lleva más de `lag_threshold` segundos sin responder, las pilas de su
+    hilo se cuentan además como bloqueantes: son las llamadas síncronas que
+    lo están frenando.
+    """
+
+    def __init__(self, kind: str, name: str, trigger: str, interval: float, lag_threshold: float):
+        self.id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{kind}-{uuid.uuid4().hex[:8]}"
+        self.kind = kind
+        self.name = name
+        self.trigger = trigger
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.request_id = request_id_var.get()
+        self.run_id = run_id_var.get()
+        self.stacks: Counter = Counter()
+        self.blocking: Counter = Counter()
+        self.lags: List[float] = []
+        self.samples = 0
+        self._beat = time.perf_counter()
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._started = 0.0
+        self.duration = 0.0
+
+    # --- Muestreo ---
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            blocked = time.perf_counter() - self._beat > LOOP_LAG_INTERVAL + self.lag_threshold
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = _collapse(names.get(thread_id, f"thread-{thread_id}"), frame)
+                self.stacks[stack] += 1
+                if blocked and thread_id == self._loop_thread:
+                    self.blocking[stack] += 1
+            self.samples += 1
+
+    async def _watch_loop(self):
+        while True:
+            self._beat = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, time.perf_counter() - self._beat - LOOP_LAG_INTERVAL)
+            self.lags.append(lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._monitor = asyncio.create_task(self._watch_loop())
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self.duration = time.perf_counter() - self._started
+        self._stop.set()
+        self._monitor.cancel()
+        try:
+            await self._monitor
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join)
+
+    # --- Resultado ---
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict:
+        lags = sorted(self.lags)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "trigger": self.trigger,
+            "request_id": self.request_id,
+            "run_id": self.run_id,
+            "duration_seconds": round(self.duration, 4),
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+            "loop_lag": {
+                "measurements": len(lags),
+                "p50_ms": round(_percentile(lags, 50) * 1000, 2),
+                "p95_ms": round(_percentile(lags, 95) * 1000, 2),
+                "max_ms": round(lags[-1] * 1000, 2) if lags else 0.0,
+                "blocked_seconds": round(sum(lag for lag in lags if lag > self.lag_threshold), 4),
+            },
+            "blocking_stacks": [{"stack": stack, "samples": count} for stack, count in self.blocking.most_common(TOP_BLOCKING_STACKS)],
+        }
+
+
+class Profiler:
+    """
+    Perfilado bajo demanda. Una petición o una ejecución de tarea se
+    perfila si un administrador lo pidió (cabecera `X-Profile` o
+    `?profile=1`) o, al azar, con probabilidad `sample_rate`. Solo hay un
+    perfil a la vez: el muestreo cubre todo el proceso y dos perfiles
+    simultáneos se pisarían; mientras uno está activo, los demás se omiten.
+
+    Cada perfil se guarda en `directory` como `<id>.collapsed` (pilas
+    colapsadas, para generar el flame graph) y `<id>.json` (duración, lag
+    del event loop y pilas bloqueantes). Se conservan los `max_files`
+    perfiles más recientes.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.PROFILE_DIR,
+        sample_rate: float = settings.PROFILE_SAMPLE_RATE,
+        interval: float = settings.PROFILE_INTERVAL,
+        lag_threshold: float = settings.PROFILE_LOOP_LAG_THRESHOLD,
+        max_files: int = settings.PROFILE_MAX_FILES,
+    ):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.max_files = max_files
+        self._active: Optional[ProfileSession] = None
+
+    def trigger(self) -> Optional[str]:
+        """
+        Por qué perfilar lo que empieza ahora ('requested' o 'sampled'), o None.
+        """
+        if profile_requested_var.get():
+            return "requested"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def _save(self, session: ProfileSession):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, session.id)
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(session.collapsed())
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(session.summary(), f, ensure_ascii=False, indent=2)
+
+        summaries = sorted(
+            (name for name in os.listdir(self.directory) if name.endswith(".json")),
+            key=lambda name: os.path.getmtime(os.path.join(self.directory, name)),
+        )
+        for name in summaries[:max(0, len(summaries) - self.max_files)]:
+            for suffix in (".json", ".collapsed"):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len(".json")] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    @asynccontextmanager
+    async def session(self, kind: str, name: str, trigger: str) -> AsyncIterator[Optional[ProfileSession]]:
+        """
+        Perfila el bloque. Produce la sesión, o None si ya había otro perfil
+        activo (el bloque se ejecuta igual, sin perfilar).
+        """
+        if self._active is not None:
+            logger.info("Profile of %s '%s' skipped: another profile is running.", kind, name)
+            yield None
+            return
+        session = self._active = ProfileSession(kind, name, trigger, self.interval, self.lag_threshold)
+        session.start()
+        try:
+            yield session
+        finally:
+            try:
+                await session.stop()
+                await asyncio.to_thread(self._save, session)
+                PROFILES_RECORDED.labels(kind, trigger).inc()
+                summary = session.summary()
+                logger.info(
+                    "Profile %s saved: %d samples in %.2fs, max loop lag %.1f ms.",
+                    session.id, session.samples, session.duration, summary["loop_lag"]["max_ms"],
+                    extra={"profile_id": session.id, "profile_kind": kind, "profile_name": name},
+                )
+            except Exception as e:
+                logger.error("Failed to save profile %s: %s", session.id, e)
+            finally:
+                self._active = None
+
+    @asynccontextmanager
+    async def maybe_profile(self, kind: str, name: str) -> AsyncIterator[Optional[ProfileSession]]:
+        """
+        Perfila el bloque si se pidió o si toca por muestreo.
+        """
+        trigger = self.trigger()
+        if trigger is None:
+            yield None
+            return
+        async with self.session(kind, name, trigger) as session:
+            yield session
+
+
+profiler = Profiler()
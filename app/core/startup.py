@@ -0,0 +1,80 @@
+# app/core/startup.py
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from app.core.metrics import metrics, STARTUP_PHASE_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> Optional[float]:
+    """
+    Segundos desde que arrancó el proceso, según /proc (solo Linux).
+    Incluye el arranque del intérprete y de uvicorn, anteriores a la aplicación.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 3)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """
+    Registra cuánto cuesta cada fase del arranque (imports, inicialización
+    de Firebase, lifespan, warm-up) y cuándo la aplicación empezó a atender
+    y quedó caliente. Las fases pueden anidarse; `offset_seconds` se mide
+    desde que se importó este módulo, que `app.main` importa primero.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.process_age_at_import = _process_age()
+        self.phases: List[dict] = []
+        self.events: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.phases.append({
+                "phase": name,
+                "offset_seconds": round(started - self.started, 4),
+                "seconds": round(seconds, 4),
+            })
+            logger.debug("Startup phase '%s' took %.1f ms", name, seconds * 1000)
+
+    def mark(self, event: str):
+        """
+        Registra un hito ('serving', 'warm') la primera vez que ocurre.
+        """
+        if event not in self.events:
+            self.events[event] = round(time.perf_counter() - self.started, 4)
+            logger.info("Startup: '%s' reached %.3fs after import.", event, self.events[event])
+
+    def report(self) -> dict:
+        return {
+            "process_age_at_import_seconds": self.process_age_at_import,
+            "events": dict(self.events),
+            "phases": list(self.phases),
+        }
+
+
+startup_timer = StartupTimer()
+
+
+def _collect_startup_phases():
+    for phase in list(startup_timer.phases):
+        STARTUP_PHASE_SECONDS.labels(phase["phase"]).set(phase["seconds"])
+
+
+metrics.add_collector(_collect_startup_phases)
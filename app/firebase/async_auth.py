@@ -0,0 +1,72 @@
+# app/firebase/async_auth.py
+
+import asyncio
+import functools
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from app.core.metrics import AUTH_RPCS, AUTH_RPC_DURATION
+
+
+class AsyncAuth:
+    """
+    Fachada asíncrona sobre el Auth Admin SDK, que solo ofrece llamadas
+    bloqueantes. Cada llamada se ejecuta en un pool de hilos dedicado y de
+    tamaño fijo, de modo que el event loop sigue atendiendo otros requests y
+    el tráfico de Auth no compite con el executor por defecto.
+
+    Las excepciones del SDK (p. ej. `auth.UserNotFoundError`) se propagan tal cual.
+
+    El módulo `firebase_admin.auth` se importa, y `initialize` (que inicializa
+    la app de Firebase) se llama, en el hilo del pool antes de la primera
+    llamada, nunca en el event loop.
+    """
+
+    def __init__(self, max_workers: int, initialize: Optional[Callable[[], object]] = None):
+        self.max_workers = max_workers
+        self._initialize = initialize
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firebase-auth")
+
+    def _call(self, method: str, args, kwargs):
+        if self._initialize is not None:
+            self._initialize()
+        auth = importlib.import_module("firebase_admin.auth")
+        return getattr(auth, method)(*args, **kwargs)
+
+    async def _run(self, method: str, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self._executor, functools.partial(self._call, method, args, kwargs))
+        except Exception:
+            AUTH_RPCS.labels(method, "error").inc()
+            raise
+        finally:
+            AUTH_RPC_DURATION.labels(method).observe(time.perf_counter() - started)
+        AUTH_RPCS.labels(method, "ok").inc()
+        return result
+
+    async def verify_id_token(self, id_token: str, check_revoked: bool = False):
+        return await self._run("verify_id_token", id_token, check_revoked=check_revoked)
+
+    async def get_user(self, uid: str):
+        return await self._run("get_user", uid)
+
+    async def get_user_by_email(self, email: str):
+        return await self._run("get_user_by_email", email)
+
+    async def get_users(self, identifiers: list):
+        return await self._run("get_users", identifiers)
+
+    async def update_user(self, uid: str, **kwargs):
+        return await self._run("update_user", uid, **kwargs)
+
+    async def delete_user(self, uid: str):
+        return await self._run("delete_user", uid)
+
+    async def delete_users(self, uids: list):
+        return await self._run("delete_users", uids)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,31 +1,138 @@
 # app/firebase/firebase_admin.py
 
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+import asyncio
+import importlib
+import threading
+from typing import Callable, Dict
 from app.core.config import settings
+from app.core.startup import startup_timer
+from app.firebase.async_auth import AsyncAuth
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    # Initialize Firebase Admin SDK
-    cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_KEY_PATH)
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': settings.FIREBASE_DATABASE_URL
-    })
-
-    # Get Firestore client and Auth service
-    db = firestore.client()
-    auth_service = auth
-
-    logger.info("Firebase Admin SDK initialized successfully.")
-
-except Exception as e:
-    logger.error(f"Failed to initialize Firebase Admin SDK: {e}")
-    # In a real application, you might want to handle this more gracefully,
-    # but for now, we'll allow the app to fail on startup if Firebase isn't configured.
-    db = None
-    auth_service = None
-    raise
\ No newline at end of file
+# El SDK de Firebase arrastra google.cloud, grpc y google.auth, que dominan
+# el arranque en frío. Nada de eso se importa ni se inicializa al importar
+# este módulo: los clientes se crean en su primer uso (o en el warm-up).
+
+
+class LazyModule:
+    """
+    Módulo que se importa en el primer acceso a uno de sus atributos,
+    p. ej. `auth.UserNotFoundError` en un `except`.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with startup_timer.phase(f"import {self._name}"):
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+
+class LazyClient:
+    """
+    Proxy de un cliente del SDK que se construye en su primer uso. Todo
+    acceso a un atributo se delega en el cliente real.
+    """
+
+    def __init__(self, factory: Callable[[], object]):
+        self._factory = factory
+
+    def __getattr__(self, attr: str):
+        return getattr(self._factory(), attr)
+
+
+auth = LazyModule("firebase_admin.auth")
+firestore = LazyModule("firebase_admin.firestore")
+firestore_async = LazyModule("firebase_admin.firestore_async")
+
+_lock = threading.RLock()
+_app = None
+_clients: Dict[str, object] = {}
+_warm = False
+
+
+def initialize_firebase():
+    """
+    Inicializa el Firebase Admin SDK una sola vez (seguro entre hilos).
+    """
+    global _app
+    if _app is not None:
+        return _app
+    with _lock:
+        if _app is None:
+            try:
+                with startup_timer.phase("import firebase_admin"):
+                    import firebase_admin
+                    from firebase_admin import credentials
+                with startup_timer.phase("firebase initialize_app"):
+                    cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_KEY_PATH)
+                    _app = firebase_admin.initialize_app(cred, {
+                        'databaseURL': settings.FIREBASE_DATABASE_URL
+                    })
+                logger.info("Firebase Admin SDK initialized successfully.")
+            except Exception as e:
+                logger.error("Failed to initialize Firebase Admin SDK: %s", e)
+                raise
+    return _app
+
+
+def _client(name: str, build: Callable[[], object]):
+    client = _clients.get(name)
+    if client is None:
+        initialize_firebase()
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                with startup_timer.phase(f"{name} client"):
+                    client = _clients[name] = build()
+    return client
+
+
+def get_firestore():
+    return _client("firestore", lambda: firestore.client())
+
+
+def get_async_firestore():
+    return _client("firestore_async", lambda: firestore_async.client())
+
+
+def warm_up_firebase():
+    """
+    Inicializa el SDK, los dos clientes de Firestore y el módulo de Auth.
+    Es bloqueante: se ejecuta en un hilo (warm-up o `ensure_firebase`).
+    """
+    global _warm
+    if _warm:
+        return
+    get_firestore()
+    get_async_firestore()
+    auth._load()
+    _warm = True
+
+
+def firebase_status() -> dict:
+    return {"initialized": _app is not None, "clients": sorted(_clients), "warm": _warm}
+
+
+async def ensure_firebase():
+    """
+    Dependencia de FastAPI para los endpoints que usan Firebase: si aún no
+    está inicializado, lo hace en un hilo en lugar de bloquear el event loop.
+    """
+    if not _warm:
+        await asyncio.to_thread(warm_up_firebase)
+
+
+# Clientes compartidos (se crean en su primer uso)
+db = LazyClient(get_firestore)
+async_db = LazyClient(get_async_firestore)
+auth_service = auth
+async_auth = AsyncAuth(max_workers=settings.AUTH_THREAD_POOL_SIZE, initialize=initialize_firebase)
@@ -1,71 +1,110 @@
 # app/main.py
 
-from fastapi.middleware.cors import CORSMiddleware
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from fastapi import FastAPI, Request
-from fastapi.responses import Response
-from contextlib import asynccontextmanager
-import requests
+# Primero, para que el reporte de arranque mida el resto de los imports
+from app.core.startup import startup_timer
+
+import asyncio
+import hmac
 import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+with startup_timer.phase("import fastapi"):
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import Response, PlainTextResponse, JSONResponse
+with startup_timer.phase("import apscheduler"):
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from app.routers import emails, cron, users 
-from app.core.config import settings
+# Antes que el resto de la aplicación, para que sus logs ya pasen por la cola
+from app.core.logs import configure_logging, log_context
+configure_logging()
+
+with startup_timer.phase("import app"):
+    from app.routers import emails, cron, users, reports
+    from app.core.config import settings
+    from app.core.metrics import metrics, HTTP_REQUESTS, HTTP_REQUEST_DURATION
+    from app.services.email_service import email_service
+    from app.services.email_outbox import email_outbox
+    from app.firebase.firebase_admin import async_auth, ensure_firebase, firebase_status, warm_up_firebase
+    from app.core.profiling import profile_requested_var, profiler
+    from app.utils.security import get_current_admin_user, verified_uid
+    from app.services.job_runner import job_runner
+    from app.services.cluster import cluster_coordinator
+    from app.services.student_index import student_index
+    from app.services.idempotency import MAX_KEY_LENGTH, IdempotencyStore, StoredResponse, idempotency_store, request_scope
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Scheduler Setup ---
 scheduler = AsyncIOScheduler(timezone="America/Lima")
 
-def run_deactivation_job():
-    """Función para llamar al endpoint de desactivación."""
-    url = "http://localhost:8000/cron/deactivate-overdue-users"
-    try:
-        response = requests.post(url)
-        logger.info(f"Deactivation job triggered. Status: {response.status_code}, Response: {response.json()}")
-    except requests.RequestException as e:
-        logger.error(f"Error triggering deactivation job: {e}")
-
-def run_reminder_job():
-    """Función para llamar al endpoint de recordatorios."""
-    url = "http://localhost:8000/cron/send-payment-reminders"
-    try:
-        response = requests.post(url)
-        logger.info(f"Reminder job triggered. Status: {response.status_code}, Response: {response.json()}")
-    except requests.RequestException as e:
-        logger.error(f"Error triggering reminder job: {e}")
+# --- Warm-up ---
+_warmup_task: Optional[asyncio.Task] = None
+
+async def _warm_up():
+    with startup_timer.phase("warm-up"):
+        await asyncio.to_thread(warm_up_firebase)
+        if settings.STUDENT_INDEX_ENABLED:
+            with startup_timer.phase("student index load"):
+                await student_index.start()
+    startup_timer.mark("warm")
+
+def start_warmup() -> asyncio.Task:
+    """
+    Inicializa Firebase (en un hilo) y carga el índice de alumnos si está
+    habilitado. Es idempotente: las llamadas concurrentes comparten la misma
+    tarea, y si falló se reintenta en la siguiente llamada.
+    """
+    global _warmup_task
+    if _warmup_task is None or (_warmup_task.done() and (_warmup_task.cancelled() or _warmup_task.exception())):
+        _warmup_task = asyncio.create_task(_warm_up())
+        _warmup_task.add_done_callback(_log_warmup_failure)
+    return _warmup_task
+
+def _log_warmup_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error("Warm-up failed: %s", task.exception())
 
 # --- FastAPI Lifespan Events ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Gestiona el ciclo de vida de la aplicación.
-    Inicia el planificador al arrancar y lo detiene al apagar.
+    Inicia el planificador, el pool SMTP y los workers del outbox al arrancar
+    y los detiene al apagar.
+
+    Firebase no se toca aquí: el warm-up corre en segundo plano mientras la
+    aplicación ya atiende (`/` y `/health` responden sin Firebase), salvo con
+    `STARTUP_BLOCKING_WARMUP`, que lo espera antes de atender.
     """
     logger.info("Starting up application...")
-    # Añadir tareas programadas
-    scheduler.add_job(
-        run_deactivation_job,
-        CronTrigger(day=3, hour=2, minute=0), # Cada día 3 del mes a las 2:00 AM
-        id="deactivate_users_job",
-        name="Deactivate Overdue Users",
-        replace_existing=True
-    )
-    scheduler.add_job(
-        run_reminder_job,
-        CronTrigger(day=30, hour=10, minute=0), # Cada día 30 del mes a las 10:00 AM
-        id="send_reminders_job",
-        name="Send Payment Reminders",
-        replace_existing=True
-    )
-    scheduler.start()
-    logger.info("Scheduler started.")
+    with startup_timer.phase("lifespan startup"):
+        await email_service.start()
+        await email_outbox.start()
+        await cluster_coordinator.start()
+        # Añadir tareas programadas (se ejecutan dentro del proceso, sin HTTP)
+        job_runner.schedule(scheduler)
+        scheduler.start()
+        logger.info("Scheduler started.")
+    if settings.STARTUP_BLOCKING_WARMUP:
+        await start_warmup()
+    else:
+        start_warmup()
+    startup_timer.mark("serving")
     yield
     logger.info("Shutting down application...")
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
     scheduler.shutdown()
     logger.info("Scheduler shut down.")
+    await cluster_coordinator.close()
+    await student_index.close()
+    await email_outbox.close()
+    await email_service.close()
+    async_auth.shutdown()
 
 
 # --- FastAPI App Initialization ---
@@ -89,6 +128,7 @@ app.add_middleware(
 app.include_router(emails.router)
 app.include_router(cron.router)
 app.include_router(users.router)
+app.include_router(reports.router)
 
 @app.middleware("http")
 async def handle_head_requests(request: Request, call_next):
@@ -102,7 +142,182 @@ async def handle_head_requests(request: Request, call_next):
         return response
     return await call_next(request)
 
-@app.get("/", tags=["Root"])
+IDEMPOTENT_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+IDEMPOTENCY_PREFIXES = tuple(prefix.strip() for prefix in settings.IDEMPOTENCY_PATH_PREFIXES.split(",") if prefix.strip())
+
+@app.middleware("http")
+async def handle_idempotency_key(request: Request, call_next):
+    """
+    Si una petición trae la cabecera `Idempotency-Key`, sus repeticiones
+    (reintentos, doble clic) reciben la respuesta guardada de la primera en
+    lugar de volver a ejecutarse. Las respuestas 5xx no se guardan, para que
+    el cliente pueda reintentar con la misma clave. Las claves son por
+    usuario (el UID del token), así que un reintento con el token renovado
+    también se reconoce.
+    """
+    key = request.headers.get("idempotency-key")
+    if not key or request.method not in IDEMPOTENT_METHODS or not request.url.path.startswith(IDEMPOTENCY_PREFIXES):
+        return await call_next(request)
+    if len(key) > MAX_KEY_LENGTH:
+        return JSONResponse(status_code=400, content={"detail": f"La Idempotency-Key no puede superar {MAX_KEY_LENGTH} caracteres."})
+
+    # Con clave, el cuerpo se lee completo para compararlo con el de la primera petición
+    # (también en /emails/batch con NDJSON). Starlette lo conserva para el endpoint.
+    body = await request.body()
+    authorization = request.headers.get("authorization")
+    scope = request_scope(authorization, uid=await verified_uid(authorization))
+    fingerprint = IdempotencyStore.fingerprint(request.method, request.url.path + "?" + request.url.query, body)
+    # Las transacciones SQLite pueden esperar al lock de otro proceso: fuera del event loop
+    claim = await asyncio.to_thread(idempotency_store.claim, scope, key, fingerprint)
+    if claim.outcome == "replay":
+        stored = claim.response
+        return Response(content=stored.body, status_code=stored.status_code, media_type=stored.media_type, headers={"Idempotent-Replayed": "true"})
+    if claim.outcome == "in_progress":
+        return JSONResponse(status_code=409, content={"detail": "Una petición con esta Idempotency-Key aún se está procesando."})
+    if claim.outcome == "mismatch":
+        return JSONResponse(status_code=422, content={"detail": "Esta Idempotency-Key ya se usó con una petición distinta."})
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        await asyncio.to_thread(idempotency_store.release, scope, key)
+        raise
+    if response.status_code >= 500:
+        await asyncio.to_thread(idempotency_store.release, scope, key)
+        return response
+    content = b"".join([chunk async for chunk in response.body_iterator])
+    await asyncio.to_thread(idempotency_store.complete, scope, key, StoredResponse(response.status_code, response.headers.get("content-type"), content))
+    return Response(content=content, status_code=response.status_code, headers=dict(response.headers))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Se etiqueta por la plantilla de la ruta ('/users/{uid}'), no por la URL, para acotar las series.
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.labels(request.method, path, str(status_code)).inc()
+        HTTP_REQUEST_DURATION.labels(request.method, path).observe(time.perf_counter() - started)
+
+PROFILE_HEADER = "X-Profile"
+
+async def _profile_requested(request: Request) -> bool:
+    """
+    Si la petición pide perfilarse (`X-Profile: 1` o `?profile=1`) y viene
+    de un administrador. Sin un token válido, o si no se puede verificar
+    (p. ej. Firebase no inicializa), el flag se ignora y la petición sigue.
+    """
+    flag = request.headers.get(PROFILE_HEADER) or request.query_params.get("profile")
+    if flag not in ("1", "true"):
+        return False
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        await ensure_firebase()
+        await get_current_admin_user(token)
+    except HTTPException:
+        return False
+    except Exception as e:
+        logger.warning("Ignoring profile flag: admin check failed: %s", e)
+        return False
+    return True
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    Perfila la petición si un administrador lo pide o si toca por
+    `PROFILE_SAMPLE_RATE`, y devuelve el id del perfil en `X-Profile-Id`.
+    Una tarea programada que la petición dispare también se perfila.
+    El perfil termina al empezar la respuesta (no cubre un cuerpo en streaming).
+    """
+    reset = profile_requested_var.set(True) if await _profile_requested(request) else None
+    try:
+        async with profiler.maybe_profile("request", f"{request.method} {request.url.path}") as session:
+            response = await call_next(request)
+    finally:
+        if reset is not None:
+            profile_requested_var.reset(reset)
+    if session is not None:
+        response.headers["X-Profile-Id"] = session.id
+    return response
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """
+    Correlaciona los logs de una petición: usa el `X-Request-ID` del cliente
+    (o del proxy) si lo trae, o genera uno, y lo devuelve en la respuesta.
+    Se registra al final para envolver a los demás middlewares.
+    """
+    request_id = request.headers.get(REQUEST_ID_HEADER)
+    if not request_id or len(request_id) > 128:
+        request_id = uuid.uuid4().hex
+    with log_context(request_id=request_id):
+        response = await call_next(request)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+@app.get("/metrics", tags=["Root"], include_in_schema=False)
+def read_metrics(request: Request):
+    """
+    Métricas del proceso en el formato de texto de Prometheus.
+    Con varios workers, cada uno expone las suyas.
+
+    Las métricas describen el tráfico y las tareas internas: con
+    `METRICS_TOKEN` se exige `Authorization: Bearer <token>` (el
+    `bearer_token` de Prometheus); sin él, el endpoint solo debe ser
+    accesible desde la red interna, no a través del proxy público.
+    """
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            return JSONResponse(status_code=401, content={"detail": "Token de métricas inválido."}, headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.api_route("/health", methods=["GET", "HEAD"], tags=["Root"])
+def read_health():
+    """
+    Verificación de salud que no toca Firebase: indica si ya está
+    inicializado y si el warm-up terminó. Si el listener del índice de
+    alumnos falló, el estado es 'degraded' (las consultas van a Firestore
+    mientras se reabre).
+    """
+    health = {"status": "ok", "firebase": firebase_status(), "warm": "warm" in startup_timer.events}
+    if settings.STUDENT_INDEX_ENABLED:
+        health["student_index"] = student_index.health()
+        if student_index.failed:
+            health["status"] = "degraded"
+    return health
+
+@app.get("/health/startup", tags=["Root"])
+def read_startup_report():
+    """
+    Desglose del arranque: duración de cada fase (imports, inicialización de
+    Firebase, lifespan, warm-up) e hitos 'serving' y 'warm'.
+    """
+    return startup_timer.report()
+
+@app.post("/warmup", tags=["Root"])
+async def warm_up():
+    """
+    Hook de warm-up: espera a que Firebase y el índice de alumnos estén
+    listos (lanzándolo si hace falta) y devuelve el reporte de arranque.
+    Pensado para el ping que despierta al host.
+    """
+    try:
+        await asyncio.shield(start_warmup())
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"detail": f"Warm-up failed: {e}", **startup_timer.report()})
+    return startup_timer.report()
+
+@app.api_route("/", methods=["GET", "HEAD"], tags=["Root"])
 def read_root():
     """
     Endpoint raíz para verificar que el backend está funcionando.
@@ -1,15 +1,15 @@
 # app/routers/cron.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.services.cron_service import DEACTIVATION_JOB_ID, REMINDER_JOB_ID
+from app.services.job_runner import JobRunner, JobAlreadyRunningError, job_runner
 from app.services.user_service import UserService, user_service
-from app.services.email_service import EmailService, email_service
-from app.schemas.email import PaymentReminderEmail
-from app.schemas.user import Guardian
+from app.schemas.policy import PolicyPreviewRequest, PolicyPreviewResult
+from app.utils.security import get_current_admin_user
+from typing import Optional
 import logging
-from datetime import datetime
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -18,59 +18,84 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+async def _schedule_job(job_id: str, runner: JobRunner, trigger: str) -> dict:
+    """
+    Reserva la ejecución antes de responder (así una petición simultánea
+    recibe 409) y la deja corriendo en segundo plano.
+    """
+    try:
+        return await runner.submit(job_id, trigger)
+    except JobAlreadyRunningError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="La tarea ya se está ejecutando.")
+
 @router.post("/send-payment-reminders", status_code=status.HTTP_200_OK)
-async def trigger_payment_reminders(
-    background_tasks: BackgroundTasks,
-    user_srv: UserService = Depends(lambda: user_service),
-    email_srv: EmailService = Depends(lambda: email_service)
-):
+async def trigger_payment_reminders(runner: JobRunner = Depends(lambda: job_runner)):
     """
     Endpoint para la tarea programada que envía recordatorios de pago.
     Obtiene los estudiantes activos que no han pagado y les envía un correo.
+    La tarea corre después de responder y queda registrada en el historial de ejecuciones.
     """
-    logger.info("CRON JOB: Starting 'send_payment_reminders' task.")
-    overdue_students = user_srv.get_active_students_with_due_payments()
+    run = await _schedule_job(REMINDER_JOB_ID, runner, "http")
+    logger.info("CRON JOB: Scheduled payment reminders for overdue students.")
+    return {"message": "Se programó el envío de recordatorios de pago a los estudiantes con pagos vencidos.", "run_id": run["id"]}
 
-    if not overdue_students:
-        logger.info("CRON JOB: No overdue students found. Task finished.")
-        return {"message": "No hay estudiantes con pagos vencidos."}
 
-    for student in overdue_students:
-        guardian_info = student.get('guardian')
-        reminder_details = PaymentReminderEmail(
-            student_name=f"{student['first_name']} {student['last_name']}",
-            student_email=student['email'],
-            due_date=student['next_payment_date'],
-            amount_due=student['monthly_fee'],
-            guardian_name=guardian_info.get('name') if guardian_info else None,
-            guardian_email=guardian_info.get('email') if guardian_info else None,
-        )
-        background_tasks.add_task(email_srv.send_payment_reminder, reminder_details)
+@router.post("/deactivate-overdue-users", status_code=status.HTTP_200_OK)
+async def trigger_deactivation_of_overdue_users(runner: JobRunner = Depends(lambda: job_runner)):
+    """
+    Endpoint para la tarea programada que desactiva usuarios morosos y les notifica.
+    La tarea corre después de responder y queda registrada en el historial de ejecuciones.
+    """
+    run = await _schedule_job(DEACTIVATION_JOB_ID, runner, "http")
+    logger.info("CRON JOB: Scheduled deactivation of overdue users.")
+    return {"message": "Se programó la desactivación y notificación de los usuarios morosos.", "run_id": run["id"]}
 
-    logger.info(f"CRON JOB: Scheduled {len(overdue_students)} payment reminders.")
-    return {"message": f"Se programó el envío de {len(overdue_students)} recordatorios de pago."}
 
+# --- Administración de tareas ---
 
-@router.post("/deactivate-overdue-users", status_code=status.HTTP_200_OK)
-async def trigger_deactivation_of_overdue_users(
-    background_tasks: BackgroundTasks, # Añadimos BackgroundTasks
-    user_srv: UserService = Depends(lambda: user_service)
-):
+@router.get("/jobs", dependencies=[Depends(get_current_admin_user)])
+async def list_jobs(runner: JobRunner = Depends(lambda: job_runner)):
     """
-    Endpoint para la tarea programada que desactiva usuarios morosos y les notifica.
+    Lista las tareas programadas con su próxima ejecución.
     """
-    logger.info("CRON JOB: Starting 'deactivate_overdue_users' task.")
-    overdue_students = user_srv.get_active_students_with_due_payments()
+    return runner.list_jobs()
 
-    if not overdue_students:
-        logger.info("CRON JOB: No users to deactivate. Task finished.")
-        return {"message": "No hay usuarios morosos para desactivar."}
+@router.get("/runs", dependencies=[Depends(get_current_admin_user)])
+async def list_job_runs(job_id: Optional[str] = None, limit: int = 50, runner: JobRunner = Depends(lambda: job_runner)):
+    """
+    Devuelve el historial de ejecuciones, de la más reciente a la más antigua.
+    """
+    return await asyncio.to_thread(runner.list_runs, job_id=job_id, limit=limit)
 
-    deactivated_count = 0
-    for student in overdue_students:
-        # Usamos background_tasks para que la desactivación y envío de correo no bloqueen el proceso
-        background_tasks.add_task(user_srv.deactivate_firebase_user, student)
-        deactivated_count += 1
-        
-    logger.info(f"CRON JOB: Scheduled deactivation for {deactivated_count} users.")
-    return {"message": f"Se programó la desactivación y notificación para {deactivated_count} usuarios morosos."}
\ No newline at end of file
+@router.get("/runs/{run_id}", dependencies=[Depends(get_current_admin_user)])
+async def get_job_run(run_id: int, runner: JobRunner = Depends(lambda: job_runner)):
+    """
+    Devuelve una ejecución; sirve para seguir las lanzadas en segundo plano.
+    """
+    run = await asyncio.to_thread(runner.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ejecución no encontrada.")
+    return run
+
+@router.post("/jobs/{job_id}/run", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(get_current_admin_user)])
+async def run_job_now(job_id: str, runner: JobRunner = Depends(lambda: job_runner)):
+    """
+    Lanza una tarea de inmediato y devuelve su registro en estado 'running'.
+    El resultado se consulta en `/cron/runs/{id}` con el `id` devuelto.
+    """
+    if job_id not in runner.jobs:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tarea no encontrada.")
+    return await _schedule_job(job_id, runner, "admin")
+
+@router.post("/policy/preview", response_model=PolicyPreviewResult, dependencies=[Depends(get_current_admin_user)])
+async def preview_delinquency_policy(payload: PolicyPreviewRequest, service: UserService = Depends(lambda: user_service)):
+    """
+    Simulación (dry-run) de la política de morosidad: indica a qué alumnos se
+    les enviaría un recordatorio o se desactivaría, sin enviar ni modificar nada.
+    Permite probar otras reglas (días de gracia, deuda mínima, becas) antes de configurarlas.
+    """
+    try:
+        return await service.preview_policy(payload.action, rules=payload.rules, as_of=payload.as_of, limit=payload.limit)
+    except Exception as e:
+        logger.error("Error previewing delinquency policy: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo evaluar la política de morosidad.")
@@ -1,11 +1,17 @@
 # app/routers/emails.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from app.schemas.email import PaymentNotificationEmail, ScholarshipNotificationEmail,PlatformAssignmentEmail
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import BaseModel
+from typing import List, Optional
+from app.schemas.email import PaymentNotificationEmail, ScholarshipNotificationEmail,PlatformAssignmentEmail, EmailBatchItem, EmailBatchResult, EmailSuppression, EmailSuppressionCreate
+from app.services.email_outbox import EmailOutbox, email_outbox
+from app.services.email_batch import EmailBatch
 from app.services.email_service import EmailService, email_service
+from app.services.suppression import SuppressionList, suppression_list
+from app.utils.security import get_current_admin_user
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -15,37 +21,161 @@ router = APIRouter(
 )
 
 @router.post("/send-payment-notification", status_code=status.HTTP_202_ACCEPTED)
-async def send_payment_notification_endpoint(details: PaymentNotificationEmail, background_tasks: BackgroundTasks, service: EmailService = Depends(lambda: email_service)):
+async def send_payment_notification_endpoint(details: PaymentNotificationEmail, service: EmailOutbox = Depends(lambda: email_outbox)):
     try:
-        logger.info(f"Adding payment notification task for {details.student_email}")
-        background_tasks.add_task(service.send_payment_notification, details)
+        logger.info("Queueing payment notification.", extra={"email": details.student_email})
+        await service.enqueue("payment_notification", details)
         return {"message": "La notificación de pago ha sido programada para envío."}
     except Exception as e:
-        logger.error(f"Error scheduling payment notification email: {e}")
+        logger.error("Error scheduling payment notification email: %s", e, extra={"email": details.student_email})
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo programar el envío del correo de notificación.")
 
 @router.post("/send-scholarship-notification", status_code=status.HTTP_202_ACCEPTED)
-async def send_scholarship_notification_endpoint(details: ScholarshipNotificationEmail, background_tasks: BackgroundTasks, service: EmailService = Depends(lambda: email_service)):
+async def send_scholarship_notification_endpoint(details: ScholarshipNotificationEmail, service: EmailOutbox = Depends(lambda: email_outbox)):
     """
     Endpoint para enviar una notificación de beca.
     """
     try:
-        logger.info(f"Adding scholarship notification task for {details.student_email}")
-        background_tasks.add_task(service.send_scholarship_notification, details)
+        logger.info("Queueing scholarship notification.", extra={"email": details.student_email})
+        await service.enqueue("scholarship_notification", details)
         return {"message": "La notificación de beca ha sido programada para envío."}
     except Exception as e:
-        logger.error(f"Error scheduling scholarship notification email: {e}")
+        logger.error("Error scheduling scholarship notification email: %s", e, extra={"email": details.student_email})
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo programar el envío del correo de notificación.")
     
 @router.post("/send-platform-assignment", status_code=status.HTTP_202_ACCEPTED)
-async def send_platform_assignment_endpoint(details: PlatformAssignmentEmail, background_tasks: BackgroundTasks, service: EmailService = Depends(lambda: email_service)):
+async def send_platform_assignment_endpoint(details: PlatformAssignmentEmail, service: EmailOutbox = Depends(lambda: email_outbox)):
     """
     Endpoint para enviar una notificación de asignación de plataformas.
     """
     try:
-        logger.info(f"Adding platform assignment notification task for {details.student_email}")
-        background_tasks.add_task(service.send_platform_assignment_notification, details)
+        logger.info("Queueing platform assignment notification.", extra={"email": details.student_email})
+        await service.enqueue("platform_assignment", details)
         return {"message": "La notificación de asignación de plataformas ha sido programada."}
     except Exception as e:
-        logger.error(f"Error scheduling platform assignment email: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo programar el envío del correo.")
\ No newline at end of file
+        logger.error("Error scheduling platform assignment email: %s", e, extra={"email": details.student_email})
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo programar el envío del correo.")
+
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+@router.post(
+    "/batch",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=EmailBatchResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": EmailBatchItem.model_json_schema()}},
+                "application/x-ndjson": {"schema": {"type": "string", "description": "Un EmailBatchItem en JSON por línea."}},
+            },
+        }
+    },
+)
+async def send_email_batch_endpoint(request: Request, service: EmailOutbox = Depends(lambda: email_outbox)):
+    """
+    Encola muchos correos en una sola petición. Cada elemento es
+    `{"type": "<tipo>", "data": {...}}` con `type` entre 'payment_notification',
+    'scholarship_notification', 'platform_assignment', etc.
+
+    Acepta un arreglo JSON o, para lotes muy grandes, un cuerpo NDJSON
+    (`Content-Type: application/x-ndjson`) que se procesa a medida que llega.
+    Los elementos inválidos se reportan por índice sin rechazar el lote.
+    Los válidos se guardan por bloques: si un bloque falla, sus elementos se
+    cuentan en `failed` y se reportan por índice para reenviar solo esos.
+    Si no se pudo encolar ninguno, se responde 500.
+    """
+    batch = EmailBatch(service)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if content_type in NDJSON_MEDIA_TYPES:
+            result = await batch.add_ndjson(request.stream())
+        else:
+            try:
+                items = await request.json()
+            except ValueError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El cuerpo de la petición no es un JSON válido.")
+            if not isinstance(items, list):
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Se esperaba un arreglo de correos.")
+            result = await batch.add_all(items)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error queueing email batch after %d items: %s", batch.result.queued, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"No se pudo programar el lote de correos ({batch.result.queued} encolados antes del error).")
+
+    logger.info(
+        "Email batch: %d received, %d queued, %d rejected, %d failed.", result.received, result.queued, result.rejected, result.failed,
+        extra={"received": result.received, "queued": result.queued, "rejected": result.rejected, "failed": result.failed},
+    )
+    if result.failed and not result.queued:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo programar el lote de correos.")
+    return result
+
+
+class DeadLetterReplay(BaseModel):
+    ids: Optional[List[int]] = None # Si se omite, se reenvían todos
+
+@router.get("/outbox", dependencies=[Depends(get_current_admin_user)])
+async def get_outbox_status(service: EmailOutbox = Depends(lambda: email_outbox)):
+    """
+    Devuelve el número de correos pendientes y en dead-letter.
+    """
+    return await asyncio.to_thread(service.stats)
+
+@router.get("/backends", dependencies=[Depends(get_current_admin_user)])
+async def get_smtp_backends(service: EmailService = Depends(lambda: email_service)):
+    """
+    Estado de cada cuenta SMTP: salud (en rotación o en pausa tras fallar),
+    correos enviados en el último minuto y su governor (tokens, concurrencia
+    y presupuesto diario usado y restante).
+    """
+    return service.backends.stats()
+
+@router.get("/outbox/dead-letters", dependencies=[Depends(get_current_admin_user)])
+async def list_dead_letters(limit: int = 100, offset: int = 0, service: EmailOutbox = Depends(lambda: email_outbox)):
+    """
+    Lista los correos que no pudieron entregarse tras agotar sus reintentos.
+    """
+    return await asyncio.to_thread(service.list_dead_letters, limit=limit, offset=offset)
+
+@router.post("/outbox/dead-letters/replay", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(get_current_admin_user)])
+async def replay_dead_letters(payload: DeadLetterReplay, service: EmailOutbox = Depends(lambda: email_outbox)):
+    """
+    Vuelve a encolar correos del dead-letter para un nuevo intento de envío.
+    """
+    replayed = await service.replay_dead_letters(payload.ids)
+    return {"message": f"Se reencolaron {replayed} correos.", "replayed": replayed}
+
+@router.get("/suppressions", response_model=List[EmailSuppression], dependencies=[Depends(get_current_admin_user)])
+async def list_suppressions(limit: int = 100, offset: int = 0, source: Optional[str] = None, service: SuppressionList = Depends(lambda: suppression_list)):
+    """
+    Lista las direcciones a las que no se envía correo, las más recientes primero.
+    `source` filtra por origen: 'bounce' o 'manual'.
+    """
+    return service.list(limit=limit, offset=offset, source=source)
+
+@router.get("/suppressions/stats", dependencies=[Depends(get_current_admin_user)])
+async def get_suppression_stats(service: SuppressionList = Depends(lambda: suppression_list)):
+    return service.stats()
+
+@router.post("/suppressions", dependencies=[Depends(get_current_admin_user)])
+async def add_suppression(payload: EmailSuppressionCreate, service: SuppressionList = Depends(lambda: suppression_list)):
+    """
+    Agrega una dirección a la lista de supresión: deja de recibir correos
+    desde el próximo envío.
+    """
+    added = service.add(payload.email, source="manual", reason=payload.reason)
+    if not added:
+        return {"message": f"{payload.email} ya estaba en la lista de supresión.", "added": False}
+    return {"message": f"{payload.email} agregado a la lista de supresión.", "added": True}
+
+@router.delete("/suppressions/{email}", dependencies=[Depends(get_current_admin_user)])
+async def remove_suppression(email: str, service: SuppressionList = Depends(lambda: suppression_list)):
+    """
+    Quita una dirección de la lista de supresión (p. ej. tras corregirla en Firestore).
+    """
+    if not service.remove(email):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{email} no está en la lista de supresión.")
+    return {"message": f"{email} quitado de la lista de supresión."}
@@ -0,0 +1,69 @@
+# app/routers/reports.py
+
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.core.config import settings
+from app.schemas.policy import PolicyAction
+from app.schemas.report import ReportFormat
+from app.services.reports import ReportEncoder, firestore_fields, parse_fields, stream_report
+from app.services.user_service import UserService, user_service
+from app.utils.security import get_current_admin_user
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"],
+    dependencies=[Depends(get_current_admin_user)],
+)
+
+def _encoder(fields: Optional[str], format: ReportFormat) -> ReportEncoder:
+    try:
+        return ReportEncoder(parse_fields(fields), format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def _streaming_response(report: str, pages, encoder: ReportEncoder) -> StreamingResponse:
+    filename = f"{report}-{datetime.now().strftime('%Y%m%d')}.{encoder.format}"
+    return StreamingResponse(
+        stream_report(report, pages, encoder),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/students")
+async def export_students(
+    format: ReportFormat = "ndjson",
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma, p. ej. 'id,email,guardian.email'."),
+    student_status: Optional[str] = Query(None, alias="status", description="Solo los alumnos con este estado ('active' o 'inactive')."),
+    page_size: int = Query(settings.FIRESTORE_PAGE_SIZE, ge=1, le=1000),
+    service: UserService = Depends(lambda: user_service),
+):
+    """
+    Exporta los alumnos en NDJSON o CSV. La respuesta se transmite página a
+    página (cursores de Firestore con proyección de campos), así que la
+    memoria no depende del tamaño de la colección.
+    """
+    encoder = _encoder(fields, format)
+    pages = service.iter_student_pages(page_size=page_size, status=student_status, fields=firestore_fields(encoder.fields))
+    return _streaming_response("students", pages, encoder)
+
+@router.get("/overdue")
+async def export_overdue_students(
+    format: ReportFormat = "ndjson",
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma, p. ej. 'id,email,debt'."),
+    action: PolicyAction = "deactivation",
+    page_size: int = Query(settings.FIRESTORE_PAGE_SIZE, ge=1, le=1000),
+    service: UserService = Depends(lambda: user_service),
+):
+    """
+    Exporta los alumnos a los que hoy aplicaría la acción (`reminder` o
+    `deactivation`) según la política de morosidad: los mismos que
+    procesaría la tarea programada, sin ejecutarla.
+    """
+    encoder = _encoder(fields, format)
+    pages = service.iter_overdue_student_pages(page_size=page_size, action=action, fields=firestore_fields(encoder.fields))
+    return _streaming_response(f"overdue-{action}", pages, encoder)
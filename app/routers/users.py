@@ -1,12 +1,18 @@
 # app/routers/users.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
-from firebase_admin import auth
 from app.utils.security import get_current_admin_user
-from app.firebase.firebase_admin import db
-from app.services.email_service import email_service
+from app.utils.auth_cache import auth_cache
+from app.firebase.firebase_admin import auth, firestore, async_db, async_auth
+from app.services.email_outbox import email_outbox
+from app.services.student_index import student_index
+from app.services.user_service import UserService, user_service
 from app.schemas.email import AccountStatusNotificationEmail
+from app.schemas.email_payloads import email_payloads, student_contact
+from app.schemas.user import UserBatchDelete, UserBatchResult, UserStatusBatchUpdate
+from typing import Dict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,45 +26,102 @@ router = APIRouter(
 class UserStatusUpdate(BaseModel):
     is_disabled: bool
 
+_BATCH_SUCCESS_STATUSES = ('updated', 'deleted')
+
+def _batch_result(report: Dict[str, dict]) -> UserBatchResult:
+    succeeded = sum(1 for entry in report.values() if entry['status'] in _BATCH_SUCCESS_STATUSES)
+    return UserBatchResult(requested=len(report), succeeded=succeeded, failed=len(report) - succeeded, results=report)
+
+@router.get("/auth-cache", status_code=status.HTTP_200_OK)
+async def get_auth_cache_stats():
+    """
+    Devuelve los contadores de aciertos/fallos de la caché de tokens y roles.
+    """
+    return auth_cache.snapshot()
+
+@router.get("/student-index", status_code=status.HTTP_200_OK)
+async def get_student_index_stats():
+    """
+    Devuelve el estado del índice en memoria de alumnos: tamaño, memoria
+    estimada y antigüedad del último cambio recibido.
+    """
+    return await asyncio.to_thread(student_index.stats)
+
+@router.delete("/{uid}/role-cache", status_code=status.HTTP_200_OK)
+async def invalidate_role_cache(uid: str):
+    """
+    Invalida el rol cacheado de un usuario para que el próximo request lo lea de Firestore.
+    Debe llamarse después de cambiar el rol de un usuario.
+    """
+    auth_cache.invalidate_role(uid)
+    return {"message": "Caché de rol invalidada."}
+
+@router.patch("/status:batch", response_model=UserBatchResult, status_code=status.HTTP_200_OK)
+async def update_users_status_batch(payload: UserStatusBatchUpdate, service: UserService = Depends(lambda: user_service)):
+    """
+    Activa o desactiva hasta 1000 usuarios en una sola petición: las cuentas
+    se actualizan en paralelo, los perfiles se buscan con consultas `in` y
+    las notificaciones se encolan juntas. Devuelve el resultado por UID.
+    """
+    uids = list(dict.fromkeys(payload.uids))
+    report = await service.set_users_disabled(uids, payload.is_disabled)
+    result = _batch_result(report)
+    logger.info("Admin cambió el estado de %d/%d usuarios (is_disabled=%s).", result.succeeded, result.requested, payload.is_disabled)
+    return result
+
+@router.delete(":batch", response_model=UserBatchResult, status_code=status.HTTP_200_OK)
+async def delete_users_batch(payload: UserBatchDelete, service: UserService = Depends(lambda: user_service)):
+    """
+    Elimina hasta 1000 usuarios de Firebase Authentication de forma
+    permanente con una llamada a `auth.delete_users`. Devuelve el resultado por UID.
+    """
+    uids = list(dict.fromkeys(payload.uids))
+    report = await service.delete_auth_users(uids)
+    for uid, entry in report.items():
+        if entry['status'] == 'deleted':
+            auth_cache.invalidate_role(uid)
+    result = _batch_result(report)
+    logger.info("Admin eliminó %d/%d usuarios de Authentication.", result.succeeded, result.requested)
+    return result
+
 @router.patch("/{uid}/status", status_code=status.HTTP_200_OK)
-async def update_user_status(uid: str, payload: UserStatusUpdate, background_tasks: BackgroundTasks):
+async def update_user_status(uid: str, payload: UserStatusUpdate):
     """
     Activa o desactiva un usuario en Firebase Authentication y envía una notificación.
     """
     try:
         # 1. Actualizar en Firebase Auth
-        auth_user = auth.update_user(uid, disabled=payload.is_disabled)
+        auth_user = await async_auth.update_user(uid, disabled=payload.is_disabled)
         status_text = "desactivado" if payload.is_disabled else "activado"
         
-        # 2. Obtener datos del alumno de Firestore para el correo
-        students_ref = db.collection('students')
-        query = students_ref.where('authUid', '==', uid).limit(1)
-        student_docs = list(query.stream())
+        # 2. Obtener datos del alumno para el correo (del índice en memoria si está activo)
+        if student_index.ready:
+            student_data = student_index.get_by_auth_uid(uid)
+        else:
+            students_ref = async_db.collection('students')
+            query = students_ref.where(filter=firestore.FieldFilter('authUid', '==', uid)).limit(1)
+            student_docs = [doc async for doc in query.stream()]
+            student_data = student_docs[0].to_dict() if student_docs else None
 
-        if not student_docs:
-            logger.warning(f"No se encontró un perfil de estudiante en Firestore para el UID {uid}. No se puede enviar correo.")
+        if not student_data:
+            logger.warning("No se encontró un perfil de estudiante en Firestore para el UID %s. No se puede enviar correo.", uid, extra={"uid": uid})
             return {"message": f"Usuario {status_text} correctamente, pero no se encontró perfil para notificar."}
-
-        student_data = student_docs[0].to_dict()
         
-        # 3. Enviar correo en segundo plano
-        guardian_info = student_data.get('guardian')
-        email_details = AccountStatusNotificationEmail(
-            student_name=f"{student_data['first_name']} {student_data['last_name']}",
-            student_email=auth_user.email,
-            guardian_name=guardian_info.get('name') if guardian_info else None,
-            guardian_email=guardian_info.get('email') if guardian_info else None,
+        # 3. Encolar el correo en el outbox
+        email_details = email_payloads.build(
+            AccountStatusNotificationEmail,
+            student_contact(student_data, auth_user.email),
             status="activada" if not payload.is_disabled else "desactivada"
         )
-        background_tasks.add_task(email_service.send_account_status_notification, email_details)
+        await email_outbox.enqueue("account_status", email_details)
         
-        logger.info(f"Admin cambió el estado del usuario {uid} a {status_text} y se programó la notificación.")
+        logger.info("Admin cambió el estado del usuario %s a %s y se programó la notificación.", uid, status_text, extra={"uid": uid})
         return {"message": f"Usuario {status_text} y notificado correctamente."}
         
     except auth.UserNotFoundError:
         raise HTTPException(status_code=404, detail="Usuario no encontrado en Firebase Authentication.")
     except Exception as e:
-        logger.error(f"Error al cambiar el estado del usuario {uid}: {e}")
+        logger.error("Error al cambiar el estado del usuario %s: %s", uid, e, extra={"uid": uid})
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{uid}", status_code=status.HTTP_200_OK)
@@ -67,13 +130,14 @@ async def delete_user_auth(uid: str):
     Elimina un usuario de Firebase Authentication de forma permanente.
     """
     try:
-        auth.delete_user(uid)
-        logger.info(f"Admin eliminó permanentemente al usuario {uid} de Authentication.")
+        await async_auth.delete_user(uid)
+        auth_cache.invalidate_role(uid)
+        logger.info("Admin eliminó permanentemente al usuario %s de Authentication.", uid, extra={"uid": uid})
         return {"message": "Usuario eliminado de Authentication correctamente."}
     except auth.UserNotFoundError:
         # Si no se encuentra, no es un error crítico, puede que ya se haya borrado.
-        logger.warning(f"Se intentó eliminar el usuario {uid} de Auth, pero no fue encontrado.")
+        logger.warning("Se intentó eliminar el usuario %s de Auth, pero no fue encontrado.", uid, extra={"uid": uid})
         return {"message": "Usuario no encontrado en Authentication, pero la operación continúa."}
     except Exception as e:
-        logger.error(f"Error al eliminar el usuario {uid} de Auth: {e}")
+        logger.error("Error al eliminar el usuario %s de Auth: %s", uid, e, extra={"uid": uid})
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,19 @@
+# app/schemas/cron.py
+
+from pydantic import BaseModel, Field
+from typing import Dict
+
+
+class JobRunResult(BaseModel):
+    """
+    Resultado agregado de la ejecución de una tarea programada sobre un
+    conjunto de alumnos.
+    """
+    job: str
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    timed_out: int = 0 # Incluidos también en 'failed'
+    duration_seconds: float = 0.0
+    latency_ms: Dict[str, float] = Field(default_factory=dict) # p50, p95, p99, max
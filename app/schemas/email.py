@@ -1,7 +1,7 @@
 # app/schemas/email.py
 
 from pydantic import BaseModel, EmailStr, field_validator
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict
 
 class EmailBase(BaseModel):
     """
@@ -47,4 +47,47 @@ class PlatformAssignmentEmail(EmailBase):
     """
     Modelo para notificar la asignación de nuevas plataformas.
     """
-    platforms: List[Dict[str, str]] # Lista de diccionarios [{'name': '...', 'url': '...'}]
\ No newline at end of file
+    platforms: List[Dict[str, str]] # Lista de diccionarios [{'name': '...', 'url': '...'}]
+
+
+class EmailBatchItem(BaseModel):
+    """
+    Elemento de un envío por lotes: el tipo de correo (p. ej.
+    'payment_notification') y los datos del schema correspondiente.
+    """
+    type: str
+    data: Dict[str, Any]
+
+class EmailBatchItemError(BaseModel):
+    index: int # Posición del elemento en el lote (o línea, en NDJSON), desde 0
+    type: Optional[str] = None
+    errors: List[Dict[str, Any]]
+
+class EmailBatchResult(BaseModel):
+    """
+    Resultado de un envío por lotes: los elementos válidos se encolan y los
+    inválidos se reportan uno por uno sin rechazar el resto. `failed` cuenta
+    los elementos válidos de un bloque que no se pudo guardar en el outbox
+    (también se reportan en `errors`); los demás bloques quedan encolados.
+    """
+    received: int = 0
+    queued: int = 0
+    rejected: int = 0
+    failed: int = 0
+    errors: List[EmailBatchItemError] = []
+    errors_truncated: bool = False
+
+
+class EmailSuppressionCreate(BaseModel):
+    """
+    Alta manual de una dirección en la lista de supresión.
+    """
+    email: EmailStr
+    reason: Optional[str] = None
+
+class EmailSuppression(BaseModel):
+    email: str
+    source: str # 'bounce' (rechazo definitivo del servidor SMTP) o 'manual'
+    reason: Optional[str] = None
+    code: Optional[int] = None # Código SMTP del rechazo, si lo hubo
+    created_at: float
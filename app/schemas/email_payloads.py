@@ -0,0 +1,185 @@
+# app/schemas/email_payloads.py
+
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Generic, List, Optional, Sequence, Tuple, Type, TypeVar
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+from app.schemas.email import EmailBase
+
+Model = TypeVar("Model", bound=BaseModel)
+
+# Contactos ya validados que se conservan entre ejecuciones (~1 KB cada uno)
+CONTACT_CACHE_SIZE = 20000
+
+_CONTACT_FIELDS = tuple(EmailBase.model_fields)
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """
+    `TypeAdapter(List[model])`, construido una sola vez por modelo.
+    """
+    return TypeAdapter(List[model])
+
+
+@lru_cache(maxsize=None)
+def _fields_model(model: Type[EmailBase]) -> Type[BaseModel]:
+    """
+    Modelo con los campos propios de un correo (sin los del contacto), con
+    los mismos tipos y valores por defecto. Los validadores de campo de
+    `model` no se copian: hoy solo los tiene `EmailBase`.
+    """
+    fields = {name: (info.annotation, info) for name, info in model.model_fields.items() if name not in _CONTACT_FIELDS}
+    return create_model(f"{model.__name__}Fields", **fields)
+
+
+def _errors(exc: ValidationError) -> List[dict]:
+    # `exc.json()` serializa también el contexto de los errores (excepciones, etc.)
+    return json.loads(exc.json(include_url=False, include_input=False))
+
+
+@dataclass
+class BatchValidation(Generic[Model]):
+    """
+    Resultado de validar una cohorte: `items` está alineado con la entrada
+    (None en los registros inválidos) y `errors` agrupa por posición los
+    errores de cada registro inválido, con `loc` relativo al registro.
+    """
+    items: List[Optional[Model]]
+    errors: Dict[int, List[dict]]
+
+
+def validate_many(model: Type[Model], records: Sequence) -> BatchValidation[Model]:
+    """
+    Valida todos los registros con una sola llamada a un
+    `TypeAdapter(List[model])`. Si alguno es inválido se reportan sus
+    errores y se vuelven a validar solo los demás, en lugar de rechazar
+    la cohorte completa.
+    """
+    adapter = list_adapter(model)
+    try:
+        return BatchValidation(items=adapter.validate_python(records), errors={})
+    except ValidationError as e:
+        errors: Dict[int, List[dict]] = {}
+        for error in _errors(e):
+            index, *loc = error["loc"]
+            errors.setdefault(index, []).append({**error, "loc": loc})
+
+    valid = [index for index in range(len(records)) if index not in errors]
+    items: List[Optional[Model]] = [None] * len(records)
+    for index, item in zip(valid, adapter.validate_python([records[index] for index in valid])):
+        items[index] = item
+    return BatchValidation(items=items, errors=errors)
+
+
+def describe_errors(errors: List[dict]) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'record'}: {error['msg']}" for error in errors)
+
+
+def student_contact(student: dict, email: Optional[str] = None) -> dict:
+    """
+    Campos de `EmailBase` a partir de un registro de alumno de Firestore.
+    `email` sustituye al del perfil (p. ej. el de la cuenta de Auth). Los
+    datos que falten se dejan en None para que la validación los reporte.
+    """
+    guardian = student.get('guardian') or {}
+    name = " ".join(part for part in (student.get('first_name'), student.get('last_name')) if part)
+    return {
+        'student_name': name or None,
+        'student_email': email or student.get('email'),
+        'guardian_name': guardian.get('name'),
+        'guardian_email': guardian.get('email'),
+    }
+
+
+class EmailPayloadBuilder:
+    """
+    Construye los payloads de correo de cohortes de alumnos.
+
+    Casi todo el coste de validar un payload está en los `EmailStr` del
+    contacto (alumno y tutor), que se repiten en cada correo y en cada
+    ejecución mensual. Por eso el contacto se valida una sola vez y se
+    guarda en una caché LRU de `cache_size` entradas; en cada correo solo se
+    validan sus campos propios (importes, fechas) y el payload se arma con
+    `model_construct`, sin volver a validar lo ya validado.
+
+    Los registros inválidos se reportan uno por uno (`BatchValidation`) y no
+    impiden construir los demás.
+    """
+
+    def __init__(self, cache_size: int = CONTACT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._contacts: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contacts(self, records: Sequence[dict]) -> BatchValidation[dict]:
+        """
+        Contactos validados (como dict) de `records`, dicts con los campos
+        de `EmailBase` (ver `student_contact`). Los que no están en caché
+        se validan juntos.
+        """
+        keys = [tuple(record.get(name) for name in _CONTACT_FIELDS) for record in records]
+        items: List[Optional[dict]] = [None] * len(records)
+        misses: Dict[tuple, List[int]] = {}
+        with self._lock:
+            for index, key in enumerate(keys):
+                contact = self._contacts.get(key)
+                if contact is None:
+                    misses.setdefault(key, []).append(index)
+                else:
+                    self._contacts.move_to_end(key)
+                    items[index] = contact
+
+        errors: Dict[int, List[dict]] = {}
+        if misses:
+            pending = list(misses)
+            batch = validate_many(EmailBase, [records[misses[key][0]] for key in pending])
+            with self._lock:
+                for position, key in enumerate(pending):
+                    validated = batch.items[position]
+                    for index in misses[key]:
+                        if validated is None:
+                            errors[index] = batch.errors[position]
+                        else:
+                            items[index] = validated.model_dump()
+                    if validated is not None:
+                        self._contacts[key] = items[misses[key][0]]
+                while len(self._contacts) > self.cache_size:
+                    self._contacts.popitem(last=False)
+        return BatchValidation(items=items, errors=errors)
+
+    def build_many(self, model: Type[Model], records: Sequence[Tuple[dict, dict]]) -> BatchValidation[Model]:
+        """
+        Payloads de `model` para cada par (contacto, campos propios del
+        correo), p. ej. `(student_contact(student), {'amount_due': 120})`.
+        """
+        contacts = self.contacts([contact for contact, _ in records])
+        fields = validate_many(_fields_model(model), [extra for _, extra in records])
+
+        items: List[Optional[Model]] = [None] * len(records)
+        errors: Dict[int, List[dict]] = {}
+        for index, (contact, extra) in enumerate(zip(contacts.items, fields.items)):
+            if contact is None or extra is None:
+                errors[index] = contacts.errors.get(index, []) + fields.errors.get(index, [])
+                continue
+            items[index] = model.model_construct(**contact, **dict(extra))
+        return BatchValidation(items=items, errors=errors)
+
+    def build(self, model: Type[Model], contact: dict, **fields) -> Model:
+        """
+        Un solo payload. Lanza ValueError si el registro es inválido.
+        """
+        batch = self.build_many(model, [(contact, fields)])
+        if batch.items[0] is None:
+            raise ValueError(f"Invalid {model.__name__}: {describe_errors(batch.errors[0])}")
+        return batch.items[0]
+
+    def clear(self):
+        with self._lock:
+            self._contacts.clear()
+
+
+email_payloads = EmailPayloadBuilder()
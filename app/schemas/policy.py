@@ -0,0 +1,45 @@
+# app/schemas/policy.py
+
+from datetime import date
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+PolicyAction = Literal["reminder", "deactivation"]
+
+
+class DelinquencyRules(BaseModel):
+    """
+    Reglas que deciden si un alumno activo se considera moroso.
+    """
+    grace_days: int = Field(0, ge=0) # Días de tolerancia después de la fecha de pago
+    min_debt: float = Field(0.0, ge=0) # La deuda debe ser estrictamente mayor a este monto
+    exempt_scholarships: bool = True # Los alumnos con beca vigente no se consideran morosos
+    min_exempt_percentage: int = Field(0, ge=0, le=100) # Porcentaje mínimo de beca que exime
+
+class PolicyPreviewRequest(BaseModel):
+    action: PolicyAction
+    rules: Optional[DelinquencyRules] = None # Si se omite, se usan las reglas configuradas
+    as_of: Optional[date] = None # Fecha de evaluación; por defecto, hoy
+    limit: int = Field(100, ge=0, le=10000) # Máximo de alumnos a listar
+
+class PolicyPreviewStudent(BaseModel):
+    id: str
+    name: str
+    email: Optional[str] = None
+    debt: float
+    next_payment_date: Optional[str] = None
+    days_overdue: int
+
+class PolicyPreviewResult(BaseModel):
+    """
+    Vista previa (sin efectos) de a quién afectaría una acción.
+    """
+    action: PolicyAction
+    as_of: date
+    rules: DelinquencyRules
+    evaluated: int
+    matched: int
+    exempted_by_scholarship: int
+    source: str # 'student_index' o 'firestore'
+    elapsed_ms: float
+    students: List[PolicyPreviewStudent] = []
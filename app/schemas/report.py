@@ -0,0 +1,40 @@
+# app/schemas/report.py
+
+from typing import Literal
+
+ReportFormat = Literal["ndjson", "csv"]
+
+# Columnas que se pueden pedir en los reportes de alumnos ('id' es el del
+# documento; los campos anidados se piden con punto, p. ej. 'guardian.email')
+STUDENT_REPORT_FIELDS = (
+    "id",
+    "authUid",
+    "first_name",
+    "last_name",
+    "email",
+    "phone_number",
+    "status",
+    "start_date",
+    "monthly_fee",
+    "debt",
+    "next_payment_date",
+    "assigned_platforms",
+    "guardian.name",
+    "guardian.email",
+    "guardian.phone_number",
+    "scholarship.percentage",
+    "scholarship.start_date",
+    "scholarship.end_date",
+)
+
+DEFAULT_STUDENT_REPORT_FIELDS = (
+    "id",
+    "first_name",
+    "last_name",
+    "email",
+    "status",
+    "monthly_fee",
+    "debt",
+    "next_payment_date",
+    "guardian.email",
+)
@@ -1,7 +1,7 @@
 # app/schemas/user.py
 
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 class Guardian(BaseModel):
     """
@@ -36,4 +36,31 @@ class Student(BaseModel):
     status: str  # 'active' or 'inactive'
     next_payment_date: str
     scholarship: Optional[Scholarship] = None
-    guardian: Optional[Guardian] = None
\ No newline at end of file
+    guardian: Optional[Guardian] = None
+
+# Máximo de UIDs por petición masiva: lo que acepta una llamada a `auth.delete_users`
+USERS_BATCH_MAX_SIZE = 1000
+
+class UserStatusBatchUpdate(BaseModel):
+    """
+    Activa o desactiva varias cuentas de Firebase Authentication a la vez.
+    """
+    uids: List[str] = Field(..., min_length=1, max_length=USERS_BATCH_MAX_SIZE)
+    is_disabled: bool
+
+class UserBatchDelete(BaseModel):
+    uids: List[str] = Field(..., min_length=1, max_length=USERS_BATCH_MAX_SIZE)
+
+class UserBatchItemResult(BaseModel):
+    status: str # 'updated', 'deleted', 'not_found' o 'failed'
+    notified: Optional[bool] = None # Solo en cambios de estado: si se encoló el correo
+    error: Optional[str] = None
+
+class UserBatchResult(BaseModel):
+    """
+    Resultado de una operación masiva, con el detalle por UID.
+    """
+    requested: int
+    succeeded: int
+    failed: int
+    results: Dict[str, UserBatchItemResult]
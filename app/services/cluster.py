@@ -0,0 +1,459 @@
+# app/services/cluster.py
+
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.firebase.firebase_admin import firestore, db as firestore_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_MODES = ("single", "leader", "sharded")
+
+# Días que se conservan los planes de ejecución en el lease de archivo
+PLAN_RETENTION_DAYS = 7
+
+
+class SharedPlan:
+    """
+    Datos de una ejecución programada compartidos entre workers a través del
+    lease, bajo la clave `key` de la ejecución: la membresía del cluster y
+    los ids de alumnos asignados a cada shard. El primer valor publicado
+    para un nombre es el que ven todos.
+    """
+
+    def __init__(self, lease, key: str, timeout: float, poll_interval: float = 1.0):
+        self.lease = lease
+        self.key = key
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def publish_assignments(self, assignments: List[List[str]]):
+        for index, ids in enumerate(assignments):
+            self.lease.agree(self.key, f"shard-{index}", ids)
+
+    def mark_done(self, index: int, status: str):
+        """
+        Registra que el shard `index` terminó (con 'success', 'failed' o
+        'timeout'), para que el lector no lo cuente como huérfano.
+        """
+        self.lease.agree(self.key, f"done-{index}", status)
+
+    async def wait_assignment(self, index: int) -> Optional[List[str]]:
+        """
+        Espera hasta `timeout` segundos a que el lector publique los ids del
+        shard `index`. Devuelve None si no llegan.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            ids = await asyncio.to_thread(self.lease.read, self.key, f"shard-{index}")
+            if ids is not None or time.monotonic() >= deadline:
+                return ids
+            await asyncio.sleep(self.poll_interval)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """
+    Porción del conjunto de alumnos que procesa este worker: los alumnos cuyo
+    id, con CRC32 (estable entre procesos, a diferencia de `hash`), cae en
+    `index` módulo `count`.
+
+    Con `plan`, el shard 0 lee la cohorte una sola vez y publica los ids de
+    cada shard; los demás procesan solo los ids que les tocan.
+    """
+    index: int
+    count: int
+    plan: Optional[SharedPlan] = field(default=None, compare=False, repr=False)
+
+    def owner(self, student_id: str) -> int:
+        return zlib.crc32(student_id.encode()) % self.count
+
+    def owns(self, student_id: str) -> bool:
+        return self.owner(student_id) == self.index
+
+    @property
+    def is_reader(self) -> bool:
+        return self.index == 0
+
+    def __str__(self):
+        return f"{self.index + 1}/{self.count}"
+
+
+@dataclass(frozen=True)
+class RunPlan:
+    run: bool
+    shard: Optional[Shard] = None
+    reason: str = ""
+
+
+# --- Leases de liderazgo ---
+
+class FileLease:
+    """
+    Lease para un único host: un `flock` exclusivo sobre un archivo. El sistema
+    operativo lo libera si el proceso muere, por lo que no necesita expirar.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def plans_dir(self) -> str:
+        return os.path.join(os.path.dirname(self.path), "plans")
+
+    def _plan_path(self, key: str, name: str) -> str:
+        return os.path.join(self.plans_dir, f"{key}.{name}.json")
+
+    def agree(self, key: str, name: str, proposal: Any) -> Any:
+        """
+        Fija `proposal` como el valor `name` de la ejecución `key` si nadie lo
+        fijó antes, y devuelve el valor fijado. `os.link` falla si el archivo
+        ya existe, así que solo gana el primero.
+        """
+        os.makedirs(self.plans_dir, exist_ok=True)
+        path = self._plan_path(key, name)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(proposal, f)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+        self._prune_plans()
+        return self.read(key, name)
+
+    def read(self, key: str, name: str) -> Any:
+        try:
+            with open(self._plan_path(key, name), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _prune_plans(self):
+        threshold = time.time() - PLAN_RETENTION_DAYS * 86400
+        for entry in os.scandir(self.plans_dir):
+            try:
+                if entry.stat().st_mtime < threshold:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+
+class FirestoreLease:
+    """
+    Lease compartido entre réplicas: un documento de Firestore con el holder y
+    la fecha de expiración, tomado y renovado dentro de una transacción.
+    """
+
+    def __init__(self, db, holder: str, ttl: float, doc_path: str = "_cluster/scheduler_lease"):
+        self.db = db
+        self.doc_path = doc_path
+        self.holder = holder
+        self.ttl = ttl
+
+    @property
+    def ref(self):
+        return self.db.document(self.doc_path)
+
+    def try_acquire(self) -> bool:
+        @firestore.transactional
+        def acquire(transaction) -> bool:
+            snapshot = self.ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else None
+            now = time.time()
+            if data and data.get("holder") != self.holder and data.get("expires_at", 0) > now:
+                return False
+            transaction.set(self.ref, {"holder": self.holder, "expires_at": now + self.ttl})
+            return True
+
+        return acquire(self.db.transaction())
+
+    def release(self):
+        @firestore.transactional
+        def release(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get("holder") == self.holder:
+                transaction.delete(self.ref)
+
+        release(self.db.transaction())
+
+    def _plan_ref(self, key: str, name: str):
+        return self.ref.collection("plans").document(f"{key}.{name}")
+
+    def agree(self, key: str, name: str, proposal: Any) -> Any:
+        """
+        Fija `proposal` como el valor `name` de la ejecución `key` si nadie lo
+        fijó antes (en una transacción), y devuelve el valor fijado.
+        """
+        ref = self._plan_ref(key, name)
+
+        @firestore.transactional
+        def agree(transaction) -> Any:
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists:
+                return snapshot.to_dict()["value"]
+            transaction.set(ref, {"value": proposal, "created_at": time.time()})
+            return proposal
+
+        return agree(self.db.transaction())
+
+    def read(self, key: str, name: str) -> Any:
+        snapshot = self._plan_ref(key, name).get()
+        return snapshot.to_dict()["value"] if snapshot.exists else None
+
+
+# --- Registro de workers vivos (modo sharded) ---
+
+class FileWorkerRegistry:
+    """
+    Cada worker mantiene un archivo con su id cuyo mtime es su último latido.
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+
+    def heartbeat(self, worker_id: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, worker_id)
+        with open(path, "a"):
+            os.utime(path, None)
+
+    def live_workers(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        threshold = time.time() - self.ttl
+        live = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= threshold:
+                    live.append(entry.name)
+            except FileNotFoundError:
+                continue
+        return live
+
+    def unregister(self, worker_id: str):
+        try:
+            os.remove(os.path.join(self.directory, worker_id))
+        except FileNotFoundError:
+            pass
+
+
+class FirestoreWorkerRegistry:
+    """
+    Cada worker mantiene un documento `_cluster_workers/{worker_id}` con su último latido.
+    """
+
+    def __init__(self, db, ttl: float, collection: str = "_cluster_workers"):
+        self.db = db
+        self.collection = collection
+        self.ttl = ttl
+
+    @property
+    def ref(self):
+        return self.db.collection(self.collection)
+
+    def heartbeat(self, worker_id: str):
+        self.ref.document(worker_id).set({"last_seen": time.time()})
+
+    def live_workers(self) -> List[str]:
+        threshold = time.time() - self.ttl
+        return [doc.id for doc in self.ref.stream() if (doc.to_dict() or {}).get("last_seen", 0) >= threshold]
+
+    def unregister(self, worker_id: str):
+        self.ref.document(worker_id).delete()
+
+
+class ClusterCoordinator:
+    """
+    Decide qué debe hacer este proceso cuando el scheduler dispara una tarea,
+    para poder correr con varios workers de uvicorn o varias réplicas:
+
+    - 'single': no hay coordinación; se ejecuta siempre (un solo proceso).
+    - 'leader': solo el proceso que tiene el lease ejecuta la tarea.
+    - 'sharded': todos los workers vivos ejecutan la tarea, cada uno sobre su
+      porción de alumnos según el hash del id. La membresía de cada ejecución
+      se fija una sola vez en el lease, así que todos los workers reparten con
+      la misma lista.
+
+    Limitación del modo sharded: si un worker muere después de fijarse la
+    membresía, nadie procesa su shard en esa ejecución; sus alumnos se retoman
+    en la siguiente. El lector (shard 0) lo detecta con `orphaned_shards` y
+    lo deja registrado en `job_runs` con estado 'orphaned'. Si el que muere es
+    el propio lector, o el shard sigue en curso cuando vence `plan_timeout`,
+    no queda registro.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        worker_id: str,
+        lease=None,
+        registry=None,
+        heartbeat_interval: float = 15.0,
+        plan_timeout: float = 300.0,
+    ):
+        if mode not in CLUSTER_MODES:
+            raise ValueError(f"Unknown cluster mode: {mode}")
+        self.mode = mode
+        self.worker_id = worker_id
+        self.lease = lease
+        self.registry = registry
+        self.heartbeat_interval = heartbeat_interval
+        self.plan_timeout = plan_timeout
+        self.is_leader = mode == "single"
+        self._task: Optional[asyncio.Task] = None
+
+    async def _beat(self):
+        if self.mode == "leader":
+            was_leader = self.is_leader
+            try:
+                self.is_leader = await asyncio.to_thread(self.lease.try_acquire)
+            except Exception as e:
+                logger.error("Cluster lease renewal failed: %s", e)
+                self.is_leader = False
+            if self.is_leader != was_leader:
+                logger.info("Worker %s %s the scheduler lease.", self.worker_id, "acquired" if self.is_leader else "lost")
+        elif self.mode == "sharded":
+            try:
+                await asyncio.to_thread(self.registry.heartbeat, self.worker_id)
+            except Exception as e:
+                logger.error("Cluster heartbeat failed: %s", e)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self._beat()
+
+    async def start(self):
+        if self.mode == "single":
+            return
+        await self._beat()
+        self._task = asyncio.create_task(self._loop())
+        logger.info("Cluster coordinator started (mode=%s, worker=%s).", self.mode, self.worker_id)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            if self.mode == "leader" and self.is_leader:
+                await asyncio.to_thread(self.lease.release)
+            elif self.mode == "sharded":
+                await asyncio.to_thread(self.registry.unregister, self.worker_id)
+        except Exception as e:
+            logger.warning("Cluster coordinator cleanup failed: %s", e)
+        self.is_leader = self.mode == "single"
+
+    async def plan_run(self, run_key: Optional[str] = None) -> RunPlan:
+        """
+        Se consulta justo antes de una ejecución programada. `run_key`
+        identifica la ejecución igual en todos los workers (la tarea y su hora
+        de disparo programada).
+
+        En modo sharded, el primer worker que llega fija en el lease la lista
+        de workers vivos para `run_key`; los demás usan esa misma lista, y los
+        que no figuran en ella no ejecutan. Sin `run_key`, cada worker calcula
+        su propia lista.
+        """
+        if self.mode == "single":
+            return RunPlan(run=True)
+        if self.mode == "leader":
+            await self._beat()
+            if self.is_leader:
+                return RunPlan(run=True)
+            return RunPlan(run=False, reason="not the scheduler leader")
+
+        await self._beat()
+        live = sorted(set(await asyncio.to_thread(self.registry.live_workers)) | {self.worker_id})
+        if run_key is None:
+            return RunPlan(run=True, shard=Shard(index=live.index(self.worker_id), count=len(live)))
+
+        members = await asyncio.to_thread(self.lease.agree, run_key, "members", live)
+        if self.worker_id not in members:
+            return RunPlan(run=False, reason=f"not a member of the snapshot for run {run_key}")
+        plan = SharedPlan(self.lease, run_key, timeout=self.plan_timeout)
+        return RunPlan(run=True, shard=Shard(index=members.index(self.worker_id), count=len(members), plan=plan))
+
+
+    async def orphaned_shards(self, shard: Shard) -> Dict[int, str]:
+        """
+        Lo llama el lector al terminar su shard. Espera hasta `plan_timeout`
+        segundos a que los demás shards de la ejecución marquen que
+        terminaron y devuelve `{índice: worker}` de los que no lo hicieron y
+        cuyo worker ya no está vivo.
+        """
+        key = shard.plan.key
+        members = await asyncio.to_thread(self.lease.read, key, "members") or []
+        pending = {index: worker for index, worker in enumerate(members) if index != shard.index}
+        deadline = time.monotonic() + self.plan_timeout
+        while True:
+            for index in list(pending):
+                if await asyncio.to_thread(self.lease.read, key, f"done-{index}") is not None:
+                    del pending[index]
+            live = set(await asyncio.to_thread(self.registry.live_workers))
+            orphaned = {index: worker for index, worker in pending.items() if worker not in live}
+            if len(orphaned) == len(pending) or time.monotonic() >= deadline:
+                return orphaned
+            await asyncio.sleep(self.heartbeat_interval)
+
+
+def _default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def build_coordinator() -> ClusterCoordinator:
+    mode = settings.CLUSTER_MODE
+    worker_id = settings.CLUSTER_WORKER_ID or _default_worker_id()
+    lease = registry = None
+    if mode != "single":
+        # En modo sharded el lease solo guarda los planes de cada ejecución
+        if settings.CLUSTER_BACKEND == "firestore":
+            lease = FirestoreLease(firestore_db, holder=worker_id, ttl=settings.CLUSTER_LEASE_TTL)
+            registry = FirestoreWorkerRegistry(firestore_db, ttl=settings.CLUSTER_LEASE_TTL)
+        else:
+            lease = FileLease(os.path.join(settings.CLUSTER_LOCK_DIR, "scheduler.lock"))
+            registry = FileWorkerRegistry(os.path.join(settings.CLUSTER_LOCK_DIR, "workers"), ttl=settings.CLUSTER_LEASE_TTL)
+    return ClusterCoordinator(
+        mode=mode,
+        worker_id=worker_id,
+        lease=lease,
+        registry=registry,
+        heartbeat_interval=settings.CLUSTER_HEARTBEAT_INTERVAL,
+        plan_timeout=settings.CLUSTER_PLAN_TIMEOUT,
+    )
+
+
+cluster_coordinator = build_coordinator()
@@ -0,0 +1,115 @@
+# app/services/cron_service.py
+
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+from apscheduler.triggers.cron import CronTrigger
+from app.services.user_service import UserService, user_service
+from app.services.email_outbox import EmailOutbox, email_outbox
+from app.services.job_executor import JobExecutor, cron_executor
+from app.services.job_runner import job_runner
+from app.services.cluster import Shard
+from app.services.idempotency import SendLedger, billing_period, send_ledger
+from app.schemas.cron import JobRunResult
+from app.schemas.email import PaymentReminderEmail
+from app.schemas.email_payloads import describe_errors, email_payloads, student_contact
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEACTIVATION_JOB_ID = "deactivate_users_job"
+REMINDER_JOB_ID = "send_reminders_job"
+
+
+class CronService:
+    """
+    Lógica de las tareas programadas. La usan tanto el scheduler interno
+    (a través de `JobRunner`) como los endpoints de `/cron`.
+    Cada recordatorio se registra en el `SendLedger` por alumno y periodo de
+    facturación, de modo que repetir la tarea no vuelve a enviarlo.
+    """
+
+    def __init__(self, user_srv: UserService, outbox: EmailOutbox, executor: JobExecutor, ledger: Optional[SendLedger] = None):
+        self.user_srv = user_srv
+        self.outbox = outbox
+        self.executor = executor
+        self.ledger = ledger
+
+    async def _reminders(self, shard: Optional[Shard]) -> AsyncIterator[Tuple[dict, Optional[PaymentReminderEmail], List[dict]]]:
+        """
+        (alumno, recordatorio, errores) de cada moroso. Los recordatorios se
+        construyen por página, validando la cohorte de una vez.
+        """
+        async for page in self.user_srv.iter_overdue_student_pages(shard=shard, action="reminder"):
+            batch = email_payloads.build_many(PaymentReminderEmail, [
+                (student_contact(student), {'due_date': student.get('next_payment_date'), 'amount_due': student.get('monthly_fee')})
+                for student in page
+            ])
+            for index, student in enumerate(page):
+                yield student, batch.items[index], batch.errors.get(index, [])
+
+    async def send_payment_reminders(self, shard: Optional[Shard] = None) -> JobRunResult:
+        """
+        Encola un recordatorio de pago para cada alumno moroso
+        (o solo para los de `shard`, si se indica).
+        """
+        logger.info("CRON JOB: Starting 'send_payment_reminders' task.")
+
+        async def send_reminder(item: Tuple[dict, Optional[PaymentReminderEmail], List[dict]]):
+            student, details, errors = item
+            if not student.get('email'):
+                return None
+            if details is None:
+                raise ValueError(f"Invalid reminder data for student {student['id']}: {describe_errors(errors)}")
+            period = billing_period(student)
+            if self.ledger and not await asyncio.to_thread(self.ledger.claim, student['id'], "payment_reminder", period):
+                return None # Ya se le recordó este periodo
+            try:
+                await self.outbox.enqueue("payment_reminder", details)
+            except Exception:
+                if self.ledger:
+                    await asyncio.to_thread(self.ledger.release_many, "payment_reminder", [(student['id'], period)])
+                raise
+            return True
+
+        return await self.executor.run("send_payment_reminders", self._reminders(shard), send_reminder)
+
+    async def deactivate_overdue_users(self, shard: Optional[Shard] = None) -> JobRunResult:
+        """
+        Desactiva a los alumnos morosos (o solo a los de `shard`) y encola sus notificaciones.
+        """
+        logger.info("CRON JOB: Starting 'deactivate_overdue_users' task.")
+        started = time.perf_counter()
+        report = await self.user_srv.deactivate_overdue_students(shard=shard)
+
+        result = JobRunResult(job="deactivate_overdue_users", total=len(report))
+        for entry in report.values():
+            if entry['status'] == 'deactivated':
+                result.sent += 1
+            elif entry['status'] in ('not_found_in_auth', 'duplicate'):
+                result.skipped += 1
+            else:
+                result.failed += 1
+        result.duration_seconds = round(time.perf_counter() - started, 3)
+        logger.info(
+            "CRON JOB: Deactivation finished. %d deactivated, %d skipped (not in Auth or already deactivated), %d failed.",
+            result.sent, result.skipped, result.failed, extra={"job": "deactivate_overdue_users"},
+        )
+        return result
+
+
+cron_service = CronService(user_srv=user_service, outbox=email_outbox, executor=cron_executor, ledger=send_ledger)
+
+# --- Tareas programadas ---
+job_runner.register(
+    DEACTIVATION_JOB_ID,
+    "Deactivate Overdue Users",
+    cron_service.deactivate_overdue_users,
+    CronTrigger(day=3, hour=2, minute=0), # Cada día 3 del mes a las 2:00 AM
+)
+job_runner.register(
+    REMINDER_JOB_ID,
+    "Send Payment Reminders",
+    cron_service.send_payment_reminders,
+    CronTrigger(day=30, hour=10, minute=0), # Cada día 30 del mes a las 10:00 AM
+)
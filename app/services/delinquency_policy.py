@@ -0,0 +1,217 @@
+# app/services/delinquency_policy.py
+
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.schemas.policy import DelinquencyRules, PolicyAction, PolicyPreviewResult, PolicyPreviewStudent
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NAT = np.datetime64("NaT", "D")
+
+# Campos del alumno que leen las reglas (para proyectar consultas con `select`)
+POLICY_FIELDS = ("status", "debt", "monthly_fee", "next_payment_date", "scholarship")
+
+
+def _parse_dates(values: List[Optional[str]]) -> np.ndarray:
+    """
+    Convierte fechas 'YYYY-MM-DD' a `datetime64[D]` en una sola operación.
+    Los valores vacíos o inválidos quedan como NaT (ninguna comparación con
+    NaT es verdadera, así que nunca cumplen una regla).
+    """
+    cleaned = [value if isinstance(value, str) and value else "NaT" for value in values]
+    try:
+        return np.array(cleaned, dtype="datetime64[D]")
+    except ValueError:
+        parsed = np.empty(len(cleaned), dtype="datetime64[D]")
+        for i, value in enumerate(cleaned):
+            try:
+                parsed[i] = np.datetime64(value, "D")
+            except ValueError:
+                parsed[i] = _NAT
+        return parsed
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _float_column(values: list) -> np.ndarray:
+    """
+    Columna float64; los valores ausentes o no numéricos se toman como 0.
+    """
+    try:
+        column = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.fromiter((_to_float(value) for value in values), dtype=np.float64, count=len(values))
+    return np.nan_to_num(column, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class StudentColumns:
+    """
+    Instantánea columnar de un conjunto de alumnos: una columna NumPy por
+    atributo que usan las reglas, en el mismo orden que `records`.
+    """
+
+    def __init__(self, records: List[dict]):
+        self.records = records
+        # Una sola pasada en Python para extraer los campos; el resto es NumPy.
+        active, debt, monthly_fee, due_date = [], [], [], []
+        scholarship_start, scholarship_end, scholarship_percentage = [], [], []
+        no_scholarship = {}
+        for record in records:
+            active.append(record.get('status') == 'active')
+            debt.append(record.get('debt'))
+            monthly_fee.append(record.get('monthly_fee'))
+            due_date.append(record.get('next_payment_date'))
+            scholarship = record.get('scholarship') or no_scholarship
+            scholarship_start.append(scholarship.get('start_date'))
+            scholarship_end.append(scholarship.get('end_date'))
+            scholarship_percentage.append(scholarship.get('percentage'))
+
+        self.active = np.array(active, dtype=bool)
+        self.debt = _float_column(debt)
+        self.monthly_fee = _float_column(monthly_fee)
+        self.next_payment_date = _parse_dates(due_date)
+        self.scholarship_start = _parse_dates(scholarship_start)
+        self.scholarship_end = _parse_dates(scholarship_end)
+        self.scholarship_percentage = _float_column(scholarship_percentage)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "StudentColumns":
+        return cls(list(records))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+@dataclass
+class PolicyEvaluation:
+    selected: np.ndarray # Alumnos a los que aplica la acción
+    overdue: np.ndarray # Morosos antes de aplicar la exención por beca
+    exempted: np.ndarray # Morosos exentos por beca vigente
+    days_overdue: np.ndarray
+
+
+def evaluate(columns: StudentColumns, rules: DelinquencyRules, today: date) -> PolicyEvaluation:
+    """
+    Evalúa las reglas sobre toda la cohorte con operaciones vectorizadas:
+    activo, fecha de pago + días de gracia anterior a `today`, deuda mayor al
+    mínimo y, si corresponde, sin beca vigente en `today`.
+    """
+    today64 = np.datetime64(today, "D")
+    days_overdue = (today64 - columns.next_payment_date).astype("timedelta64[D]").astype(np.int64)
+
+    overdue = (
+        columns.active
+        & (columns.next_payment_date + np.timedelta64(rules.grace_days, "D") < today64)
+        & (columns.debt > rules.min_debt)
+    )
+    if rules.exempt_scholarships:
+        scholarship_active = (
+            (columns.scholarship_start <= today64)
+            & (today64 <= columns.scholarship_end)
+            & (columns.scholarship_percentage >= rules.min_exempt_percentage)
+        )
+        exempted = overdue & scholarship_active
+    else:
+        exempted = np.zeros(len(columns), dtype=bool)
+
+    return PolicyEvaluation(selected=overdue & ~exempted, overdue=overdue, exempted=exempted, days_overdue=days_overdue)
+
+
+class DelinquencyPolicyEngine:
+    """
+    Aplica las reglas de morosidad configuradas para cada acción
+    ('reminder' o 'deactivation') a una lista de alumnos.
+    """
+
+    def __init__(self, rules: Dict[str, DelinquencyRules]):
+        self._rules = rules
+
+    def rules(self, action: PolicyAction) -> DelinquencyRules:
+        return self._rules[action]
+
+    def payment_cutoff(self, action: PolicyAction, today: date) -> date:
+        """
+        Primera fecha de pago que aún no cuenta como vencida; sirve para
+        acotar la consulta a Firestore o al índice antes de evaluar.
+        """
+        return date.fromordinal(today.toordinal() - self.rules(action).grace_days)
+
+    def select(self, records: List[dict], action: PolicyAction, today: date) -> List[dict]:
+        """
+        Devuelve los alumnos a los que aplica la acción, en el orden recibido,
+        con `monthly_fee` normalizado a float.
+        """
+        if not records:
+            return []
+        columns = StudentColumns(records)
+        result = evaluate(columns, self.rules(action), today)
+        selected = []
+        for index in np.flatnonzero(result.selected):
+            student = records[index]
+            student['monthly_fee'] = float(columns.monthly_fee[index])
+            selected.append(student)
+        return selected
+
+    def preview(
+        self,
+        records: List[dict],
+        action: PolicyAction,
+        today: date,
+        rules: Optional[DelinquencyRules] = None,
+        limit: int = 100,
+        source: str = "firestore",
+    ) -> PolicyPreviewResult:
+        started = time.perf_counter()
+        rules = rules or self.rules(action)
+        columns = StudentColumns(records)
+        result = evaluate(columns, rules, today)
+
+        indexes = np.flatnonzero(result.selected)
+        # Primero los que llevan más días de atraso
+        listed = indexes[np.argsort(-result.days_overdue[indexes], kind="stable")][:limit]
+        students = [
+            PolicyPreviewStudent(
+                id=records[i]['id'],
+                name=f"{records[i].get('first_name', '')} {records[i].get('last_name', '')}".strip(),
+                email=records[i].get('email'),
+                debt=float(columns.debt[i]),
+                next_payment_date=records[i].get('next_payment_date'),
+                days_overdue=int(result.days_overdue[i]),
+            )
+            for i in listed
+        ]
+        return PolicyPreviewResult(
+            action=action,
+            as_of=today,
+            rules=rules,
+            evaluated=len(columns),
+            matched=int(result.selected.sum()),
+            exempted_by_scholarship=int(result.exempted.sum()),
+            source=source,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+            students=students,
+        )
+
+
+delinquency_policy = DelinquencyPolicyEngine({
+    "reminder": DelinquencyRules(
+        grace_days=settings.DELINQUENCY_REMINDER_GRACE_DAYS,
+        min_debt=settings.DELINQUENCY_MIN_DEBT,
+        exempt_scholarships=settings.DELINQUENCY_EXEMPT_SCHOLARSHIPS,
+    ),
+    "deactivation": DelinquencyRules(
+        grace_days=settings.DELINQUENCY_DEACTIVATION_GRACE_DAYS,
+        min_debt=settings.DELINQUENCY_MIN_DEBT,
+        exempt_scholarships=settings.DELINQUENCY_EXEMPT_SCHOLARSHIPS,
+    ),
+})
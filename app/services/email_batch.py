@@ -0,0 +1,123 @@
+# app/services/email_batch.py
+
+import json
+from typing import AsyncIterable, Iterable, List, Tuple
+from pydantic import BaseModel, ValidationError
+from app.core.config import settings
+from app.services.email_outbox import EMAIL_KINDS, EmailOutbox
+from app.schemas.email import EmailBatchItem, EmailBatchItemError, EmailBatchResult
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 1000
+
+
+class EmailBatch:
+    """
+    Valida un lote de correos elemento por elemento y encola los válidos en
+    bloques de `chunk_size` con `EmailOutbox.enqueue_many` (una transacción
+    por bloque). Un elemento inválido solo se reporta; no rechaza el lote.
+
+    Cada bloque se confirma por separado para no retener todo el lote (o la
+    transacción) mientras llega un cuerpo NDJSON: si uno falla, sus elementos
+    se cuentan en `failed` y se reportan por índice, y los bloques anteriores
+    y siguientes siguen encolados.
+    """
+
+    def __init__(self, outbox: EmailOutbox, chunk_size: int = settings.EMAIL_BATCH_CHUNK_SIZE):
+        self.outbox = outbox
+        self.chunk_size = chunk_size
+        self.result = EmailBatchResult()
+        self._pending: List[Tuple[int, str, BaseModel]] = []
+
+    def _report(self, index: int, kind, errors: List[dict]):
+        if len(self.result.errors) < MAX_REPORTED_ERRORS:
+            self.result.errors.append(EmailBatchItemError(index=index, type=kind, errors=errors))
+        else:
+            self.result.errors_truncated = True
+
+    def _reject(self, index: int, kind, errors: List[dict]):
+        self.result.rejected += 1
+        self._report(index, kind, errors)
+
+    @staticmethod
+    def _errors(exc: ValidationError) -> List[dict]:
+        # `exc.json()` serializa también el contexto de los errores (excepciones, etc.)
+        return json.loads(exc.json(include_url=False, include_input=False))
+
+    async def add(self, index: int, raw) -> bool:
+        """
+        Valida un elemento ya decodificado. Devuelve True si quedó encolado (o pendiente de encolar).
+        """
+        self.result.received += 1
+        try:
+            item = EmailBatchItem.model_validate(raw)
+        except ValidationError as e:
+            self._reject(index, raw.get("type") if isinstance(raw, dict) else None, self._errors(e))
+            return False
+
+        if item.type not in EMAIL_KINDS:
+            self._reject(index, item.type, [{"type": "unknown_email_type", "loc": ["type"], "msg": f"Unknown email type: {item.type}"}])
+            return False
+
+        schema, _ = EMAIL_KINDS[item.type]
+        try:
+            details = schema.model_validate(item.data)
+        except ValidationError as e:
+            self._reject(index, item.type, self._errors(e))
+            return False
+
+        self._pending.append((index, item.type, details))
+        if len(self._pending) >= self.chunk_size:
+            await self.flush()
+        return True
+
+    async def add_line(self, index: int, line: str):
+        """
+        Valida una línea de un cuerpo NDJSON. Las líneas vacías se ignoran.
+        """
+        if not line.strip():
+            return
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            self.result.received += 1
+            self._reject(index, None, [{"type": "json_invalid", "loc": [], "msg": f"Invalid JSON: {e}"}])
+            return
+        await self.add(index, raw)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        chunk, self._pending = self._pending, []
+        try:
+            self.result.queued += await self.outbox.enqueue_many((kind, details) for _, kind, details in chunk)
+        except Exception as e:
+            logger.error("Failed to queue a chunk of %d batch emails (items %d-%d): %s", len(chunk), chunk[0][0], chunk[-1][0], e)
+            self.result.failed += len(chunk)
+            for index, kind, _ in chunk:
+                self._report(index, kind, [{"type": "enqueue_failed", "loc": [], "msg": f"Could not queue the email: {e}"}])
+
+    async def add_all(self, items: Iterable) -> EmailBatchResult:
+        for index, raw in enumerate(items):
+            await self.add(index, raw)
+        await self.flush()
+        return self.result
+
+    async def add_ndjson(self, chunks: AsyncIterable[bytes]) -> EmailBatchResult:
+        """
+        Procesa un cuerpo NDJSON a medida que llega, sin cargarlo completo en memoria.
+        """
+        buffer = b""
+        index = 0
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                await self.add_line(index, line.decode("utf-8", errors="replace"))
+                index += 1
+        if buffer:
+            await self.add_line(index, buffer.decode("utf-8", errors="replace"))
+        await self.flush()
+        return self.result
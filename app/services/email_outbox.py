@@ -0,0 +1,368 @@
+# app/services/email_outbox.py
+
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.local_db import connect_local_db
+from app.core.metrics import metrics, QUEUE_DEPTH
+from app.services.email_service import EmailService, EmailDeliveryError, email_service
+from app.services.smtp_governor import SendDeferred
+from app.schemas.email import (
+    PaymentNotificationEmail,
+    PaymentReminderEmail,
+    ScholarshipNotificationEmail,
+    AccountDeactivationEmail,
+    AccountStatusNotificationEmail,
+    PlatformAssignmentEmail
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tipo de correo -> (schema del payload, método de EmailService que lo envía)
+EMAIL_KINDS: Dict[str, Tuple[Type[BaseModel], str]] = {
+    "payment_notification": (PaymentNotificationEmail, "send_payment_notification"),
+    "payment_reminder": (PaymentReminderEmail, "send_payment_reminder"),
+    "scholarship_notification": (ScholarshipNotificationEmail, "send_scholarship_notification"),
+    "account_deactivation": (AccountDeactivationEmail, "send_account_deactivation_notification"),
+    "account_status": (AccountStatusNotificationEmail, "send_account_status_notification"),
+    "platform_assignment": (PlatformAssignmentEmail, "send_platform_assignment_notification"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (next_attempt_at);
+CREATE TABLE IF NOT EXISTS email_dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+class EmailOutbox:
+    """
+    Cola persistente de correos sobre SQLite (modo WAL).
+
+    Los endpoints solo insertan una fila; un pool de workers asíncronos la
+    consume, reintenta con backoff exponencial y mueve a `email_dead_letters`
+    los correos que agotan sus intentos o que el servidor rechaza de forma
+    permanente. Si el proceso se reinicia, los correos pendientes se retoman.
+
+    Los correos que el governor SMTP difiere (cuota diaria, throttling) se
+    reprograman sin consumir un intento, y mientras el governor indique que
+    hay que esperar, los workers no reclaman más correos.
+
+    Las operaciones sobre SQLite son síncronas y corren en el pool de hilos
+    (`asyncio.to_thread`) para no bloquear el event loop; `enqueue`,
+    `enqueue_many` y `replay_dead_letters` son corrutinas por eso.
+    """
+
+    def __init__(
+        self,
+        email_srv: EmailService,
+        db_path: Optional[str] = None,
+        workers: int = settings.OUTBOX_WORKERS,
+        max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = settings.OUTBOX_BACKOFF_BASE,
+        backoff_max: float = settings.OUTBOX_BACKOFF_MAX,
+        poll_interval: float = settings.OUTBOX_POLL_INTERVAL,
+        lease_seconds: float = settings.OUTBOX_LEASE_SECONDS,
+    ):
+        self.email_srv = email_srv
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+
+        self._conn = None
+        self._lock = threading.RLock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # --- Almacenamiento ---
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = connect_local_db(self.db_path)
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @staticmethod
+    def _row(kind: str, details: BaseModel, now: float) -> tuple:
+        if kind not in EMAIL_KINDS:
+            raise ValueError(f"Unknown email kind: {kind}")
+        return (kind, details.model_dump_json(), now, now)
+
+    def _insert(self, row: tuple) -> int:
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO email_outbox (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                row,
+            )
+        return cursor.lastrowid
+
+    def _insert_many(self, rows: List[tuple]):
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO email_outbox (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def enqueue(self, kind: str, details: BaseModel) -> int:
+        """
+        Guarda un correo para su envío. Es una única inserción, por lo que
+        puede llamarse directamente desde un endpoint.
+        """
+        item_id = await asyncio.to_thread(self._insert, self._row(kind, details, time.time()))
+        self._notify()
+        return item_id
+
+    async def enqueue_many(self, items: Iterable[Tuple[str, BaseModel]]) -> int:
+        """
+        Guarda varios correos en una sola transacción. Devuelve cuántos se encolaron.
+        """
+        now = time.time()
+        rows = [self._row(kind, details, now) for kind, details in items]
+        if not rows:
+            return 0
+        await asyncio.to_thread(self._insert_many, rows)
+        self._notify()
+        return len(rows)
+
+    def _claim(self) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                """
+                UPDATE email_outbox SET locked_until = ?
+                WHERE id = (
+                    SELECT id FROM email_outbox
+                    WHERE next_attempt_at <= ? AND locked_until <= ?
+                    ORDER BY next_attempt_at LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts, created_at
+                """,
+                (now + self.lease_seconds, now, now),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _ack(self, item_id: int):
+        with self._lock:
+            self.conn.execute("DELETE FROM email_outbox WHERE id = ?", (item_id,))
+
+    def _retry_later(self, item: dict, attempts: int, error: str):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        with self._lock:
+            self.conn.execute(
+                "UPDATE email_outbox SET attempts = ?, next_attempt_at = ?, locked_until = 0, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, error, item["id"]),
+            )
+        logger.warning("Outbox email failed, retry %d in %.0fs: %s", attempts, delay, error, extra={"outbox_id": item["id"], "kind": item["kind"]})
+
+    def _defer(self, item: dict, deferred: SendDeferred):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE email_outbox SET next_attempt_at = ?, locked_until = 0, last_error = ? WHERE id = ?",
+                (time.time() + deferred.retry_after, str(deferred), item["id"]),
+            )
+        logger.info("Outbox email deferred %.0fs (%s).", deferred.retry_after, deferred.reason, extra={"outbox_id": item["id"], "kind": item["kind"]})
+
+    def _dead_letter(self, item: dict, attempts: int, error: str):
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO email_dead_letters (kind, payload, attempts, last_error, created_at, failed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (item["kind"], item["payload"], attempts, error, item["created_at"], time.time()),
+                )
+                conn.execute("DELETE FROM email_outbox WHERE id = ?", (item["id"],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        logger.error("Outbox email moved to dead letters after %d attempts: %s", attempts, error, extra={"outbox_id": item["id"], "kind": item["kind"]})
+
+    # --- Entrega ---
+
+    async def _deliver(self, item: dict):
+        schema, method_name = EMAIL_KINDS[item["kind"]]
+        details = schema.model_validate_json(item["payload"])
+        await getattr(self.email_srv, method_name)(details)
+
+    async def _process(self, item: dict):
+        attempts = item["attempts"] + 1
+        try:
+            await self._deliver(item)
+        except SendDeferred as e:
+            await asyncio.to_thread(self._defer, item, e)
+            return
+        except EmailDeliveryError as e:
+            if e.permanent or attempts >= self.max_attempts:
+                await asyncio.to_thread(self._dead_letter, item, attempts, str(e))
+            else:
+                await asyncio.to_thread(self._retry_later, item, attempts, str(e))
+            return
+        except Exception as e:
+            # Payload inválido o error inesperado: reintentar no lo va a arreglar
+            await asyncio.to_thread(self._dead_letter, item, attempts, f"{type(e).__name__}: {e}")
+            return
+        await asyncio.to_thread(self._ack, item["id"])
+
+    async def _step(self):
+        # Backpressure: si el governor no permite enviar ahora, no reclamar correos
+        await self.email_srv.refresh_usage()
+        delay = self.email_srv.send_delay()
+        if delay > 0:
+            await asyncio.sleep(min(delay, self.poll_interval))
+            return
+        item = await asyncio.to_thread(self._claim)
+        if item is None:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            return
+        await self._process(item)
+
+    async def _worker(self):
+        errors = 0
+        while True:
+            try:
+                await self._step()
+                errors = 0
+            except Exception as e:
+                # Un fallo de SQLite o del governor no debe matar al worker: se
+                # registra y se reintenta con backoff (el lease del correo reclamado expira solo)
+                errors += 1
+                delay = min(self.backoff_max, self.poll_interval * (2 ** min(errors - 1, 10)))
+                logger.exception("Outbox worker error, retrying in %.0fs: %s", delay, e)
+                await asyncio.sleep(delay)
+
+    def _on_worker_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Outbox worker died: %s", task.exception())
+
+    async def start(self):
+        """
+        Lanza los workers. Los correos que quedaron reclamados por un proceso
+        anterior no se liberan aquí: la base es compartida por todos los
+        procesos del host y el correo podría estar enviándose ahora mismo.
+        Se reintentan cuando expira su lease (`lease_seconds`).
+        """
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        for task in self._tasks:
+            task.add_done_callback(self._on_worker_done)
+        logger.info("Email outbox started with %d workers.", self.workers)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Email outbox stopped.")
+
+    # --- Administración ---
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self.conn.execute("SELECT COUNT(*) FROM email_outbox").fetchone()[0]
+            dead = self.conn.execute("SELECT COUNT(*) FROM email_dead_letters").fetchone()[0]
+        alive = sum(1 for task in self._tasks if not task.done())
+        died = sum(1 for task in self._tasks if task.done() and not task.cancelled())
+        return {"pending": pending, "dead_letters": dead, "workers": alive, "dead_workers": died}
+
+    def list_dead_letters(self, limit: int = 100, offset: int = 0) -> List[dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM email_dead_letters ORDER BY id DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+    def _move_dead_letters(self, ids: Optional[List[int]]) -> int:
+        where, params = "", ()
+        if ids is not None:
+            where = f"WHERE id IN ({','.join('?' * len(ids))})"
+            params = tuple(ids)
+        now = time.time()
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(
+                    f"INSERT INTO email_outbox (kind, payload, next_attempt_at, created_at) "
+                    f"SELECT kind, payload, ?, created_at FROM email_dead_letters {where}",
+                    (now, *params),
+                )
+                replayed = cursor.rowcount
+                conn.execute(f"DELETE FROM email_dead_letters {where}", params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return replayed
+
+    async def replay_dead_letters(self, ids: Optional[List[int]] = None) -> int:
+        """
+        Devuelve correos del dead-letter al outbox con el contador de intentos
+        reiniciado. Sin `ids`, se reenvían todos.
+        """
+        if ids is not None and not ids:
+            return 0
+        replayed = await asyncio.to_thread(self._move_dead_letters, ids)
+        self._notify()
+        logger.info("Replayed %d dead-letter emails.", replayed)
+        return replayed
+
+
+email_outbox = EmailOutbox(email_srv=email_service)
+
+
+def _collect_queue_depth():
+    stats = email_outbox.stats()
+    QUEUE_DEPTH.labels("email_outbox").set(stats["pending"])
+    QUEUE_DEPTH.labels("email_dead_letters").set(stats["dead_letters"])
+
+
+metrics.add_collector(_collect_queue_depth)
@@ -1,10 +1,18 @@
 # app/services/email_service.py
 
 import aiosmtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.core.config import settings
+from app.core.metrics import EMAILS_SENT, EMAIL_SEND_DURATION, EMAIL_RECIPIENTS, EMAIL_SUPPRESSED
+from app.services.smtp_pool import SMTPConnectionPool
+from app.services.smtp_governor import SendDeferred, SendGovernor
+from app.services.smtp_backends import AUTH_ERROR_CODES, SMTPBackend, SMTPBackendSet, smtp_backends
+from app.services.suppression import SuppressionList, suppression_list
+from app.services.email_templates import Fragment, RenderedEmail, TemplateRegistry, email_templates
 from app.schemas.email import (
+    EmailBase,
     PaymentNotificationEmail, 
     PaymentReminderEmail, 
     ScholarshipNotificationEmail,
@@ -12,158 +20,239 @@ from app.schemas.email import (
     AccountStatusNotificationEmail,
     PlatformAssignmentEmail
 )
-from typing import List
+from typing import List, Optional
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class EmailDeliveryError(Exception):
+    """
+    Error al entregar un correo. `permanent` indica que reintentar el mismo
+    mensaje no tiene sentido (p. ej. destinatario rechazado con 550).
+    """
+
+    def __init__(self, message: str, permanent: bool = False, code: Optional[int] = None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.code = code
+
+    @classmethod
+    def from_smtp_exception(cls, exc: Exception) -> "EmailDeliveryError":
+        if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+            codes = [r.code for r in exc.recipients]
+            permanent = bool(codes) and all(500 <= c < 600 for c in codes)
+            return cls(str(exc), permanent=permanent, code=codes[0] if codes else None)
+        if isinstance(exc, aiosmtplib.SMTPResponseException):
+            permanent = 500 <= exc.code < 600 and exc.code not in AUTH_ERROR_CODES
+            return cls(str(exc), permanent=permanent, code=exc.code)
+        return cls(str(exc))
+
+
 class EmailService:
     """
     Servicio para construir y enviar correos electrónicos de manera asíncrona.
-    """
+    El contenido se genera con las plantillas precompiladas de `email_templates`
+    y los envíos se reparten entre las cuentas de un `SMTPBackendSet`, cada
+    una con su pool de conexiones y su governor (ritmo, presupuesto diario y
+    concurrencia adaptativa), por lo que un envío puede lanzar `SendDeferred`.
 
-    async def _send_email(self, recipients: List[str], subject: str, html_content: str):
-        if not recipients:
-            logger.warning("No recipients provided for email.")
-            return
+    Sin `backends`, se usa una única cuenta 'default' con `pool` (o un pool
+    de la cuenta SMTP_HOST) y el `governor` indicado.
 
-        message = MIMEMultipart("alternative")
-        message["From"] = f"AD Academy <{settings.SMTP_USER}>"
-        message["To"] = ", ".join(recipients)
-        message["Subject"] = subject
-        message.attach(MIMEText(html_content, "html"))
+    Las direcciones de la lista de supresión se descartan al armar los
+    destinatarios, y los rechazos definitivos del servidor (550, ...) se
+    agregan a ella para no volver a gastar un envío en ellas.
+    """
 
-        try:
-            await aiosmtplib.send(
-                message,
+    def __init__(
+        self,
+        pool: Optional[SMTPConnectionPool] = None,
+        templates: Optional[TemplateRegistry] = None,
+        governor: Optional[SendGovernor] = None,
+        backends: Optional[SMTPBackendSet] = None,
+        suppressions: Optional[SuppressionList] = None,
+    ):
+        self.templates = templates or email_templates
+        self.suppressions = suppressions or suppression_list
+        if backends is None:
+            pool = pool or SMTPConnectionPool(
                 hostname=settings.SMTP_HOST,
                 port=settings.SMTP_PORT,
                 username=settings.SMTP_USER,
                 password=settings.SMTP_PASSWORD,
-                start_tls=True,
+                size=settings.SMTP_POOL_SIZE,
+                idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT,
+                max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+                healthcheck_interval=settings.SMTP_POOL_HEALTHCHECK_INTERVAL,
+                timeout=settings.SMTP_TIMEOUT,
             )
-            logger.info(f"Email sent successfully to: {', '.join(recipients)}")
+            backends = SMTPBackendSet([
+                SMTPBackend("default", pool, sender=f"AD Academy <{pool.username}>", governor=governor),
+            ])
+        self.backends = backends
+
+    async def start(self):
+        await self.backends.start()
+
+    async def close(self):
+        await self.backends.close()
+
+    def send_delay(self) -> float:
+        """
+        Segundos hasta que alguna cuenta SMTP pueda enviar (0 si ya puede).
+        """
+        return self.backends.send_delay()
+
+    async def refresh_usage(self):
+        await self.backends.refresh_usage()
+
+    def _recipients(self, details: EmailBase) -> List[str]:
+        """
+        Alumno y apoderado, sin las direcciones suprimidas: si solo la del
+        apoderado lo está, el alumno recibe igualmente su copia.
+        """
+        recipients = []
+        for email in (details.student_email, details.guardian_email):
+            if not email:
+                continue
+            if self.suppressions.is_suppressed(email):
+                EMAIL_SUPPRESSED.inc()
+                logger.info("Skipping suppressed recipient.", extra={"email": email})
+                continue
+            recipients.append(email)
+        return recipients
+
+    def _record_bounces(self, refused: List[tuple]):
+        for email, code, message in refused:
+            if self.suppressions.record_bounce(email, code, message):
+                logger.warning("Recipient hard-bounced, added to the suppression list.", extra={"email": email, "code": code})
+
+    def _build_message(self, recipients: List[str], rendered: RenderedEmail) -> MIMEMultipart:
+        message = MIMEMultipart("alternative")
+        message["From"] = self.backends.backends[0].sender # La cuenta que envía lo reemplaza
+        message["To"] = ", ".join(recipients)
+        message["Subject"] = rendered.subject
+        message.attach(MIMEText(rendered.text, "plain", "utf-8"))
+        message.attach(MIMEText(rendered.html, "html", "utf-8"))
+        return message
+
+    async def _send_email(self, recipients: List[str], rendered: RenderedEmail) -> bool:
+        """
+        Envía el correo y devuelve True si el servidor SMTP lo aceptó.
+        Lanza EmailDeliveryError si no pudo entregarse por ninguna cuenta,
+        para que quien lo invoque (el outbox) decida si reintentar, o
+        `SendDeferred` si los governors piden esperar (cuota agotada o
+        throttling del proveedor).
+        """
+        if not recipients:
+            logger.warning("No recipients provided for email.")
+            return False
+
+        message = self._build_message(recipients, rendered)
+        started = time.perf_counter()
+
+        try:
+            backend, refused = await self.backends.send(message, len(recipients))
+        except SendDeferred as e:
+            logger.warning("Email deferred %.0fs: %s", e.retry_after, e, extra={"recipients": recipients, "reason": e.reason})
+            raise
         except Exception as e:
-            logger.error(f"Failed to send email to {', '.join(recipients)}: {e}")
-
-    async def send_payment_notification(self, details: PaymentNotificationEmail):
-        subject = "Confirmación de Pago - AD Academy"
-        debt_message = (f"<p><strong>Importante:</strong> Tienes un saldo pendiente de <strong>S/ {details.amount_due:.2f}</strong>. "
-                        f"Tienes hasta el <strong>{details.payment_deadline}</strong> para completarlo.</p>") if details.amount_due > 0 else "<p>¡Excelente! No tienes deudas pendientes.</p>"
-        html_content = f"""
-        <html><body><h2>¡Gracias por tu pago, {details.student_name}!</h2><p>Hemos registrado correctamente tu pago en nuestro sistema.</p>
-        <ul><li><strong>Monto Pagado:</strong> S/ {details.payment_amount:.2f}</li><li><strong>Fecha de Pago:</strong> {details.payment_date}</li></ul>
-        {debt_message}<p>Gracias por ser parte de <strong>AD Academy</strong>.</p></body></html>"""
-        recipients = [details.student_email]
-        if details.guardian_email: recipients.append(details.guardian_email)
-        await self._send_email(recipients, subject, html_content)
-
-    async def send_payment_reminder(self, details: PaymentReminderEmail):
-        subject = "Recordatorio de Pago Pendiente - AD Academy"
-        html_content = f"""
-        <html><body><h2>Recordatorio de Pago, {details.student_name}</h2><p>Te escribimos para recordarte que tienes un pago pendiente con la academia.</p>
-        <ul><li><strong>Monto a Pagar:</strong> S/ {details.amount_due:.2f}</li><li><strong>Fecha de Vencimiento:</strong> {details.due_date}</li></ul>
-        <p>Por favor, realiza tu pago a la brevedad para evitar la desactivación de tu cuenta.</p>
-        <p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p></body></html>"""
-        recipients = [details.student_email]
-        if details.guardian_email: recipients.append(details.guardian_email)
-        await self._send_email(recipients, subject, html_content)
-
-    async def send_scholarship_notification(self, details: ScholarshipNotificationEmail):
+            if isinstance(e, aiosmtplib.SMTPRecipientsRefused):
+                self._record_bounces([(r.recipient, r.code, r.message) for r in e.recipients])
+            error = EmailDeliveryError.from_smtp_exception(e)
+            outcome = "rejected" if error.permanent else "failed"
+            EMAILS_SENT.labels(outcome).inc()
+            EMAIL_SEND_DURATION.labels(outcome).observe(time.perf_counter() - started)
+            logger.error("Failed to send email: %s", e, extra={"recipients": recipients, "code": error.code})
+            raise error from e
+
+        latency = time.perf_counter() - started
+        if refused:
+            # El servidor aceptó el correo para el resto de destinatarios
+            self._record_bounces([(email, response.code, response.message) for email, response in refused.items()])
+        EMAILS_SENT.labels("sent").inc()
+        EMAIL_SEND_DURATION.labels("sent").observe(latency)
+        EMAIL_RECIPIENTS.inc(len(recipients) - len(refused))
+        logger.info("Email sent successfully.", extra={"recipients": recipients, "backend": backend.name})
+        return True
+
+    async def send_payment_notification(self, details: PaymentNotificationEmail) -> bool:
+        if details.amount_due > 0:
+            debt_message = self.templates.fragment(
+                "payment_debt_pending",
+                amount_due=f"{details.amount_due:.2f}",
+                payment_deadline=details.payment_deadline,
+            )
+        else:
+            debt_message = self.templates.fragment("payment_no_debt")
+        rendered = self.templates.render(
+            "payment_notification",
+            student_name=details.student_name,
+            payment_amount=f"{details.payment_amount:.2f}",
+            payment_date=details.payment_date,
+            debt_message=debt_message,
+        )
+        return await self._send_email(self._recipients(details), rendered)
+
+    async def send_payment_reminder(self, details: PaymentReminderEmail) -> bool:
+        rendered = self.templates.render(
+            "payment_reminder",
+            student_name=details.student_name,
+            amount_due=f"{details.amount_due:.2f}",
+            due_date=details.due_date,
+        )
+        return await self._send_email(self._recipients(details), rendered)
+
+    async def send_scholarship_notification(self, details: ScholarshipNotificationEmail) -> bool:
         """
         Envía una notificación de beca aplicada.
         """
-        subject = "¡Felicidades! Has recibido una Beca en AD Academy"
-        html_content = f"""
-        <html>
-            <body>
-                <h2>¡Hola, {details.student_name}!</h2>
-                <p>Nos complace informarte que se te ha otorgado una beca en la AD Academy.</p>
-                <ul>
-                    <li><strong>Porcentaje de Beca:</strong> {details.percentage}%</li>
-                    <li><strong>Tu nueva mensualidad es de:</strong> S/ {details.new_monthly_fee:.2f}</li>
-                    <li><strong>Tu próxima fecha de pago es:</strong> {details.next_payment_date}</li>
-                </ul>
-                <p>¡Sigue esforzándote!</p>
-                <p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p>
-            </body>
-        </html>
-        """
-        recipients = [details.student_email]
-        if details.guardian_email:
-            recipients.append(details.guardian_email)
-        await self._send_email(recipients, subject, html_content)
+        rendered = self.templates.render(
+            "scholarship_notification",
+            student_name=details.student_name,
+            percentage=details.percentage,
+            new_monthly_fee=f"{details.new_monthly_fee:.2f}",
+            next_payment_date=details.next_payment_date,
+        )
+        return await self._send_email(self._recipients(details), rendered)
 
-    async def send_account_deactivation_notification(self, details: AccountDeactivationEmail):
+    async def send_account_deactivation_notification(self, details: AccountDeactivationEmail) -> bool:
         """
         Envía una notificación de cuenta inhabilitada por falta de pago.
         """
-        subject = "Notificación: Acceso a la plataforma deshabilitado - AD Academy"
-        html_content = f"""
-        <html>
-            <body>
-                <h2>Hola, {details.student_name}</h2>
-                <p>Te informamos que el acceso a tu cuenta ha sido deshabilitado debido a un pago pendiente.</p>
-                <ul>
-                    <li><strong>Monto pendiente:</strong> S/ {details.amount_due:.2f}</li>
-                </ul>
-                <p>
-                    Para reactivar tu acceso, por favor realiza el pago correspondiente y comunícate con nosotros al 
-                    <strong>957-018-079</strong> para confirmar la operación.
-                </p>
-                <p>Agradecemos tu comprensión.</p>
-                <p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p>
-            </body>
-        </html>
-        """
-        recipients = [details.student_email]
-        if details.guardian_email:
-            recipients.append(details.guardian_email)
-        
-        await self._send_email(recipients, subject, html_content)
-    
-    async def send_account_status_notification(self, details: AccountStatusNotificationEmail):
+        rendered = self.templates.render(
+            "account_deactivation",
+            student_name=details.student_name,
+            amount_due=f"{details.amount_due:.2f}",
+        )
+        return await self._send_email(self._recipients(details), rendered)
+
+    async def send_account_status_notification(self, details: AccountStatusNotificationEmail) -> bool:
         """
         Notifica un cambio en el estado de la cuenta (activada/desactivada).
         """
-        status_text = "ha sido activada" if details.status == "activada" else "ha sido desactivada"
-        subject = f"Tu cuenta de AD Academy {status_text}"
-        
-        message_body = ""
-        if details.status == "activada":
-            message_body = "<p>Nos complace informarte que tu acceso a la plataforma ha sido restaurado. ¡Ya puedes ingresar!</p>"
-        else:
-            message_body = "<p>Te informamos que tu acceso a la plataforma ha sido desactivado por un administrador. Si crees que es un error, por favor comunícate con nosotros.</p>"
+        activated = details.status == "activada"
+        rendered = self.templates.render(
+            "account_status",
+            status_text="ha sido activada" if activated else "ha sido desactivada",
+            student_name=details.student_name,
+            message_body=self.templates.fragment("account_status_activated" if activated else "account_status_deactivated"),
+        )
+        return await self._send_email(self._recipients(details), rendered)
 
-        html_content = f"""
-        <html><body><h2>¡Hola, {details.student_name}!</h2>{message_body}
-        <p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p></body></html>
-        """
-        recipients = [details.student_email]
-        if details.guardian_email: recipients.append(details.guardian_email)
-        await self._send_email(recipients, subject, html_content)
-        
-    async def send_platform_assignment_notification(self, details: PlatformAssignmentEmail):
+    async def send_platform_assignment_notification(self, details: PlatformAssignmentEmail) -> bool:
         """
         Envía una notificación con la lista de plataformas asignadas.
         """
-        subject = "Bienvenido a AD Academy - Tus Plataformas de Estudio"
-        
-        platforms_html = "<ul>"
-        for platform in details.platforms:
-            platforms_html += f"<li><strong>{platform['name']}:</strong> <a href='{platform['url']}'>Acceder aquí</a></li>"
-        platforms_html += "</ul>"
-
-        html_content = f"""
-        <html><body><h2>¡Bienvenido, {details.student_name}!</h2>
-        <p>Gracias por matricularte con nosotros. Tienes acceso a las siguientes plataformas de estudio:</p>
-        {platforms_html}
-        <p>Usa tu correo como usuario y contraseña para acceder a las cuentas. No olvides cambiar tu contraseña en Flyfar.</p>
-        <p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p></body></html>
-        """
-        recipients = [details.student_email]
-        if details.guardian_email: recipients.append(details.guardian_email)
-        await self._send_email(recipients, subject, html_content)
+        platforms = Fragment.join([
+            self.templates.fragment("platform_item", name=platform['name'], url=platform['url'])
+            for platform in details.platforms
+        ])
+        rendered = self.templates.render(
+            "platform_assignment",
+            student_name=details.student_name,
+            platforms=platforms,
+        )
+        return await self._send_email(self._recipients(details), rendered)
 
-email_service = EmailService()
\ No newline at end of file
+email_service = EmailService(backends=smtp_backends)
\ No newline at end of file
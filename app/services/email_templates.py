@@ -0,0 +1,232 @@
+# app/services/email_templates.py
+
+import html
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from string import Template
+from typing import Dict, List
+
+
+class Fragment:
+    """
+    Fragmento ya renderizado (HTML y texto) que se inserta en otra plantilla
+    sin volver a escaparse.
+    """
+    __slots__ = ("html", "text")
+
+    def __init__(self, html: str, text: str):
+        self.html = html
+        self.text = text
+
+    @classmethod
+    def join(cls, fragments: List["Fragment"], html_sep: str = "", text_sep: str = "\n") -> "Fragment":
+        return cls(html_sep.join(f.html for f in fragments), text_sep.join(f.text for f in fragments))
+
+
+@dataclass(frozen=True)
+class RenderedEmail:
+    subject: str
+    html: str
+    text: str
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Convierte el HTML de una plantilla en su versión de texto plano. Se aplica
+    sobre el código fuente de la plantilla (con los `${campo}` intactos), por
+    lo que se ejecuta una sola vez al cargarla y no en cada envío.
+    """
+    _BLOCK_TAGS = {"p", "h1", "h2", "h3", "ul", "ol", "div", "body", "html"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._href = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag == "a":
+            self._href = dict(attrs).get("href")
+
+    def handle_endtag(self, tag):
+        if tag in self._BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag == "a" and self._href:
+            self.parts.append(f" ({self._href})")
+            self._href = None
+
+    def handle_data(self, data):
+        self.parts.append(re.sub(r"\s+", " ", data))
+
+    def text(self) -> str:
+        raw = "".join(self.parts)
+        raw = re.sub(r"[ \t]*\n[ \t]*", "\n", raw)
+        return re.sub(r"\n{3,}", "\n\n", raw).strip()
+
+
+def html_to_text(source: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(source)
+    parser.close()
+    return parser.text()
+
+
+# --- Fragmentos compartidos: se componen una sola vez dentro de cada plantilla ---
+
+HEADER_HTML = "<html><body>"
+SIGNATURE_HTML = "<p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p>"
+FOOTER_HTML = "</body></html>"
+
+
+class EmailTemplate:
+    """
+    Plantilla precompilada: asunto, cuerpo HTML y cuerpo de texto plano.
+
+    Los valores de contexto se escapan automáticamente en el HTML; los
+    `Fragment` se insertan tal cual. La versión de texto se deriva del HTML
+    al construir la plantilla.
+    """
+
+    def __init__(self, subject: str, body: str, signature: bool = True, fragment: bool = False):
+        if not fragment:
+            body = HEADER_HTML + body + (SIGNATURE_HTML if signature else "") + FOOTER_HTML
+        self.subject = Template(subject)
+        self.html = Template(body)
+        self.text = Template(html_to_text(body))
+
+    @staticmethod
+    def _context(values: dict, as_html: bool) -> dict:
+        context = {}
+        for key, value in values.items():
+            if isinstance(value, Fragment):
+                context[key] = value.html if as_html else value.text
+            elif as_html:
+                context[key] = html.escape(str(value), quote=True)
+            else:
+                context[key] = str(value)
+        return context
+
+    def render(self, **values) -> RenderedEmail:
+        text_context = self._context(values, as_html=False)
+        return RenderedEmail(
+            subject=self.subject.substitute(text_context),
+            html=self.html.substitute(self._context(values, as_html=True)),
+            text=self.text.substitute(text_context),
+        )
+
+    def render_fragment(self, **values) -> Fragment:
+        return Fragment(
+            html=self.html.substitute(self._context(values, as_html=True)),
+            text=self.text.substitute(self._context(values, as_html=False)),
+        )
+
+
+class TemplateRegistry:
+    """
+    Registro de plantillas por nombre, cargado una sola vez al iniciar.
+    """
+
+    def __init__(self, templates: Dict[str, EmailTemplate]):
+        self._templates = templates
+
+    def __getitem__(self, name: str) -> EmailTemplate:
+        return self._templates[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def names(self) -> List[str]:
+        return list(self._templates)
+
+    def render(self, template_name: str, /, **values) -> RenderedEmail:
+        return self._templates[template_name].render(**values)
+
+    def fragment(self, template_name: str, /, **values) -> Fragment:
+        return self._templates[template_name].render_fragment(**values)
+
+
+def load_default_templates() -> TemplateRegistry:
+    return TemplateRegistry({
+        # --- Confirmación de pago ---
+        "payment_notification": EmailTemplate(
+            "Confirmación de Pago - AD Academy",
+            "<h2>¡Gracias por tu pago, ${student_name}!</h2><p>Hemos registrado correctamente tu pago en nuestro sistema.</p>"
+            "<ul><li><strong>Monto Pagado:</strong> S/ ${payment_amount}</li><li><strong>Fecha de Pago:</strong> ${payment_date}</li></ul>"
+            "${debt_message}<p>Gracias por ser parte de <strong>AD Academy</strong>.</p>",
+            signature=False,
+        ),
+        "payment_debt_pending": EmailTemplate(
+            "",
+            "<p><strong>Importante:</strong> Tienes un saldo pendiente de <strong>S/ ${amount_due}</strong>. "
+            "Tienes hasta el <strong>${payment_deadline}</strong> para completarlo.</p>",
+            fragment=True,
+        ),
+        "payment_no_debt": EmailTemplate("", "<p>¡Excelente! No tienes deudas pendientes.</p>", fragment=True),
+
+        # --- Recordatorio de pago ---
+        "payment_reminder": EmailTemplate(
+            "Recordatorio de Pago Pendiente - AD Academy",
+            "<h2>Recordatorio de Pago, ${student_name}</h2><p>Te escribimos para recordarte que tienes un pago pendiente con la academia.</p>"
+            "<ul><li><strong>Monto a Pagar:</strong> S/ ${amount_due}</li><li><strong>Fecha de Vencimiento:</strong> ${due_date}</li></ul>"
+            "<p>Por favor, realiza tu pago a la brevedad para evitar la desactivación de tu cuenta.</p>",
+        ),
+
+        # --- Beca ---
+        "scholarship_notification": EmailTemplate(
+            "¡Felicidades! Has recibido una Beca en AD Academy",
+            "<h2>¡Hola, ${student_name}!</h2><p>Nos complace informarte que se te ha otorgado una beca en la AD Academy.</p>"
+            "<ul><li><strong>Porcentaje de Beca:</strong> ${percentage}%</li>"
+            "<li><strong>Tu nueva mensualidad es de:</strong> S/ ${new_monthly_fee}</li>"
+            "<li><strong>Tu próxima fecha de pago es:</strong> ${next_payment_date}</li></ul>"
+            "<p>¡Sigue esforzándote!</p>",
+        ),
+
+        # --- Desactivación por falta de pago ---
+        "account_deactivation": EmailTemplate(
+            "Notificación: Acceso a la plataforma deshabilitado - AD Academy",
+            "<h2>Hola, ${student_name}</h2><p>Te informamos que el acceso a tu cuenta ha sido deshabilitado debido a un pago pendiente.</p>"
+            "<ul><li><strong>Monto pendiente:</strong> S/ ${amount_due}</li></ul>"
+            "<p>Para reactivar tu acceso, por favor realiza el pago correspondiente y comunícate con nosotros al "
+            "<strong>957-018-079</strong> para confirmar la operación.</p><p>Agradecemos tu comprensión.</p>",
+        ),
+
+        # --- Cambio de estado manual ---
+        "account_status": EmailTemplate(
+            "Tu cuenta de AD Academy ${status_text}",
+            "<h2>¡Hola, ${student_name}!</h2>${message_body}",
+        ),
+        "account_status_activated": EmailTemplate(
+            "",
+            "<p>Nos complace informarte que tu acceso a la plataforma ha sido restaurado. ¡Ya puedes ingresar!</p>",
+            fragment=True,
+        ),
+        "account_status_deactivated": EmailTemplate(
+            "",
+            "<p>Te informamos que tu acceso a la plataforma ha sido desactivado por un administrador. "
+            "Si crees que es un error, por favor comunícate con nosotros.</p>",
+            fragment=True,
+        ),
+
+        # --- Asignación de plataformas ---
+        "platform_assignment": EmailTemplate(
+            "Bienvenido a AD Academy - Tus Plataformas de Estudio",
+            "<h2>¡Bienvenido, ${student_name}!</h2>"
+            "<p>Gracias por matricularte con nosotros. Tienes acceso a las siguientes plataformas de estudio:</p>"
+            "<ul>${platforms}</ul>"
+            "<p>Usa tu correo como usuario y contraseña para acceder a las cuentas. No olvides cambiar tu contraseña en Flyfar.</p>",
+        ),
+        "platform_item": EmailTemplate(
+            "",
+            "<li><strong>${name}:</strong> <a href='${url}'>Acceder aquí</a></li>",
+            fragment=True,
+        ),
+    })
+
+
+email_templates = load_default_templates()
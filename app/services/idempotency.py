@@ -0,0 +1,293 @@
+# app/services/idempotency.py
+
+import hashlib
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.core.local_db import connect_local_db
+from app.core.metrics import IDEMPOTENCY_REQUESTS, SEND_LEDGER_CHECKS
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+# Tablas WITHOUT ROWID: la clave primaria es el propio índice, sin un
+# rowid ni un índice aparte. Los cuerpos de respuesta se guardan comprimidos.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint BLOB NOT NULL,
+    status_code INTEGER,
+    media_type TEXT,
+    body BLOB,
+    locked_until REAL NOT NULL DEFAULT 0,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS send_ledger (
+    student_id TEXT NOT NULL,
+    template TEXT NOT NULL,
+    period TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (student_id, template, period)
+) WITHOUT ROWID;
+"""
+
+
+def _digest(*parts) -> bytes:
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode())
+        hasher.update(b"\x00")
+    return hasher.digest()[:16]
+
+
+def request_scope(authorization: Optional[str], uid: Optional[str] = None) -> str:
+    """
+    Ámbito de una clave: las claves de un cliente no chocan con las de otro.
+    Con un token verificado el ámbito es su UID, que se mantiene aunque el
+    token de Firebase se renueve (cada hora); sin él, la cabecera Authorization.
+    """
+    if uid:
+        return _digest("uid", uid).hex()
+    return _digest(authorization or "").hex()
+
+
+def billing_period(student: dict) -> str:
+    """
+    Periodo de facturación ('YYYY-MM') al que corresponde un correo de cobro:
+    el mes de la fecha de pago vencida o, si falta, el mes actual.
+    """
+    due_date = student.get('next_payment_date')
+    if isinstance(due_date, str) and len(due_date) >= 7:
+        return due_date[:7]
+    return time.strftime("%Y-%m")
+
+
+class _LocalStore:
+    """
+    Base de los almacenes sobre la base SQLite local: conexión perezosa,
+    lock propio y purga de filas vencidas como mucho una vez por minuto.
+    Los métodos son síncronos y pueden esperar al lock de escritura de otro
+    proceso (`busy_timeout`); desde el event loop se llaman con
+    `asyncio.to_thread`.
+    """
+    table = ""
+    purge_interval = 60.0
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+        self._last_purge = 0.0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = connect_local_db(self.db_path)
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def _maybe_purge(self, now: float):
+        if now - self._last_purge >= self.purge_interval:
+            self.purge(now)
+
+    def purge(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with self._lock:
+            self._last_purge = now
+            removed = self.conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+        if removed:
+            logger.info("Purged %d expired rows from %s.", removed, self.table)
+        return removed
+
+
+# --- Idempotency-Key ---
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    media_type: Optional[str]
+    body: bytes
+
+
+@dataclass
+class IdempotencyClaim:
+    """
+    Resultado de reclamar una clave:
+    - 'new': la petición debe ejecutarse y su respuesta guardarse con `complete`.
+    - 'replay': ya hay una respuesta guardada en `response`.
+    - 'in_progress': otra petición con la misma clave aún no termina.
+    - 'mismatch': la clave ya se usó con otra petición (método, ruta o cuerpo).
+    """
+    outcome: str
+    response: Optional[StoredResponse] = None
+
+
+class IdempotencyStore(_LocalStore):
+    """
+    Registro de claves `Idempotency-Key`. La primera petición con una clave
+    la reserva (con un lease, por si el proceso muere a mitad) y guarda su
+    respuesta; las repeticiones dentro del TTL reciben esa misma respuesta
+    sin volver a ejecutar el endpoint.
+    """
+    table = "idempotency_keys"
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl: float = settings.IDEMPOTENCY_KEY_TTL,
+        lock_timeout: float = settings.IDEMPOTENCY_LOCK_TIMEOUT,
+    ):
+        super().__init__(db_path)
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    @staticmethod
+    def fingerprint(method: str, path: str, body: bytes) -> bytes:
+        return _digest(method, path, body)
+
+    def claim(self, scope: str, key: str, fingerprint: bytes) -> IdempotencyClaim:
+        now = time.time()
+        self._maybe_purge(now)
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT fingerprint, status_code, media_type, body, locked_until, expires_at "
+                    "FROM idempotency_keys WHERE scope = ? AND key = ?",
+                    (scope, key),
+                ).fetchone()
+                if row is None or row["expires_at"] <= now or (row["status_code"] is None and row["locked_until"] <= now):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO idempotency_keys (scope, key, fingerprint, locked_until, expires_at) VALUES (?, ?, ?, ?, ?)",
+                        (scope, key, fingerprint, now + self.lock_timeout, now + self.ttl),
+                    )
+                    claim = IdempotencyClaim("new")
+                elif row["fingerprint"] != fingerprint:
+                    claim = IdempotencyClaim("mismatch")
+                elif row["status_code"] is None:
+                    claim = IdempotencyClaim("in_progress")
+                else:
+                    body = zlib.decompress(row["body"]) if row["body"] else b""
+                    claim = IdempotencyClaim("replay", StoredResponse(row["status_code"], row["media_type"], body))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        IDEMPOTENCY_REQUESTS.labels(claim.outcome).inc()
+        return claim
+
+    def complete(self, scope: str, key: str, response: StoredResponse):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE idempotency_keys SET status_code = ?, media_type = ?, body = ?, locked_until = 0 WHERE scope = ? AND key = ?",
+                (response.status_code, response.media_type, zlib.compress(response.body), scope, key),
+            )
+
+    def release(self, scope: str, key: str):
+        """
+        Libera una clave sin guardar respuesta (p. ej. tras un error 5xx),
+        para que el cliente pueda reintentar con la misma clave.
+        """
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND status_code IS NULL",
+                (scope, key),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS total, COUNT(status_code) AS completed FROM idempotency_keys WHERE expires_at > ?",
+                (time.time(),),
+            ).fetchone()
+        return {"keys": row["total"], "completed": row["completed"], "in_progress": row["total"] - row["completed"]}
+
+
+# --- Registro de envíos de las tareas programadas ---
+
+class SendLedger(_LocalStore):
+    """
+    Registro de los correos de cobro ya enviados por las tareas programadas,
+    por (alumno, plantilla, periodo de facturación). Antes de enviar, la tarea
+    reclama la entrada; si ya existía (un reintento de la tarea, una ejecución
+    solapada de otro worker del mismo host), el alumno se omite.
+
+    La reserva es un INSERT OR IGNORE atómico, así que dos ejecuciones
+    simultáneas no pueden reclamar el mismo envío.
+    """
+    table = "send_ledger"
+
+    def __init__(self, db_path: Optional[str] = None, ttl: float = settings.SEND_LEDGER_TTL):
+        super().__init__(db_path)
+        self.ttl = ttl
+
+    def claim(self, student_id: str, template: str, period: str) -> bool:
+        return bool(self.claim_many(template, [(student_id, period)]))
+
+    def claim_many(self, template: str, entries: Iterable[Tuple[str, str]]) -> List[str]:
+        """
+        Reclama en una sola transacción los envíos de `template` para cada
+        (id de alumno, periodo). Devuelve los ids que no estaban registrados.
+        """
+        entries = list(entries)
+        if not entries:
+            return []
+        now = time.time()
+        self._maybe_purge(now)
+        claimed = []
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for student_id, period in entries:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO send_ledger (student_id, template, period, sent_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                        (student_id, template, period, now, now + self.ttl),
+                    )
+                    if cursor.rowcount:
+                        claimed.append(student_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        SEND_LEDGER_CHECKS.labels(template, "claimed").inc(len(claimed))
+        SEND_LEDGER_CHECKS.labels(template, "duplicate").inc(len(entries) - len(claimed))
+        return claimed
+
+    def release_many(self, template: str, entries: Iterable[Tuple[str, str]]):
+        """
+        Anula reservas de envíos que al final no se hicieron, para que la
+        próxima ejecución los reintente.
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            self.conn.executemany(
+                "DELETE FROM send_ledger WHERE student_id = ? AND template = ? AND period = ?",
+                [(student_id, template, period) for student_id, period in entries],
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT template, COUNT(*) AS total FROM send_ledger WHERE expires_at > ? GROUP BY template",
+                (time.time(),),
+            ).fetchall()
+        return {row["template"]: row["total"] for row in rows}
+
+
+idempotency_store = IdempotencyStore()
+send_ledger = SendLedger()
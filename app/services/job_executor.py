@@ -0,0 +1,113 @@
+# app/services/job_executor.py
+
+import asyncio
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Union
+from app.core.config import settings
+from app.schemas.cron import JobRunResult
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Una unidad de trabajo devuelve True (enviado), False (fallido) o None (omitido).
+JobUnit = Callable[[Any], Awaitable[Optional[bool]]]
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class JobExecutor:
+    """
+    Ejecuta una unidad de trabajo por alumno con concurrencia acotada.
+
+    En lugar de crear una tarea por elemento, se lanzan `concurrency` workers
+    que consumen el iterable (síncrono o asíncrono) compartido, de modo que
+    cohortes grandes no saturan el event loop ni la memoria.
+    """
+
+    def __init__(self, concurrency: int, task_timeout: float):
+        self.concurrency = max(1, concurrency)
+        self.task_timeout = task_timeout
+
+    async def run(
+        self,
+        job: str,
+        items: Union[Iterable[Any], AsyncIterable[Any]],
+        unit: JobUnit,
+    ) -> JobRunResult:
+        result = JobRunResult(job=job)
+        latencies: List[float] = []
+        started = time.perf_counter()
+
+        done = object()
+        if hasattr(items, "__aiter__"):
+            source = items.__aiter__()
+
+            async def next_item():
+                try:
+                    return await source.__anext__()
+                except StopAsyncIteration:
+                    return done
+        else:
+            source = iter(items)
+
+            async def next_item():
+                return next(source, done)
+
+        lock = asyncio.Lock()
+
+        async def worker():
+            while True:
+                async with lock:
+                    item = await next_item()
+                if item is done:
+                    return
+                result.total += 1
+                unit_started = time.perf_counter()
+                try:
+                    outcome = await asyncio.wait_for(unit(item), timeout=self.task_timeout)
+                except asyncio.TimeoutError:
+                    logger.error("JOB %s: unit timed out after %ss.", job, self.task_timeout, extra={"job": job})
+                    result.failed += 1
+                    result.timed_out += 1
+                    continue
+                except Exception as e:
+                    logger.error("JOB %s: unit failed: %s", job, e, extra={"job": job})
+                    result.failed += 1
+                    continue
+                finally:
+                    latencies.append((time.perf_counter() - unit_started) * 1000)
+
+                if outcome is None:
+                    result.skipped += 1
+                elif outcome:
+                    result.sent += 1
+                else:
+                    result.failed += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        latencies.sort()
+        result.duration_seconds = round(time.perf_counter() - started, 3)
+        result.latency_ms = {
+            "p50": round(_percentile(latencies, 50), 2),
+            "p95": round(_percentile(latencies, 95), 2),
+            "p99": round(_percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        }
+        logger.info(
+            "JOB %s: finished in %ss. total=%d sent=%d failed=%d skipped=%d p95=%sms",
+            job, result.duration_seconds, result.total, result.sent, result.failed, result.skipped, result.latency_ms["p95"],
+            extra={"job": job, "total": result.total, "sent": result.sent, "failed": result.failed, "skipped": result.skipped},
+        )
+        return result
+
+
+cron_executor = JobExecutor(
+    concurrency=settings.CRON_CONCURRENCY,
+    task_timeout=settings.CRON_TASK_TIMEOUT,
+)
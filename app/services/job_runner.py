@@ -0,0 +1,334 @@
+# app/services/job_runner.py
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
+from app.core.config import settings
+from app.core.local_db import connect_local_db, ensure_columns
+from app.core.logs import log_context
+from app.core.profiling import profiler
+from app.core.metrics import CRON_RUNS, CRON_DURATION, CRON_THROUGHPUT, CRON_ITEMS, CRON_LAST_RUN
+from app.schemas.cron import JobRunResult
+from app.services.cluster import ClusterCoordinator, Shard, cluster_coordinator
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    duration_seconds REAL,
+    total INTEGER,
+    sent INTEGER,
+    failed INTEGER,
+    skipped INTEGER,
+    error TEXT,
+    result TEXT,
+    worker TEXT,
+    shard TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job_id, started_at);
+"""
+
+
+class JobAlreadyRunningError(Exception):
+    pass
+
+
+@dataclass
+class RegisteredJob:
+    job_id: str
+    name: str
+    func: Callable[[Optional[Shard]], Awaitable[JobRunResult]]
+    trigger: BaseTrigger
+    timeout: float
+
+
+class JobRunner:
+    """
+    Ejecuta las tareas programadas como corrutinas dentro del mismo proceso,
+    sin pasar por HTTP. Cada ejecución tiene un timeout, nunca corre dos veces
+    en paralelo y queda registrada en la tabla SQLite `job_runs` con su
+    duración y contadores.
+
+    Con varios workers o réplicas, el `ClusterCoordinator` decide si una
+    ejecución programada corre en este proceso y sobre qué porción de alumnos.
+    Las ejecuciones manuales (HTTP o admin) siempre procesan todo el conjunto.
+    En modo sharded, los shards cuyo worker murió sin terminarlos quedan
+    registrados con estado 'orphaned' (ver `ClusterCoordinator`).
+    """
+
+    def __init__(self, coordinator: ClusterCoordinator, db_path: Optional[str] = None):
+        self.coordinator = coordinator
+        self.db_path = db_path
+        self.jobs: Dict[str, RegisteredJob] = {}
+        self.scheduler: Optional[AsyncIOScheduler] = None
+        self._running: set = set()
+        self._tasks: set = set()
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = connect_local_db(self.db_path)
+                    conn.executescript(_SCHEMA)
+                    ensure_columns(conn, "job_runs", {"worker": "TEXT", "shard": "TEXT"})
+                    self._conn = conn
+        return self._conn
+
+    def register(
+        self,
+        job_id: str,
+        name: str,
+        func: Callable[[Optional[Shard]], Awaitable[JobRunResult]],
+        trigger: BaseTrigger,
+        timeout: float = settings.CRON_JOB_TIMEOUT,
+    ):
+        self.jobs[job_id] = RegisteredJob(job_id, name, func, trigger, timeout)
+
+    def schedule(self, scheduler: AsyncIOScheduler):
+        """
+        Agrega las tareas registradas al scheduler. Si el proceso estuvo dormido
+        y se perdieron varias ejecuciones, se ejecuta solo una (coalesce) siempre
+        que no haya pasado más de `CRON_MISFIRE_GRACE_TIME` segundos.
+        Las ejecuciones que siguen 'running' más allá del timeout (p. ej. por un
+        reinicio) se marcan como 'interrupted'.
+        """
+        with self._lock:
+            self.conn.execute(
+                "UPDATE job_runs SET status = 'interrupted' WHERE status = 'running' AND started_at < ?",
+                (time.time() - settings.CRON_JOB_TIMEOUT,),
+            )
+        self.scheduler = scheduler
+        for job in self.jobs.values():
+            scheduler.add_job(
+                self.run,
+                job.trigger,
+                args=[job.job_id, "scheduled"],
+                id=job.job_id,
+                name=job.name,
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1,
+                misfire_grace_time=settings.CRON_MISFIRE_GRACE_TIME,
+            )
+
+    def _run_key(self, job: RegisteredJob) -> str:
+        """
+        Identifica la ejecución programada que acaba de dispararse con su hora
+        de disparo según el trigger (no la hora real, que varía entre
+        workers), para que todos los workers compartan el mismo plan.
+        """
+        now = datetime.now(getattr(job.trigger, "timezone", None)).astimezone()
+        fire_time = job.trigger.get_next_fire_time(None, now - timedelta(seconds=settings.CRON_MISFIRE_GRACE_TIME))
+        return f"{job.job_id}-{(fire_time or now):%Y%m%dT%H%M%S}"
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._running
+
+    def _start_record(self, job_id: str, trigger: str, shard: Optional[Shard]) -> int:
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO job_runs (job_id, trigger, status, started_at, worker, shard) VALUES (?, ?, 'running', ?, ?, ?)",
+                (job_id, trigger, time.time(), self.coordinator.worker_id, str(shard) if shard else None),
+            )
+        return cursor.lastrowid
+
+    def _record_metrics(self, job_id: str, status: str, duration: float, result: Optional[JobRunResult]):
+        CRON_RUNS.labels(job_id, status).inc()
+        CRON_DURATION.labels(job_id).set(duration)
+        CRON_LAST_RUN.labels(job_id).set(time.time())
+        if result is not None:
+            CRON_THROUGHPUT.labels(job_id).set(result.total / duration if duration > 0 else 0.0)
+            CRON_ITEMS.labels(job_id, "sent").set(result.sent)
+            CRON_ITEMS.labels(job_id, "failed").set(result.failed)
+            CRON_ITEMS.labels(job_id, "skipped").set(result.skipped)
+
+    def _finish_record(self, run_id: int, status: str, started: float, result: Optional[JobRunResult] = None, error: Optional[str] = None):
+        finished = time.time()
+        with self._lock:
+            self.conn.execute(
+                """
+                UPDATE job_runs SET status = ?, finished_at = ?, duration_seconds = ?,
+                    total = ?, sent = ?, failed = ?, skipped = ?, error = ?, result = ?
+                WHERE id = ?
+                """,
+                (
+                    status, finished, round(finished - started, 3),
+                    result.total if result else None,
+                    result.sent if result else None,
+                    result.failed if result else None,
+                    result.skipped if result else None,
+                    error,
+                    result.model_dump_json() if result else None,
+                    run_id,
+                ),
+            )
+
+    async def _reserve(self, job_id: str, trigger: str, shard: Optional[Shard]) -> int:
+        """
+        Marca la tarea como en curso antes del primer await, así que dos
+        llamadas no pueden reservar la misma tarea, y luego crea su registro
+        (en el pool de hilos, como todas las escrituras en SQLite).
+        Lanza JobAlreadyRunningError si ya está en curso.
+        """
+        if job_id in self._running:
+            raise JobAlreadyRunningError(f"Job {job_id} is already running.")
+        self._running.add(job_id)
+        try:
+            return await asyncio.to_thread(self._start_record, job_id, trigger, shard)
+        except BaseException:
+            self._running.discard(job_id)
+            raise
+
+    async def run(self, job_id: str, trigger: str = "manual") -> Optional[dict]:
+        """
+        Ejecuta una tarea y devuelve el registro de la ejecución, o None si el
+        coordinador indicó que a este proceso no le toca.
+        Lanza JobAlreadyRunningError si la tarea ya está en curso.
+        """
+        job = self.jobs[job_id]
+        if job_id in self._running:
+            raise JobAlreadyRunningError(f"Job {job_id} is already running.")
+
+        shard = None
+        if trigger == "scheduled":
+            plan = await self.coordinator.plan_run(self._run_key(job))
+            if not plan.run:
+                logger.info("JOB RUNNER: Skipping '%s' on worker %s: %s.", job_id, self.coordinator.worker_id, plan.reason, extra={"job": job_id})
+                return None
+            shard = plan.shard
+
+        run_id = await self._reserve(job_id, trigger, shard)
+        return await self._execute(job, run_id, trigger, shard)
+
+    async def submit(self, job_id: str, trigger: str) -> dict:
+        """
+        Reserva una ejecución de todo el conjunto y la lanza en segundo plano.
+        Devuelve el registro recién creado (estado 'running'); el resultado se
+        consulta después en el historial de ejecuciones.
+        Lanza JobAlreadyRunningError si la tarea ya está en curso.
+        """
+        job = self.jobs[job_id]
+        run_id = await self._reserve(job_id, trigger, None)
+        task = asyncio.create_task(self._execute(job, run_id, trigger, None))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await asyncio.to_thread(self.get_run, run_id)
+
+    async def _execute(self, job: RegisteredJob, run_id: int, trigger: str, shard: Optional[Shard]) -> Optional[dict]:
+        job_id = job.job_id
+        started = time.time()
+        status = None
+        # Los logs de la ejecución (también los de cada alumno) llevan su run_id
+        with log_context(run_id=f"{job_id}-{run_id}"):
+            logger.info("JOB RUNNER: Starting '%s' (run %d, trigger=%s, shard=%s).", job_id, run_id, trigger, shard or "all", extra={"job": job_id, "trigger": trigger})
+            try:
+                async with profiler.maybe_profile("job", job_id):
+                    result = await asyncio.wait_for(job.func(shard), timeout=job.timeout)
+                status = "success"
+                await asyncio.to_thread(self._finish_record, run_id, "success", started, result=result)
+                self._record_metrics(job_id, "success", time.time() - started, result)
+            except asyncio.TimeoutError:
+                status = "timeout"
+                logger.error("JOB RUNNER: '%s' timed out after %ss.", job_id, job.timeout, extra={"job": job_id})
+                await asyncio.to_thread(self._finish_record, run_id, "timeout", started, error=f"Timed out after {job.timeout}s")
+                self._record_metrics(job_id, "timeout", time.time() - started, None)
+            except Exception as e:
+                status = "failed"
+                logger.error("JOB RUNNER: '%s' failed: %s", job_id, e, extra={"job": job_id})
+                await asyncio.to_thread(self._finish_record, run_id, "failed", started, error=str(e))
+                self._record_metrics(job_id, "failed", time.time() - started, None)
+            finally:
+                self._running.discard(job_id)
+            if shard is not None and shard.plan is not None:
+                await self._finish_shard(job_id, trigger, shard, status)
+        return await asyncio.to_thread(self.get_run, run_id)
+
+    def _record_orphans(self, job_id: str, trigger: str, shard: Shard, orphaned: Dict[int, str]):
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO job_runs (job_id, trigger, status, started_at, finished_at, error, worker, shard) "
+                "VALUES (?, ?, 'orphaned', ?, ?, ?, ?, ?)",
+                [
+                    (
+                        job_id, trigger, now, now,
+                        f"Worker left the cluster before finishing shard {Shard(index, shard.count)} of run {shard.plan.key}",
+                        worker, str(Shard(index, shard.count)),
+                    )
+                    for index, worker in orphaned.items()
+                ],
+            )
+
+    async def _check_orphans(self, job_id: str, trigger: str, shard: Shard):
+        try:
+            orphaned = await self.coordinator.orphaned_shards(shard)
+            if orphaned:
+                await asyncio.to_thread(self._record_orphans, job_id, trigger, shard, orphaned)
+                CRON_RUNS.labels(job_id, "orphaned").inc(len(orphaned))
+                logger.error(
+                    "JOB RUNNER: %d shards of run %s were not processed: %s.",
+                    len(orphaned), shard.plan.key, orphaned, extra={"job": job_id},
+                )
+        except Exception as e:
+            logger.error("JOB RUNNER: could not check the shards of run %s: %s", shard.plan.key, e, extra={"job": job_id})
+
+    async def _finish_shard(self, job_id: str, trigger: str, shard: Shard, status: str):
+        """
+        Marca el shard como terminado en el plan compartido y, en el lector,
+        revisa en segundo plano qué shards quedaron huérfanos.
+        """
+        try:
+            await asyncio.to_thread(shard.plan.mark_done, shard.index, status)
+        except Exception as e:
+            logger.error("JOB RUNNER: could not mark shard %s of run %s as done: %s", shard, shard.plan.key, e, extra={"job": job_id})
+        if shard.is_reader:
+            task = asyncio.create_task(self._check_orphans(job_id, trigger, shard))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def get_run(self, run_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM job_runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_runs(self, job_id: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query, params = "SELECT * FROM job_runs", []
+        if job_id:
+            query += " WHERE job_id = ?"
+            params.append(job_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_jobs(self) -> List[dict]:
+        jobs = []
+        for job in self.jobs.values():
+            scheduled = self.scheduler.get_job(job.job_id) if self.scheduler else None
+            jobs.append({
+                "id": job.job_id,
+                "name": job.name,
+                "timeout": job.timeout,
+                "running": self.is_running(job.job_id),
+                "next_run_time": scheduled.next_run_time.isoformat() if scheduled and scheduled.next_run_time else None,
+            })
+        return jobs
+
+
+job_runner = JobRunner(coordinator=cluster_coordinator)
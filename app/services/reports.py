@@ -0,0 +1,109 @@
+# app/services/reports.py
+
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, List, Optional, Sequence
+from app.core.metrics import REPORT_ROWS
+from app.schemas.report import DEFAULT_STUDENT_REPORT_FIELDS, STUDENT_REPORT_FIELDS, ReportFormat
+import logging
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def parse_fields(raw: Optional[str]) -> List[str]:
+    """
+    Columnas pedidas como 'id,email,guardian.email', en ese orden y sin
+    repetir. Lanza ValueError si alguna no está permitida.
+    """
+    if not raw:
+        return list(DEFAULT_STUDENT_REPORT_FIELDS)
+    fields = list(dict.fromkeys(field.strip() for field in raw.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in STUDENT_REPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos no permitidos: {', '.join(unknown)}. Permitidos: {', '.join(STUDENT_REPORT_FIELDS)}.")
+    return fields
+
+
+def firestore_fields(fields: Iterable[str]) -> List[str]:
+    """
+    Rutas a proyectar en Firestore: el id del documento no es un campo.
+    """
+    return [field for field in fields if field != "id"]
+
+
+def _get_path(record: dict, path: str):
+    value = record
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+class ReportEncoder:
+    """
+    Convierte páginas de registros en trozos de texto NDJSON o CSV con las
+    columnas `fields`. Cada página se codifica de una vez, así que la
+    respuesta avanza página a página y nunca hay más de una en memoria.
+    """
+
+    def __init__(self, fields: Sequence[str], format: ReportFormat):
+        self.fields = list(fields)
+        self.format = format
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def _csv(self, rows: Iterable[list]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+    def header(self) -> str:
+        return self._csv([self.fields]) if self.format == "csv" else ""
+
+    def encode_rows(self, records: List[dict]) -> str:
+        if self.format == "ndjson":
+            return "".join(
+                json.dumps({field: _get_path(record, field) for field in self.fields}, ensure_ascii=False, default=str) + "\n"
+                for record in records
+            )
+        return self._csv([_csv_value(_get_path(record, field)) for field in self.fields] for record in records)
+
+
+async def stream_report(report: str, pages: AsyncIterator[List[dict]], encoder: ReportEncoder) -> AsyncIterator[str]:
+    """
+    Cuerpo de un `StreamingResponse`: la cabecera (en CSV) sale de
+    inmediato, antes de la primera lectura a Firestore, y luego un trozo por
+    página de `pages`.
+    """
+    rows = 0
+    header = encoder.header()
+    if header:
+        yield header
+    try:
+        async for page in pages:
+            rows += len(page)
+            yield encoder.encode_rows(page)
+    except Exception as e:
+        # Los encabezados HTTP ya se enviaron: solo queda cortar la respuesta
+        logger.error("Report '%s' failed after %d rows: %s", report, rows, e, extra={"report": report})
+        raise
+    finally:
+        REPORT_ROWS.labels(report, encoder.format).inc(rows)
+    logger.info("Report '%s' streamed %d rows (%s).", report, rows, encoder.format, extra={"report": report, "rows": rows})
@@ -0,0 +1,370 @@
+# app/services/smtp_backends.py
+
+import asyncio
+import time
+from collections import deque
+from email.message import Message
+from typing import Dict, List, Optional, Set, Tuple
+import aiosmtplib
+from app.core.config import settings, SMTPBackendSettings
+from app.core.metrics import (
+    metrics,
+    SMTP_BACKEND_SENDS,
+    SMTP_BACKEND_UP,
+    SMTP_CONCURRENCY_LIMIT,
+    SMTP_DAILY_BUDGET_REMAINING,
+    SMTP_DAILY_RECIPIENTS,
+    SMTP_FAILOVERS,
+)
+from app.services.smtp_governor import SendDeferred, SendGovernor
+from app.services.smtp_pool import SMTPConnectionPool
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Códigos con los que el servidor rechaza la cuenta (credenciales, autenticación requerida)
+AUTH_ERROR_CODES = {530, 534, 535}
+
+# Errores de conexión: el problema es de la cuenta o del servidor, no del mensaje
+_CONNECTION_ERRORS = (
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPTimeoutError,
+    asyncio.TimeoutError,
+    OSError,
+)
+
+THROUGHPUT_WINDOW = 60.0
+
+
+class SMTPBackendsUnavailable(Exception):
+    """
+    Ninguna cuenta SMTP está disponible (todas en pausa tras fallar).
+    Es un error temporal: el outbox reintenta el correo más tarde.
+    """
+
+
+def _smtp_code(exc: BaseException) -> Optional[int]:
+    return getattr(exc, "code", None) if isinstance(exc, aiosmtplib.SMTPResponseException) else None
+
+
+def _is_auth_error(exc: BaseException) -> bool:
+    return isinstance(exc, aiosmtplib.SMTPAuthenticationError) or _smtp_code(exc) in AUTH_ERROR_CODES
+
+
+def _is_backend_error(exc: BaseException) -> bool:
+    """
+    True si el fallo se debe a la cuenta o a la conexión y el mismo mensaje
+    puede enviarse por otra cuenta.
+    """
+    return _is_auth_error(exc) or isinstance(exc, _CONNECTION_ERRORS)
+
+
+class SMTPBackend:
+    """
+    Una cuenta SMTP: su pool de conexiones, su governor (cuota y ritmo
+    propios) y su estado de salud. Tras un fallo de conexión la cuenta sale
+    de la rotación `retry_base` segundos, el doble con cada fallo seguido y
+    como mucho `retry_max`; un fallo de autenticación la saca `retry_max`
+    directamente. El primer envío que sale bien la devuelve a la rotación.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pool: SMTPConnectionPool,
+        sender: str,
+        governor: Optional[SendGovernor] = None,
+        weight: float = 1.0,
+        retry_base: float = settings.SMTP_BACKEND_RETRY_BASE,
+        retry_max: float = settings.SMTP_BACKEND_RETRY_MAX,
+    ):
+        self.name = name
+        self.pool = pool
+        self.sender = sender
+        self.governor = governor
+        self.weight = max(0.0, weight)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+        # Salud
+        self.down_until = 0.0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+
+        # Throughput
+        self.sent = 0
+        self.failed = 0
+        self._recent: deque = deque() # Instantes de los envíos aceptados en la última ventana
+
+        self._current_weight = 0.0 # Round robin ponderado suave
+
+    def available(self, now: Optional[float] = None) -> bool:
+        return self.weight > 0 and (now or time.monotonic()) >= self.down_until
+
+    def send_delay(self) -> float:
+        return self.governor.send_delay() if self.governor is not None else 0.0
+
+    async def refresh_usage(self):
+        if self.governor is not None:
+            await self.governor.refresh_usage()
+
+    def mark_success(self):
+        if self.consecutive_failures:
+            logger.info("SMTP backend '%s' recovered after %d failures.", self.name, self.consecutive_failures, extra={"backend": self.name})
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def mark_down(self, exc: BaseException):
+        self.consecutive_failures += 1
+        if _is_auth_error(exc):
+            pause = self.retry_max
+        else:
+            pause = min(self.retry_max, self.retry_base * (2 ** (self.consecutive_failures - 1)))
+        self.down_until = time.monotonic() + pause
+        self.last_error = f"{type(exc).__name__}: {exc}"
+        logger.warning("SMTP backend '%s' out of rotation for %.0fs: %s", self.name, pause, self.last_error, extra={"backend": self.name})
+
+    def _record(self, outcome: str):
+        SMTP_BACKEND_SENDS.labels(self.name, outcome).inc()
+        if outcome == "sent":
+            self.sent += 1
+            self._recent.append(time.monotonic())
+        elif outcome == "failed":
+            self.failed += 1
+
+    def throughput(self) -> int:
+        """
+        Correos aceptados en el último minuto.
+        """
+        cutoff = time.monotonic() - THROUGHPUT_WINDOW
+        while self._recent and self._recent[0] < cutoff:
+            self._recent.popleft()
+        return len(self._recent)
+
+    async def send(self, message: Message, recipients: int) -> Dict[str, aiosmtplib.SMTPResponse]:
+        """
+        Envía el mensaje por esta cuenta (con su remitente), pasando antes
+        por su governor, y devuelve los destinatarios que el servidor rechazó
+        (si aceptó al menos uno). Lanza `SendDeferred` si el governor lo
+        difiere o la excepción original del envío si falla.
+        """
+        del message["From"]
+        message["From"] = self.sender
+        governor = self.governor
+        if governor is not None:
+            try:
+                await governor.acquire(recipients)
+            except SendDeferred:
+                self._record("deferred")
+                raise
+        started = time.perf_counter()
+
+        try:
+            result = await self.pool.send_message(message)
+        except Exception as e:
+            if _is_backend_error(e):
+                self.mark_down(e)
+            self._record("failed")
+            if governor is not None:
+                deferred = await governor.on_failure(recipients, _smtp_code(e), str(e))
+                if deferred is not None:
+                    raise deferred from e
+            raise
+        except BaseException:
+            # Cancelado (p. ej. al apagar): el hueco del governor no debe perderse
+            if governor is not None:
+                await governor.release(recipients)
+            raise
+
+        if governor is not None:
+            governor.on_success(time.perf_counter() - started)
+        self.mark_success()
+        self._record("sent")
+        return result[0] if result else {}
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "host": f"{self.pool.hostname}:{self.pool.port}",
+            "sender": self.sender,
+            "weight": self.weight,
+            "healthy": self.available(now),
+            "down_for_seconds": round(max(0.0, self.down_until - now), 1),
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "sent": self.sent,
+            "failed": self.failed,
+            "sent_last_minute": self.throughput(),
+            "governor": self.governor.stats() if self.governor is not None else None,
+        }
+
+
+class SMTPBackendSet:
+    """
+    Reparte los envíos entre varias cuentas SMTP con un round robin
+    ponderado suave (como el de nginx), prefiriendo las cuentas cuyo governor
+    permite enviar ya. Si una cuenta falla por conexión o autenticación, el
+    mismo mensaje se reintenta en la siguiente; los rechazos del mensaje o
+    del destinatario no se reintentan en otra cuenta. Si todas difieren el
+    envío, se propaga el `SendDeferred` que antes permite reintentar.
+    """
+
+    def __init__(self, backends: List[SMTPBackend]):
+        if not backends:
+            raise ValueError("At least one SMTP backend is required.")
+        names = [backend.name for backend in backends]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate SMTP backend names: {names}")
+        self.backends = backends
+
+    async def start(self):
+        await asyncio.gather(*(backend.pool.start() for backend in self.backends))
+
+    async def close(self):
+        await asyncio.gather(*(backend.pool.close() for backend in self.backends))
+
+    def _pick(self, exclude: Set[str]) -> Optional[SMTPBackend]:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.name not in exclude and b.available(now)]
+        if not candidates:
+            return None
+        ready = [b for b in candidates if b.send_delay() <= 0] or candidates
+        total = sum(b.weight for b in ready)
+        for backend in ready:
+            backend._current_weight += backend.weight
+        chosen = max(ready, key=lambda b: b._current_weight)
+        chosen._current_weight -= total
+        return chosen
+
+    async def send(self, message: Message, recipients: int) -> Tuple[SMTPBackend, Dict[str, aiosmtplib.SMTPResponse]]:
+        """
+        Envía el mensaje por alguna cuenta disponible. Devuelve la cuenta que
+        lo entregó y los destinatarios que su servidor rechazó.
+        """
+        tried: Set[str] = set()
+        deferrals: List[SendDeferred] = []
+        last_error: Optional[BaseException] = None
+        failed_backend: Optional[str] = None
+        while True:
+            backend = self._pick(tried)
+            if backend is None:
+                break
+            if failed_backend is not None:
+                SMTP_FAILOVERS.inc()
+                logger.warning("SMTP backend '%s' failed (%s), failing over to '%s'.", failed_backend, type(last_error).__name__, backend.name, extra={"backend": backend.name})
+                failed_backend = None
+            tried.add(backend.name)
+            try:
+                return backend, await backend.send(message, recipients)
+            except SendDeferred as e:
+                deferrals.append(e)
+            except Exception as e:
+                if not _is_backend_error(e):
+                    raise
+                last_error = e
+                failed_backend = backend.name
+
+        if deferrals:
+            raise min(deferrals, key=lambda d: d.retry_after)
+        if last_error is not None:
+            raise last_error
+        raise SMTPBackendsUnavailable("All SMTP backends are out of rotation after recent failures.")
+
+    def send_delay(self) -> float:
+        """
+        Segundos hasta que alguna cuenta pueda enviar: la menor espera de
+        sus governors o, si todas están fuera de rotación, lo que falta para
+        que vuelva la primera.
+        """
+        now = time.monotonic()
+        available = [b for b in self.backends if b.available(now)]
+        if available:
+            return min(b.send_delay() for b in available)
+        return max(0.0, min(b.down_until for b in self.backends) - now)
+
+    async def refresh_usage(self):
+        """
+        Relee el presupuesto diario de cada governor (en el pool de hilos)
+        para que `send_delay` y `_pick` trabajen con datos recientes.
+        """
+        await asyncio.gather(*(b.refresh_usage() for b in self.backends))
+
+    def stats(self) -> dict:
+        backends = [backend.stats() for backend in self.backends]
+        return {
+            "healthy": sum(1 for b in backends if b["healthy"]),
+            "total": len(backends),
+            "sent_last_minute": sum(b["sent_last_minute"] for b in backends),
+            "backends": backends,
+        }
+
+
+def _default_sender(user: str) -> str:
+    return f"AD Academy <{user}>"
+
+
+def _build_backend(config: SMTPBackendSettings) -> SMTPBackend:
+    pool_size = config.pool_size or settings.SMTP_POOL_SIZE
+    pool = SMTPConnectionPool(
+        hostname=config.host,
+        port=config.port,
+        username=config.user,
+        password=config.password,
+        size=pool_size,
+        idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT,
+        max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+        healthcheck_interval=settings.SMTP_POOL_HEALTHCHECK_INTERVAL,
+        timeout=settings.SMTP_TIMEOUT,
+        start_tls=config.start_tls,
+    )
+    governor = None
+    if settings.SMTP_GOVERNOR_ENABLED:
+        governor = SendGovernor(
+            name=config.name,
+            rate=config.rate_per_second if config.rate_per_second is not None else settings.SMTP_RATE_PER_SECOND,
+            burst=config.rate_burst if config.rate_burst is not None else settings.SMTP_RATE_BURST,
+            daily_limit=config.daily_limit if config.daily_limit is not None else settings.SMTP_DAILY_LIMIT,
+            max_concurrency=pool_size,
+        )
+    return SMTPBackend(
+        name=config.name,
+        pool=pool,
+        sender=config.sender or _default_sender(config.user),
+        governor=governor,
+        weight=config.weight,
+    )
+
+
+def build_backends() -> SMTPBackendSet:
+    """
+    Cuentas de `SMTP_BACKENDS` o, si no hay ninguna, la cuenta única de
+    SMTP_HOST/SMTP_USER con el nombre 'default'.
+    """
+    configs = settings.SMTP_BACKENDS or [SMTPBackendSettings(
+        name="default",
+        host=settings.SMTP_HOST,
+        port=settings.SMTP_PORT,
+        user=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD,
+    )]
+    return SMTPBackendSet([_build_backend(config) for config in configs])
+
+
+smtp_backends = build_backends()
+
+
+def _collect_backends():
+    now = time.monotonic()
+    for backend in smtp_backends.backends:
+        SMTP_BACKEND_UP.labels(backend.name).set(1 if backend.available(now) else 0)
+        governor = backend.governor
+        if governor is not None:
+            remaining = governor.remaining_today()
+            SMTP_CONCURRENCY_LIMIT.labels(backend.name).set(governor.concurrency_limit)
+            SMTP_DAILY_RECIPIENTS.labels(backend.name).set(governor.used)
+            SMTP_DAILY_BUDGET_REMAINING.labels(backend.name).set(remaining if remaining is not None else -1)
+
+
+metrics.add_collector(_collect_backends)
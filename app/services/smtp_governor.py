@@ -0,0 +1,388 @@
+# app/services/smtp_governor.py
+
+import asyncio
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from app.core.config import settings
+from app.core.local_db import connect_local_db
+from app.core.metrics import SMTP_DEFERRED
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Respuestas temporales con las que el proveedor pide bajar el ritmo
+THROTTLE_CODES = {421, 450, 451, 452, 454}
+
+# Segundos durante los que se reutiliza lo leído del presupuesto diario para
+# estimar esperas (`refresh_usage`); la reserva de un envío siempre relee la fila
+USAGE_REFRESH_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS smtp_backend_usage (
+    backend TEXT NOT NULL,
+    day TEXT NOT NULL,
+    recipients INTEGER NOT NULL,
+    exhausted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (backend, day)
+) WITHOUT ROWID;
+"""
+
+
+class SendDeferred(Exception):
+    """
+    El governor no concede el envío ahora; debe reintentarse tras
+    `retry_after` segundos sin contarlo como un intento fallido.
+    """
+
+    def __init__(self, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _seconds_until_tomorrow() -> float:
+    now = datetime.now()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds()
+
+
+def _is_quota_error(code: Optional[int], message: str) -> bool:
+    # Gmail responde "550 5.4.5 Daily user sending limit exceeded"
+    return "5.4.5" in message or (code is not None and code >= 500 and "quota" in message.lower())
+
+
+class SendGovernor:
+    """
+    Regula el ritmo de envío de una cuenta SMTP (`name`) para no superar
+    las cuotas del proveedor:
+
+    - Token bucket de `rate` mensajes por segundo con ráfagas de hasta
+      `burst`. Vive en memoria, así que el ritmo es por proceso: con varios
+      workers la cuenta recibe hasta `rate` por cada uno.
+    - Presupuesto diario de `daily_limit` destinatarios (0 lo desactiva) en
+      la base SQLite local, compartido por los procesos del host y a salvo de
+      reinicios: cada envío lo reserva en una transacción que relee lo usado
+      y lo incrementa, y lo devuelve si no llegó a enviarse.
+    - Concurrencia AIMD entre `min_concurrency` y `max_concurrency`: sube de
+      a un envío por ventana mientras la latencia esté bajo `latency_target`
+      y se reduce a la mitad ante una respuesta de throttling (421, 454, ...)
+      o un envío lento, como mucho una vez cada `cooldown` segundos.
+
+    Cuando un envío tendría que esperar más de `max_wait` segundos, o el
+    presupuesto del día se agotó, `acquire` lanza `SendDeferred` para que el
+    outbox lo reprograme en lugar de perderlo.
+
+    Las escrituras y lecturas en SQLite corren en el pool de hilos; los
+    métodos síncronos (`send_delay`, `remaining_today`, `stats`) solo usan la
+    última lectura en memoria, que `refresh_usage` y cada reserva actualizan.
+    """
+
+    def __init__(
+        self,
+        name: str = "default",
+        rate: float = settings.SMTP_RATE_PER_SECOND,
+        burst: int = settings.SMTP_RATE_BURST,
+        daily_limit: int = settings.SMTP_DAILY_LIMIT,
+        min_concurrency: int = settings.SMTP_MIN_CONCURRENCY,
+        max_concurrency: int = settings.SMTP_POOL_SIZE,
+        latency_target: float = settings.SMTP_LATENCY_TARGET,
+        cooldown: float = settings.SMTP_THROTTLE_COOLDOWN,
+        max_wait: float = settings.SMTP_MAX_SEND_WAIT,
+        db_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.daily_limit = daily_limit
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.db_path = db_path
+
+        # Token bucket
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+
+        # Concurrencia AIMD
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._slot_freed: Optional[asyncio.Event] = None
+        self._last_decrease = -math.inf
+
+        # Presupuesto diario
+        self._conn = None
+        self._lock = threading.RLock()
+        self._day: Optional[str] = None
+        self._used = 0
+        self._exhausted = False
+        self._loaded_at = -math.inf
+
+    # --- Presupuesto diario ---
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = connect_local_db(self.db_path)
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def _select_usage(self, day: str):
+        return self.conn.execute(
+            "SELECT recipients, exhausted FROM smtp_backend_usage WHERE backend = ? AND day = ?",
+            (self.name, day),
+        ).fetchone()
+
+    def _set_usage(self, day: str, row):
+        self._day = day
+        self._used = row["recipients"] if row else 0
+        self._exhausted = bool(row["exhausted"]) if row else False
+        self._loaded_at = time.monotonic()
+
+    def _usage_is_stale(self) -> bool:
+        return _today() != self._day or time.monotonic() - self._loaded_at >= USAGE_REFRESH_INTERVAL
+
+    def _load_usage(self):
+        """
+        Relee lo usado hoy por todos los procesos. Al cambiar de día borra los
+        contadores anteriores.
+        """
+        day = _today()
+        with self._lock:
+            if day != self._day:
+                self.conn.execute("DELETE FROM smtp_backend_usage WHERE backend = ? AND day < ?", (self.name, day))
+            row = self._select_usage(day)
+        self._set_usage(day, row)
+
+    def _reserve(self, recipients: int) -> bool:
+        """
+        Reserva `recipients` del presupuesto de hoy si caben. La fila se relee
+        y se incrementa (`recipients = recipients + ?`) en la misma
+        transacción, así que dos procesos no pueden conceder el mismo hueco.
+        """
+        day = _today()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._select_usage(day)
+                granted = not (row and row["exhausted"]) and (row["recipients"] if row else 0) + recipients <= self.daily_limit
+                if granted:
+                    self.conn.execute(
+                        "INSERT INTO smtp_backend_usage (backend, day, recipients) VALUES (?, ?, ?) "
+                        "ON CONFLICT(backend, day) DO UPDATE SET recipients = recipients + excluded.recipients",
+                        (self.name, day, recipients),
+                    )
+                    row = self._select_usage(day)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        self._set_usage(day, row)
+        return granted
+
+    def _refund(self, recipients: int, day: str):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE smtp_backend_usage SET recipients = MAX(0, recipients - ?) WHERE backend = ? AND day = ?",
+                (recipients, self.name, day),
+            )
+
+    def _mark_exhausted(self, day: str):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO smtp_backend_usage (backend, day, recipients, exhausted) VALUES (?, ?, 0, 1) "
+                "ON CONFLICT(backend, day) DO UPDATE SET exhausted = 1",
+                (self.name, day),
+            )
+
+    async def _give_back(self, recipients: int):
+        """
+        Devuelve al presupuesto del día los destinatarios de un envío que no
+        llegó a hacerse.
+        """
+        if not self.daily_limit or self._day is None:
+            return
+        self._used = max(0, self._used - recipients)
+        await asyncio.to_thread(self._refund, recipients, self._day)
+
+    async def refresh_usage(self):
+        """
+        Relee el presupuesto diario si la última lectura tiene más de
+        `USAGE_REFRESH_INTERVAL` segundos (o es de otro día).
+        """
+        if self.daily_limit and self._usage_is_stale():
+            await asyncio.to_thread(self._load_usage)
+
+    @property
+    def used(self) -> int:
+        """
+        Destinatarios usados hoy (por todos los procesos) según la última lectura.
+        """
+        return self._used if self._day == _today() else 0
+
+    def remaining_today(self) -> Optional[int]:
+        """
+        Destinatarios que quedan hoy según la última lectura; un día nuevo
+        empieza con el presupuesto completo.
+        """
+        if not self.daily_limit:
+            return None
+        if self._day != _today():
+            return self.daily_limit
+        return 0 if self._exhausted else max(0, self.daily_limit - self.used)
+
+    # --- Token bucket ---
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _token_delay(self, now: float) -> float:
+        """
+        Segundos hasta que haya un token disponible (0 si lo hay ya).
+        """
+        pause = max(0.0, self._paused_until - now)
+        if self.rate <= 0:
+            return pause
+        self._refill(now)
+        return max(pause, (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0)
+
+    def send_delay(self) -> float:
+        """
+        Segundos que un nuevo envío tendría que esperar. Lo usan los workers
+        del outbox para no reclamar correos que solo se podrían diferir; no
+        toca la base, así que `refresh_usage` debe llamarse antes.
+        """
+        remaining = self.remaining_today()
+        if remaining == 0:
+            return _seconds_until_tomorrow()
+        return self._token_delay(time.monotonic())
+
+    # --- Concurrencia ---
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._limit)
+
+    async def _enter(self):
+        while self._in_flight >= int(self._limit):
+            if self._slot_freed is None:
+                self._slot_freed = asyncio.Event()
+            await self._slot_freed.wait()
+        self._in_flight += 1
+
+    def _leave(self):
+        # Síncrono para poder liberar el hueco también al cancelar un envío
+        self._in_flight -= 1
+        if self._slot_freed is not None:
+            self._slot_freed.set() # Despierta a todos; cada uno vuelve a comprobar el límite
+            self._slot_freed = None
+
+    def _increase(self):
+        self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        previous = self.concurrency_limit
+        self._limit = max(self.min_concurrency, self._limit / 2)
+        logger.warning("SMTP governor: %s, concurrency %d -> %d.", reason, previous, self.concurrency_limit, extra={"backend": self.name})
+
+    # --- API ---
+
+    def _defer(self, reason: str, retry_after: float, message: str) -> SendDeferred:
+        SMTP_DEFERRED.labels(self.name, reason).inc()
+        return SendDeferred(message, retry_after=retry_after, reason=reason)
+
+    async def acquire(self, recipients: int):
+        """
+        Reserva un hueco para enviar un correo a `recipients` destinatarios:
+        presupuesto diario, un token y un envío concurrente. Debe seguirle
+        `on_success`, `on_failure` o `release`.
+        """
+        if self.daily_limit:
+            # La transacción puede esperar a otro proceso: fuera del event loop
+            if not await asyncio.to_thread(self._reserve, recipients):
+                raise self._defer("daily_budget", _seconds_until_tomorrow(), "SMTP daily sending budget exhausted")
+
+        try:
+            await self._enter()
+        except BaseException:
+            await self._give_back(recipients)
+            raise
+        try:
+            waited = 0.0
+            while True:
+                delay = self._token_delay(time.monotonic())
+                if delay <= 0:
+                    break
+                if waited + delay > self.max_wait:
+                    raise self._defer("rate", delay, f"SMTP send rate limit reached, retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                waited += delay
+            if self.rate > 0:
+                self._tokens -= 1
+        except BaseException:
+            await self.release(recipients)
+            raise
+
+    async def release(self, recipients: int):
+        """
+        Libera un hueco reservado sin que el correo llegara a enviarse.
+        """
+        self._leave()
+        await self._give_back(recipients)
+
+    def on_success(self, latency: float):
+        if latency > self.latency_target:
+            self._decrease(f"send took {latency:.1f}s (target {self.latency_target:.1f}s)")
+        else:
+            self._increase()
+        self._leave()
+
+    async def on_failure(self, recipients: int, code: Optional[int], message: str) -> Optional[SendDeferred]:
+        """
+        Registra un envío fallido y devuelve un `SendDeferred` si la causa fue
+        una cuota o un throttling del proveedor (el correo debe diferirse).
+        """
+        self._leave()
+        await self._give_back(recipients) # El servidor no lo aceptó
+        if _is_quota_error(code, message):
+            self._exhausted = True
+            if self.daily_limit:
+                await asyncio.to_thread(self._mark_exhausted, _today())
+            return self._defer("daily_budget", _seconds_until_tomorrow(), f"SMTP provider quota exceeded: {message}")
+        if code in THROTTLE_CODES:
+            self._decrease(f"throttled by the SMTP server ({code})")
+            self._paused_until = time.monotonic() + self.cooldown
+            return self._defer("throttled", self.cooldown, f"SMTP server throttled the send ({code}): {message}")
+        return None
+
+    def stats(self) -> dict:
+        remaining = self.remaining_today()
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tokens": round(min(self.burst, self._tokens), 2),
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self._in_flight,
+            "daily_limit": self.daily_limit or None,
+            "used_today": self.used,
+            "remaining_today": remaining,
+        }
@@ -0,0 +1,192 @@
+# app/services/smtp_pool.py
+
+import aiosmtplib
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.message import Message
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    """
+    Conexión SMTP autenticada junto con los datos necesarios para decidir
+    si todavía puede reutilizarse.
+    """
+    __slots__ = ("client", "created_at", "last_used", "messages_sent")
+
+    def __init__(self, client: aiosmtplib.SMTP):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    Pool de conexiones SMTP persistentes (TCP + STARTTLS + LOGIN ya realizados).
+
+    - `size` limita el número de conexiones abiertas a la vez.
+    - Las conexiones ociosas por más de `idle_timeout` segundos se cierran.
+    - Cada conexión se recicla tras enviar `max_messages` correos.
+    - Antes de reutilizar una conexión que lleva más de `healthcheck_interval`
+      segundos sin uso se envía un NOOP; si falla, se reconecta de forma transparente.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        password: str,
+        size: int = 4,
+        idle_timeout: float = 60.0,
+        max_messages: int = 100,
+        healthcheck_interval: float = 15.0,
+        timeout: float = 30.0,
+        start_tls: bool = True,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.max_messages = max(1, max_messages)
+        self.healthcheck_interval = healthcheck_interval
+        self.timeout = timeout
+        self.start_tls = start_tls
+
+        self._idle: list[_PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._closed = False
+        self._discards: set = set() # Cierres lanzados al devolver una conexión
+
+    # --- Ciclo de vida ---
+
+    async def start(self):
+        """
+        Habilita el pool y abre una primera conexión para que el primer envío
+        no pague el handshake. Un fallo aquí no impide arrancar la aplicación.
+        """
+        self._closed = False
+        self._slots = asyncio.Semaphore(self.size)
+        try:
+            async with self.acquire():
+                pass
+            logger.info("SMTP pool started (%s:%s, size=%d).", self.hostname, self.port, self.size)
+        except Exception as e:
+            logger.warning("SMTP pool started without a warm connection: %s", e)
+
+    async def close(self):
+        """
+        Cierra todas las conexiones ociosas y espera los cierres pendientes.
+        Las conexiones en uso se cierran al ser devueltas.
+        """
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._discard(conn, graceful=True) for conn in idle), *self._discards)
+        logger.info("SMTP pool closed.")
+
+    # --- Gestión de conexiones ---
+
+    async def _connect(self) -> _PooledConnection:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            start_tls=self.start_tls,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        return _PooledConnection(client)
+
+    async def _discard(self, conn: _PooledConnection, graceful: bool = False):
+        try:
+            if graceful and conn.client.is_connected:
+                await conn.client.quit()
+            else:
+                conn.client.close()
+        except Exception:
+            conn.client.close()
+
+    async def _is_healthy(self, conn: _PooledConnection) -> bool:
+        if not conn.client.is_connected:
+            return False
+        if time.monotonic() - conn.last_used < self.healthcheck_interval:
+            return True
+        try:
+            await conn.client.noop()
+            return True
+        except aiosmtplib.SMTPException:
+            return False
+
+    async def _checkout(self) -> _PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            if time.monotonic() - conn.last_used > self.idle_timeout:
+                await self._discard(conn, graceful=True)
+                continue
+            if await self._is_healthy(conn):
+                return conn
+            await self._discard(conn)
+        return await self._connect()
+
+    def _checkin(self, conn: _PooledConnection):
+        conn.last_used = time.monotonic()
+        if self._closed or conn.messages_sent >= self.max_messages or not conn.client.is_connected:
+            # Se guarda la tarea: el loop solo mantiene referencias débiles
+            task = asyncio.ensure_future(self._discard(conn, graceful=True))
+            self._discards.add(task)
+            task.add_done_callback(self._discards.discard)
+            return
+        self._idle.append(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Entrega una conexión lista para enviar y la devuelve al pool al terminar.
+        Si ocurre un error durante el uso, la conexión se descarta.
+        """
+        if self._closed:
+            raise RuntimeError("SMTP pool is closed.")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+
+        async with self._slots:
+            conn = await self._checkout()
+            try:
+                yield conn
+            except BaseException:
+                await self._discard(conn)
+                raise
+            else:
+                self._checkin(conn)
+
+    async def send_message(self, message: Message):
+        """
+        Envía un mensaje usando una conexión del pool. Si el servidor cerró la
+        sesión entre el health check y el envío, se reintenta una vez con una
+        conexión nueva.
+        """
+        for attempt in (1, 2):
+            try:
+                async with self.acquire() as conn:
+                    result = await conn.client.send_message(message)
+                    conn.messages_sent += 1
+                    return result
+            except aiosmtplib.SMTPServerDisconnected:
+                if attempt == 2:
+                    raise
+                logger.info("SMTP connection dropped by server, reconnecting.")
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "closed": self._closed,
+        }
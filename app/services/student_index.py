@@ -0,0 +1,294 @@
+# app/services/student_index.py
+
+import asyncio
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import date
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics, FIRESTORE_READS, STUDENT_INDEX_SIZE, STUDENT_INDEX_STALENESS
+from app.firebase.firebase_admin import db as firestore_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se comprueba si el listener sigue vivo (y primer reintento)
+LISTENER_CHECK_INTERVAL = 5.0
+
+# Segundos durante los que se reutiliza la estimación de memoria de `stats`
+MEMORY_ESTIMATE_TTL = 60.0
+
+if TYPE_CHECKING:
+    from google.cloud.firestore_v1.client import Client
+
+
+def _deep_sizeof(value) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(k) + _deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_deep_sizeof(item) for item in value)
+    return size
+
+
+def _debt_amount(value) -> float:
+    """
+    Deuda como número; algunos documentos la guardan como texto ('120.50').
+    """
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return 0.0
+    return value if isinstance(value, (int, float)) else 0.0
+
+
+class StudentIndex:
+    """
+    Copia en memoria de la colección `students`, cargada una vez y mantenida
+    al día con un listener `on_snapshot` de Firestore: tras la carga inicial,
+    solo se leen los documentos que cambian.
+
+    Índices:
+    - `authUid` -> id del alumno.
+    - Lista ordenada de (`next_payment_date`, id), para buscar por rango.
+    - Conjunto de alumnos activos con `debt > 0`.
+
+    El listener corre en un hilo del SDK, por lo que las lecturas y las
+    actualizaciones se serializan con un lock. Mientras el índice no esté
+    listo (o si el listener se cae), `ready` es False y quien lo use debe
+    consultar Firestore directamente. Si el listener falla, una tarea lo
+    vuelve a abrir y recarga el índice, esperando cada vez el doble entre
+    intentos (hasta `retry_max` segundos).
+    """
+
+    def __init__(self, db: "Client", collection: str = "students", retry_max: float = settings.STUDENT_INDEX_RETRY_MAX):
+        self.db = db
+        self.collection = collection
+        self.retry_max = retry_max
+        self._students: Dict[str, dict] = {}
+        self._by_auth_uid: Dict[str, str] = {}
+        self._by_due_date: List[Tuple[str, str]] = []
+        self._active_debtors: Set[str] = set()
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._watch = None
+        self._error: Optional[str] = None
+        self._last_event_at: Optional[float] = None
+        self._read_time = None
+        self._documents_read = 0
+        self._supervisor: Optional[asyncio.Task] = None
+        self._failures = 0
+        self._resubscribes = 0
+        self._memory: Optional[Tuple[float, int]] = None
+
+    # --- Ciclo de vida ---
+
+    async def start(self, timeout: float = settings.STUDENT_INDEX_LOAD_TIMEOUT):
+        """
+        Abre el listener y espera la carga inicial. Si no llega a tiempo, la
+        aplicación arranca igual y el índice se usa cuando esté listo.
+        """
+        self._subscribe()
+        if self._supervisor is None:
+            self._supervisor = asyncio.create_task(self._supervise())
+        if await asyncio.to_thread(self._loaded.wait, timeout):
+            logger.info("Student index loaded with %d students.", len(self._students))
+        else:
+            logger.warning("Student index not loaded after %ss; queries will go to Firestore until it is.", timeout)
+
+    async def close(self):
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        if self._watch is not None:
+            await asyncio.to_thread(self._watch.unsubscribe)
+            self._watch = None
+        self._loaded.clear()
+
+    def _subscribe(self):
+        """
+        Abre un listener nuevo partiendo de un índice vacío: su primer
+        snapshot trae la colección completa.
+        """
+        with self._lock:
+            self._students.clear()
+            self._by_auth_uid.clear()
+            self._by_due_date.clear()
+            self._active_debtors.clear()
+        self._memory = None
+        self._error = None
+        self._loaded.clear()
+        self._watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+
+    def _resubscribe(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                logger.warning("Student index could not close the failed listener: %s", e)
+            self._watch = None
+        self._subscribe()
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None or (self._watch is not None and not getattr(self._watch, "is_active", True))
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(LISTENER_CHECK_INTERVAL)
+            if not self.failed:
+                if self._loaded.is_set():
+                    self._failures = 0
+                continue
+            self._failures += 1
+            delay = min(self.retry_max, LISTENER_CHECK_INTERVAL * 2 ** min(self._failures - 1, 10))
+            logger.warning("Student index listener failed (%s); resubscribing in %.0fs.", self._error or "listener stopped", delay)
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(self._resubscribe)
+                self._resubscribes += 1
+            except Exception as e:
+                self._error = f"Resubscribe failed: {e}"
+                logger.error("Student index could not resubscribe: %s", e)
+
+    @property
+    def ready(self) -> bool:
+        return (
+            self._loaded.is_set()
+            and self._error is None
+            and self._watch is not None
+            and getattr(self._watch, "is_active", True)
+        )
+
+    # --- Listener ---
+
+    def _on_snapshot(self, documents, changes, read_time):
+        try:
+            with self._lock:
+                for change in changes:
+                    snapshot = change.document
+                    if change.type.name == "REMOVED":
+                        self._remove(snapshot.id)
+                    else:
+                        self._remove(snapshot.id)
+                        self._add(snapshot.id, snapshot.to_dict() or {})
+                self._documents_read += len(changes)
+                self._last_event_at = time.time()
+                self._read_time = read_time
+            FIRESTORE_READS.labels("student_index").inc(len(changes))
+            self._loaded.set()
+        except Exception as e:
+            self._error = str(e)
+            logger.error("Student index failed to apply a snapshot: %s", e)
+
+    def _add(self, student_id: str, data: dict):
+        data['id'] = student_id
+        self._students[student_id] = data
+        auth_uid = data.get('authUid')
+        if auth_uid:
+            self._by_auth_uid[auth_uid] = student_id
+        due_date = data.get('next_payment_date')
+        if isinstance(due_date, str):
+            insort(self._by_due_date, (due_date, student_id))
+        if data.get('status') == 'active' and _debt_amount(data.get('debt')) > 0:
+            self._active_debtors.add(student_id)
+
+    def _remove(self, student_id: str):
+        data = self._students.pop(student_id, None)
+        if data is None:
+            return
+        auth_uid = data.get('authUid')
+        if auth_uid and self._by_auth_uid.get(auth_uid) == student_id:
+            del self._by_auth_uid[auth_uid]
+        due_date = data.get('next_payment_date')
+        if isinstance(due_date, str):
+            position = bisect_left(self._by_due_date, (due_date, student_id))
+            if position < len(self._by_due_date) and self._by_due_date[position] == (due_date, student_id):
+                del self._by_due_date[position]
+        self._active_debtors.discard(student_id)
+
+    # --- Consultas ---
+
+    def get(self, student_id: str) -> Optional[dict]:
+        with self._lock:
+            data = self._students.get(student_id)
+            return dict(data) if data is not None else None
+
+    def get_by_auth_uid(self, auth_uid: str) -> Optional[dict]:
+        with self._lock:
+            student_id = self._by_auth_uid.get(auth_uid)
+            return dict(self._students[student_id]) if student_id is not None else None
+
+    def active(self) -> List[dict]:
+        with self._lock:
+            return [dict(data) for data in self._students.values() if data.get('status') == 'active']
+
+    def overdue(self, today: date) -> List[dict]:
+        """
+        Alumnos activos con deuda cuya fecha de pago es anterior a `today`:
+        un corte de la lista ordenada por fecha intersectado con el conjunto
+        de deudores. Se devuelven copias, en orden de fecha de pago.
+        """
+        with self._lock:
+            end = bisect_left(self._by_due_date, (today.isoformat(),))
+            return [
+                dict(self._students[student_id])
+                for _, student_id in self._by_due_date[:end]
+                if student_id in self._active_debtors
+            ]
+
+    def _memory_bytes(self) -> int:
+        """
+        Tamaño aproximado del índice, recalculado como mucho cada
+        `MEMORY_ESTIMATE_TTL` segundos. Bajo el lock solo se copian los
+        contenedores; los documentos no se modifican una vez indexados, así
+        que se miden fuera del lock sin frenar al listener.
+        """
+        now = time.monotonic()
+        if self._memory is not None and now - self._memory[0] < MEMORY_ESTIMATE_TTL:
+            return self._memory[1]
+        with self._lock:
+            containers = (dict(self._students), dict(self._by_auth_uid), list(self._by_due_date), set(self._active_debtors))
+        size = sum(_deep_sizeof(container) for container in containers)
+        self._memory = (now, size)
+        return size
+
+    def health(self) -> dict:
+        """
+        Estado del listener, sin tomar el lock (para `/health`).
+        """
+        return {
+            "ready": self.ready,
+            "error": self._error or ("listener stopped" if self.failed else None),
+            "consecutive_failures": self._failures,
+            "resubscribes": self._resubscribes,
+        }
+
+    def stats(self) -> dict:
+        memory = self._memory_bytes()
+        with self._lock:
+            return {
+                **self.health(),
+                "students": len(self._students),
+                "active_debtors": len(self._active_debtors),
+                "memory_bytes": memory,
+                "documents_read": self._documents_read,
+                "last_event_age_seconds": round(time.time() - self._last_event_at, 3) if self._last_event_at else None,
+                "read_time": self._read_time.isoformat() if self._read_time else None,
+            }
+
+
+student_index = StudentIndex(db=firestore_db)
+
+
+def _collect_student_index():
+    STUDENT_INDEX_SIZE.set(len(student_index._students))
+    last_event = student_index._last_event_at
+    STUDENT_INDEX_STALENESS.set(time.time() - last_event if last_event else -1)
+
+
+metrics.add_collector(_collect_student_index)
@@ -0,0 +1,137 @@
+# app/services/suppression.py
+
+import threading
+import time
+from typing import FrozenSet, List, Optional
+from app.core.config import settings
+from app.core.local_db import connect_local_db
+from app.core.metrics import EMAIL_SUPPRESSIONS_ADDED
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rechazos definitivos del destinatario (buzón inexistente, dirección inválida).
+# 552 (buzón lleno) no se incluye: suele ser temporal aunque sea 5xx.
+HARD_BOUNCE_CODES = {550, 551, 553}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_suppressions (
+    email TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    reason TEXT,
+    code INTEGER,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def is_hard_bounce(code: Optional[int], message: str) -> bool:
+    # "550 5.4.5" es la cuota diaria de Gmail, no un problema del destinatario
+    return code in HARD_BOUNCE_CODES and "5.4.5" not in message
+
+
+class SuppressionList:
+    """
+    Direcciones a las que no se envía correo: rechazos definitivos que
+    registra `EmailService` (p. ej. 550 del destinatario) y altas manuales
+    desde la API de administración.
+
+    La fuente de verdad es la base SQLite local; para comprobar cada
+    destinatario en O(1) se mantiene una copia en memoria (un frozenset)
+    que se recarga como mucho cada `refresh_interval` segundos, para ver
+    también los cambios hechos por otros workers del mismo host.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, refresh_interval: float = settings.SUPPRESSION_REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self._conn = None
+        self._lock = threading.RLock()
+        self._emails: Optional[FrozenSet[str]] = None
+        self._loaded_at = 0.0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = connect_local_db(self.db_path)
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def _reload(self) -> FrozenSet[str]:
+        with self._lock:
+            rows = self.conn.execute("SELECT email FROM email_suppressions").fetchall()
+            self._emails = frozenset(row["email"] for row in rows)
+            self._loaded_at = time.monotonic()
+        return self._emails
+
+    def _snapshot(self) -> FrozenSet[str]:
+        emails = self._emails
+        if emails is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+            emails = self._reload()
+        return emails
+
+    def is_suppressed(self, email: str) -> bool:
+        return normalize_email(email) in self._snapshot()
+
+    def add(self, email: str, source: str = "manual", reason: Optional[str] = None, code: Optional[int] = None) -> bool:
+        """
+        Agrega una dirección. Devuelve False si ya estaba (se conserva el
+        registro original).
+        """
+        email = normalize_email(email)
+        with self._lock:
+            added = self.conn.execute(
+                "INSERT OR IGNORE INTO email_suppressions (email, source, reason, code, created_at) VALUES (?, ?, ?, ?, ?)",
+                (email, source, reason, code, time.time()),
+            ).rowcount > 0
+            if added and self._emails is not None:
+                self._emails = self._emails | {email}
+        if added:
+            EMAIL_SUPPRESSIONS_ADDED.labels(source).inc()
+            logger.info("Suppressed %s (%s%s).", email, source, f", {code}" if code else "", extra={"email": email})
+        return added
+
+    def record_bounce(self, email: str, code: Optional[int], message: str) -> bool:
+        """
+        Registra un rechazo del servidor SMTP si es definitivo.
+        """
+        if not is_hard_bounce(code, message):
+            return False
+        return self.add(email, source="bounce", reason=message[:500], code=code)
+
+    def remove(self, email: str) -> bool:
+        email = normalize_email(email)
+        with self._lock:
+            removed = self.conn.execute("DELETE FROM email_suppressions WHERE email = ?", (email,)).rowcount > 0
+            if removed and self._emails is not None:
+                self._emails = self._emails - {email}
+        if removed:
+            logger.info("Removed %s from the suppression list.", email, extra={"email": email})
+        return removed
+
+    def list(self, limit: int = 100, offset: int = 0, source: Optional[str] = None) -> List[dict]:
+        where, params = "", ()
+        if source is not None:
+            where, params = "WHERE source = ?", (source,)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM email_suppressions {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT source, COUNT(*) AS total FROM email_suppressions GROUP BY source").fetchall()
+        by_source = {row["source"]: row["total"] for row in rows}
+        return {"total": sum(by_source.values()), "by_source": by_source}
+
+
+suppression_list = SuppressionList()
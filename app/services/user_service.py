@@ -1,114 +1,644 @@
 # app/services/user_service.py
 
-from google.cloud.firestore_v1.client import Client
-from firebase_admin import auth
-from app.firebase.firebase_admin import db as firestore_db, auth_service
-from app.services.email_service import email_service
-from app.schemas.email import AccountDeactivationEmail
-from datetime import datetime
+from app.firebase.firebase_admin import auth, firestore, db as firestore_db, async_auth
+from app.firebase.async_auth import AsyncAuth
+from app.core.config import settings
+from app.core.metrics import FIRESTORE_READS, FIRESTORE_WRITES
+from app.services.email_outbox import email_outbox
+from app.services.job_executor import cron_executor
+from app.services.cluster import Shard
+from app.services.student_index import StudentIndex, student_index
+from app.services.delinquency_policy import POLICY_FIELDS, DelinquencyPolicyEngine, delinquency_policy
+from app.services.idempotency import SendLedger, billing_period, send_ledger
+from app.schemas.policy import DelinquencyRules, PolicyAction, PolicyPreviewResult
+from app.schemas.email import AccountDeactivationEmail, AccountStatusNotificationEmail
+from app.schemas.email_payloads import describe_errors, email_payloads, student_contact
+from datetime import date, datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, List, Optional
+import asyncio
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+if TYPE_CHECKING:
+    from google.cloud.firestore_v1.client import Client
+
+# Límites de las APIs de Firebase por llamada
+AUTH_GET_USERS_CHUNK_SIZE = 100
+AUTH_DELETE_USERS_CHUNK_SIZE = 1000
+FIRESTORE_BATCH_SIZE = 500
+FIRESTORE_IN_QUERY_SIZE = 30
+
+
+def _count_text_debts(students: List[dict]) -> int:
+    return sum(1 for student in students if isinstance(student.get('debt'), str))
+
+
+def _warn_text_debts(count: int):
+    if count:
+        logger.warning("%d overdue students store 'debt' as text; it was converted with float(). Store it as a number.", count)
+
 class UserService:
     """
     Contiene la lógica de negocio relacionada con la gestión de usuarios
     en Firebase Authentication y Firestore.
+    Las llamadas a Auth pasan por la fachada asíncrona `AsyncAuth`.
+    Quién se considera moroso lo deciden las reglas de `DelinquencyPolicyEngine`
+    para cada acción ('reminder' o 'deactivation').
+    Si se indica un `StudentIndex` y está listo, la búsqueda de morosos se
+    resuelve en memoria en lugar de consultar Firestore.
+    Si se indica un `SendLedger`, la desactivación masiva omite a los alumnos
+    ya desactivados y notificados en el mismo periodo de facturación.
     """
 
-    def __init__(self, db: Client, auth_client: auth):
+    def __init__(
+        self,
+        db: "Client",
+        auth_client: AsyncAuth,
+        index: Optional[StudentIndex] = None,
+        policy: DelinquencyPolicyEngine = delinquency_policy,
+        ledger: Optional[SendLedger] = None,
+    ):
         self.db = db
         self.auth = auth_client
-        self.users_ref = self.db.collection('students')
+        self.index = index
+        self.policy = policy
+        self.ledger = ledger
+
+    @property
+    def users_ref(self):
+        # Se resuelve en cada uso para no crear el cliente de Firestore al importar
+        return self.db.collection('students')
 
-    def is_scholarship_active(self, scholarship_data: dict) -> bool:
+    def _overdue_query(self, today: date, action: PolicyAction, fields: Optional[Iterable[str]] = None, text_debt: bool = False):
         """
-        Verifica si una beca está activa para el mes y año actual.
+        Consulta de candidatos a morosos resuelta en Firestore: activos, con
+        fecha de pago vencida (más los días de gracia) y deuda mayor al mínimo.
+        Las exenciones por beca se evalúan después con la política.
+        Requiere el índice compuesto (status, next_payment_date, debt) definido
+        en `firestore.indexes.json`.
+
+        Firestore compara los números y los textos por separado, así que el
+        filtro de deuda nunca devuelve los documentos que guardan `debt` como
+        texto ('120.50'). Con `text_debt` se buscan solo esos (`debt >= ''`);
+        la política convierte su deuda con float() y aplica el mínimo.
+
+        Con `fields`, solo se leen esos campos más los que usa la política.
         """
-        if not scholarship_data:
-            return False
-        try:
-            today = datetime.now().date()
-            start_date = datetime.strptime(scholarship_data['start_date'], '%Y-%m-%d').date()
-            end_date = datetime.strptime(scholarship_data['end_date'], '%Y-%m-%d').date()
-            
-            # La beca está activa si la fecha de hoy está dentro del rango
-            return start_date <= today <= end_date
-        except (ValueError, KeyError):
-            return False
+        cutoff = self.policy.payment_cutoff(action, today)
+        if text_debt:
+            debt_filter = firestore.FieldFilter('debt', '>=', '')
+        else:
+            debt_filter = firestore.FieldFilter('debt', '>', self.policy.rules(action).min_debt)
+        query = (
+            self.users_ref
+            .where(filter=firestore.FieldFilter('status', '==', 'active'))
+            .where(filter=firestore.FieldFilter('next_payment_date', '<', cutoff.isoformat()))
+            .where(filter=debt_filter)
+            .order_by('next_payment_date')
+            .order_by('debt')
+        )
+        if fields is not None:
+            query = query.select(sorted(set(fields).union(POLICY_FIELDS)))
+        return query
+
+    def _fetch_overdue_page(self, query, cursor, page_size: int, today: date, action: PolicyAction):
+        """
+        Lee una página de la consulta a partir del cursor (último documento de
+        la página anterior). Devuelve los alumnos a los que aplica la acción
+        según la política y el cursor para la siguiente página, o None si no hay más.
+        """
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        docs = list(page_query.stream())
+        FIRESTORE_READS.labels("overdue_students").inc(max(1, len(docs))) # Una consulta vacía se cobra como una lectura
+
+        records = []
+        for doc in docs:
+            student_data = doc.to_dict()
+            student_data['id'] = doc.id
+            records.append(student_data)
+
+        next_cursor = docs[-1] if len(docs) == page_size else None
+        return self.policy.select(records, action, today), next_cursor
+
+    def _indexed_overdue(self, today: date, action: PolicyAction) -> List[dict]:
+        candidates = self.index.overdue(self.policy.payment_cutoff(action, today))
+        return self.policy.select(candidates, action, today)
+
+    def _use_index(self) -> bool:
+        return self.index is not None and self.index.ready
+
+    def _fetch_students_by_id(self, ids: List[str], today: date, action: PolicyAction, fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        Lee los alumnos `ids` (del índice si está listo, si no con un
+        `get_all` a Firestore) y vuelve a aplicar la política, por si
+        cambiaron desde que se repartieron.
+        """
+        if self._use_index():
+            records = [record for record in map(self.index.get, ids) if record is not None]
+        else:
+            field_paths = sorted(set(fields).union(POLICY_FIELDS)) if fields is not None else None
+            docs = list(self.db.get_all([self.users_ref.document(student_id) for student_id in ids], field_paths=field_paths))
+            FIRESTORE_READS.labels("assigned_students").inc(len(docs))
+            records = [{**doc.to_dict(), 'id': doc.id} for doc in docs if doc.exists]
+        return self.policy.select(records, action, today)
+
+    async def _iter_all_overdue_pages(self, page_size: int, action: PolicyAction, fields: Optional[Iterable[str]]) -> AsyncIterator[List[dict]]:
+        today = datetime.now().date()
+        if self._use_index():
+            students = self._indexed_overdue(today, action)
+            for i in range(0, len(students), page_size):
+                yield students[i:i + page_size]
+            logger.info("Found %d overdue students (student index).", len(students))
+            _warn_text_debts(_count_text_debts(students))
+            return
 
-    def get_active_students_with_due_payments(self) -> list:
+        total = text_debts = 0
+        for text_debt in (False, True):
+            query = self._overdue_query(today, action, fields, text_debt=text_debt)
+            cursor = None
+            while True:
+                students, cursor = await asyncio.to_thread(self._fetch_overdue_page, query, cursor, page_size, today, action)
+                total += len(students)
+                text_debts += _count_text_debts(students)
+                if students:
+                    yield students
+                if cursor is None:
+                    break
+        logger.info("Found %d overdue students.", total)
+        _warn_text_debts(text_debts)
+
+    async def _iter_shard_pages(self, page_size: int, shard: Shard, action: PolicyAction, fields: Optional[Iterable[str]]) -> AsyncIterator[List[dict]]:
+        """
+        Páginas de morosos de un shard con plan compartido. El shard 0 recorre
+        la consulta completa, publica los ids de cada shard y procesa los
+        suyos; los demás esperan su lista y leen solo esos documentos, así que
+        la consulta se lee una vez por ejecución y no una vez por worker.
+        Si la lista no llega a tiempo (p. ej. el lector murió), el shard
+        recorre la consulta completa y filtra sus alumnos.
+        """
+        if shard.is_reader:
+            assignments: List[List[str]] = [[] for _ in range(shard.count)]
+            own = []
+            async for page in self._iter_all_overdue_pages(page_size, action, fields):
+                for student in page:
+                    owner = shard.owner(student['id'])
+                    assignments[owner].append(student['id'])
+                    if owner == shard.index:
+                        own.append(student)
+            await asyncio.to_thread(shard.plan.publish_assignments, assignments)
+            logger.info("Published overdue students of run %s for %d shards (%d for this one).", shard.plan.key, shard.count, len(own), extra={"shard": str(shard)})
+            for i in range(0, len(own), page_size):
+                yield own[i:i + page_size]
+            return
+
+        ids = await shard.plan.wait_assignment(shard.index)
+        if ids is None:
+            logger.warning("Shard %s got no assignment for run %s after %ss; reading the full query.", shard, shard.plan.key, shard.plan.timeout, extra={"shard": str(shard)})
+            async for page in self._iter_all_overdue_pages(page_size, action, fields):
+                students = [student for student in page if shard.owns(student['id'])]
+                if students:
+                    yield students
+            return
+
+        today = datetime.now().date()
+        chunk_size = min(page_size, FIRESTORE_BATCH_SIZE)
+        for i in range(0, len(ids), chunk_size):
+            students = await asyncio.to_thread(self._fetch_students_by_id, ids[i:i + chunk_size], today, action, fields)
+            if students:
+                yield students
+        logger.info("Processed the %d overdue students assigned to shard %s.", len(ids), shard, extra={"shard": str(shard)})
+
+    async def iter_overdue_student_pages(
+        self,
+        page_size: int = settings.FIRESTORE_PAGE_SIZE,
+        shard: Optional[Shard] = None,
+        action: PolicyAction = "deactivation",
+        fields: Optional[Iterable[str]] = None,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Recorre los alumnos morosos página por página usando cursores de Firestore.
+        Cada lectura se ejecuta en un hilo para no bloquear el event loop.
+        Con `shard`, solo se devuelven los alumnos que le corresponden a este
+        worker; si el shard trae un plan compartido, la consulta la lee solo
+        el shard 0 (ver `_iter_shard_pages`).
+        Con `fields`, la consulta a Firestore proyecta solo esos campos (y los
+        de la política); el índice en memoria devuelve los documentos completos.
+        """
+        if shard is not None and shard.plan is not None:
+            pages = self._iter_shard_pages(page_size, shard, action, fields)
+        else:
+            pages = self._iter_all_overdue_pages(page_size, action, fields)
+        async for students in pages:
+            if shard is not None and shard.plan is None:
+                students = [student for student in students if shard.owns(student['id'])]
+            if students:
+                yield students
+
+    async def iter_overdue_students(
+        self,
+        page_size: int = settings.FIRESTORE_PAGE_SIZE,
+        shard: Optional[Shard] = None,
+        action: PolicyAction = "deactivation",
+    ) -> AsyncIterator[dict]:
+        """
+        Generador asíncrono de alumnos morosos. La memoria y las lecturas
+        dependen del número de morosos, no del total de alumnos activos.
+        """
+        async for page in self.iter_overdue_student_pages(page_size, shard=shard, action=action):
+            for student in page:
+                yield student
+
+    def get_active_students_with_due_payments(self, action: PolicyAction = "deactivation") -> list:
         """
         Obtiene una lista de todos los estudiantes activos con deuda y fecha de pago vencida.
         No considera a los estudiantes con beca activa para el mes actual.
+        Para cohortes grandes, preferir `iter_overdue_students`.
         """
         try:
             today = datetime.now().date()
-            students_snapshot = self.users_ref.where('status', '==', 'active').stream()
+            if self._use_index():
+                overdue_students = self._indexed_overdue(today, action)
+                logger.info("Found %d overdue students (student index).", len(overdue_students))
+                _warn_text_debts(_count_text_debts(overdue_students))
+                return overdue_students
+
             overdue_students = []
+            for text_debt in (False, True):
+                query = self._overdue_query(today, action, text_debt=text_debt)
+                cursor = None
+                while True:
+                    students, cursor = self._fetch_overdue_page(query, cursor, settings.FIRESTORE_PAGE_SIZE, today, action)
+                    overdue_students.extend(students)
+                    if cursor is None:
+                        break
 
-            for student in students_snapshot:
-                student_data = student.to_dict()
-                student_data['id'] = student.id
-                
-                # Omitir si el estudiante tiene una beca activa
-                if self.is_scholarship_active(student_data.get('scholarship')):
-                    continue
+            logger.info("Found %d overdue students.", len(overdue_students))
+            _warn_text_debts(_count_text_debts(overdue_students))
+            return overdue_students
 
-                next_payment_date_str = student_data.get('next_payment_date')
-                if not next_payment_date_str:
-                    continue
+        except Exception as e:
+            logger.error("Error fetching overdue students: %s", e)
+            return []
 
-                next_payment_date = datetime.strptime(next_payment_date_str, '%Y-%m-%d').date()
+    def _fetch_student_page(self, query, cursor, page_size: int):
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        docs = list(page_query.stream())
+        FIRESTORE_READS.labels("student_report").inc(max(1, len(docs)))
+        next_cursor = docs[-1] if len(docs) == page_size else None
+        return [{**doc.to_dict(), 'id': doc.id} for doc in docs], next_cursor
 
-                # El alumno es moroso si su fecha de pago venció Y tiene deuda
-                if next_payment_date < today and float(student_data.get('debt', 0)) > 0:
-                    student_data['monthly_fee'] = float(student_data.get('monthly_fee', 0))
-                    overdue_students.append(student_data)
-            
-            logger.info(f"Found {len(overdue_students)} overdue students.")
-            return overdue_students
+    async def iter_student_pages(
+        self,
+        page_size: int = settings.FIRESTORE_PAGE_SIZE,
+        status: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Recorre la colección de alumnos (o solo los de `status`) en orden de
+        id, página por página con cursores de Firestore. Con `fields`, cada
+        documento trae solo esos campos (`select`). Solo hay una página en
+        memoria a la vez, sea cual sea el tamaño de la colección.
+        """
+        query = self.users_ref
+        if status is not None:
+            query = query.where(filter=firestore.FieldFilter('status', '==', status))
+        if fields is not None:
+            query = query.select(sorted(set(fields)))
+        cursor = None
+        while True:
+            students, cursor = await asyncio.to_thread(self._fetch_student_page, query, cursor, page_size)
+            if students:
+                yield students
+            if cursor is None:
+                break
+
+    def _load_active_students(self) -> List[dict]:
+        docs = list(self.users_ref.where(filter=firestore.FieldFilter('status', '==', 'active')).stream())
+        FIRESTORE_READS.labels("active_students").inc(max(1, len(docs)))
+        return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+
+    async def preview_policy(
+        self,
+        action: PolicyAction,
+        rules: Optional[DelinquencyRules] = None,
+        as_of: Optional[date] = None,
+        limit: int = 100,
+    ) -> PolicyPreviewResult:
+        """
+        Evalúa la política sobre todos los alumnos activos sin modificar nada,
+        para ver a quién se le enviaría un recordatorio o se desactivaría.
+        """
+        if self._use_index():
+            records, source = self.index.active(), "student_index"
+        else:
+            records, source = await asyncio.to_thread(self._load_active_students), "firestore"
+        return self.policy.preview(records, action, as_of or datetime.now().date(), rules=rules, limit=limit, source=source)
 
-        except Exception as e:
-            logger.error(f"Error fetching overdue students: {e}")
-            return [] 
-        
     async def deactivate_firebase_user(self, student_data: dict) -> bool:
         """
-        Desactiva un usuario en Firebase Auth, actualiza su estado en Firestore y envía un correo de notificación.
+        Desactiva un usuario en Firebase Auth, actualiza su estado en Firestore y encola un correo de notificación.
         """
         student_id = student_data['id']
         email = student_data['email']
         
         try:
             # 1. Desactivar en Firebase Auth
-            user = self.auth.get_user_by_email(email)
-            self.auth.update_user(user.uid, disabled=True)
-            logger.info(f"User {email} (UID: {user.uid}) disabled in Firebase Auth.")
+            user = await self.auth.get_user_by_email(email)
+            await self.auth.update_user(user.uid, disabled=True)
+            logger.info("User disabled in Firebase Auth.", extra={"email": email, "uid": user.uid})
 
             # 2. Actualizar estado en Firestore
-            self.users_ref.document(student_id).update({'status': 'inactive'})
-            logger.info(f"Student document {student_id} status updated to 'inactive' in Firestore.")
+            await asyncio.to_thread(self.users_ref.document(student_id).update, {'status': 'inactive'})
+            FIRESTORE_WRITES.labels("student_status").inc()
+            logger.info("Student status updated to 'inactive' in Firestore.", extra={"student_id": student_id})
             
-            # 3. Enviar correo de notificación
-            guardian_info = student_data.get('guardian')
-            email_details = AccountDeactivationEmail(
-                student_name=f"{student_data['first_name']} {student_data['last_name']}",
-                student_email=student_data['email'],
-                guardian_name=guardian_info.get('name') if guardian_info else None,
-                guardian_email=guardian_info.get('email') if guardian_info else None,
-                amount_due=float(student_data.get('debt', 0))
-            )
-            await email_service.send_account_deactivation_notification(email_details)
+            # 3. Encolar correo de notificación
+            await email_outbox.enqueue("account_deactivation", self._build_deactivation_email(student_data))
             
             return True
         except auth.UserNotFoundError:
-            logger.warning(f"User with email {email} not found in Firebase Auth. Updating Firestore only.")
-            self.users_ref.document(student_id).update({'status': 'inactive'})
+            logger.warning("User not found in Firebase Auth. Updating Firestore only.", extra={"email": email, "student_id": student_id})
+            await asyncio.to_thread(self.users_ref.document(student_id).update, {'status': 'inactive'})
+            FIRESTORE_WRITES.labels("student_status").inc()
             return True # Aún se considera exitoso porque el estado en DB se actualizó
         except Exception as e:
-            logger.error(f"Failed to deactivate user {email}: {e}")
+            logger.error("Failed to deactivate user: %s", e, extra={"email": email, "student_id": student_id})
             return False
 
-user_service = UserService(db=firestore_db, auth_client=auth_service)
\ No newline at end of file
+    def _build_deactivation_email(self, student_data: dict) -> AccountDeactivationEmail:
+        return email_payloads.build(AccountDeactivationEmail, student_contact(student_data), amount_due=student_data.get('debt', 0))
+
+    async def _resolve_uids_by_email(self, emails: List[str]) -> Dict[str, str]:
+        """
+        Resuelve los UID de Firebase Auth a partir de los correos, en bloques de
+        hasta 100 identificadores por llamada a `auth.get_users`.
+        """
+        chunks = [emails[i:i + AUTH_GET_USERS_CHUNK_SIZE] for i in range(0, len(emails), AUTH_GET_USERS_CHUNK_SIZE)]
+        results = await asyncio.gather(*(
+            self.auth.get_users([auth.EmailIdentifier(email) for email in chunk])
+            for chunk in chunks
+        ))
+        uids = {}
+        for result in results:
+            for user in result.users:
+                if user.email:
+                    uids[user.email.lower()] = user.uid
+        return uids
+
+    def _commit_inactive_status(self, student_ids: List[str]) -> Dict[str, str]:
+        """
+        Marca los alumnos como 'inactive' usando WriteBatch de hasta 500 escrituras.
+        Devuelve los errores por id de alumno de los lotes que fallaron.
+        """
+        errors = {}
+        for i in range(0, len(student_ids), FIRESTORE_BATCH_SIZE):
+            chunk = student_ids[i:i + FIRESTORE_BATCH_SIZE]
+            batch = self.db.batch()
+            for student_id in chunk:
+                batch.update(self.users_ref.document(student_id), {'status': 'inactive'})
+            try:
+                batch.commit()
+                FIRESTORE_WRITES.labels("student_status").inc(len(chunk))
+            except Exception as e:
+                logger.error("Failed to commit Firestore batch of %d status updates: %s", len(chunk), e)
+                errors.update({student_id: str(e) for student_id in chunk})
+        return errors
+
+    async def deactivate_firebase_users(self, students: List[dict]) -> Dict[str, dict]:
+        """
+        Versión masiva de `deactivate_firebase_user`:
+        1. Resuelve los UID en bloques de 100 con `auth.get_users`.
+        2. Deshabilita las cuentas en Auth en paralelo (con concurrencia acotada).
+        3. Actualiza el estado en Firestore con escrituras por lotes.
+        4. Encola todos los correos de notificación en una sola transacción.
+
+        Devuelve un reporte por id de alumno con `email`, `uid`, `status`
+        ('deactivated', 'not_found_in_auth', 'duplicate' o 'failed') y `error`.
+        """
+        report = {
+            student['id']: {'email': student.get('email'), 'uid': None, 'status': 'failed', 'error': None}
+            for student in students
+        }
+        if not students:
+            return report
+
+        # 0. Reservar en el registro de envíos; los ya procesados este periodo se omiten
+        if self.ledger:
+            periods = {student['id']: billing_period(student) for student in students}
+            claimed = set(await asyncio.to_thread(self.ledger.claim_many, "account_deactivation", list(periods.items())))
+            for student in students:
+                if student['id'] not in claimed:
+                    report[student['id']]['status'] = 'duplicate'
+            students = [student for student in students if student['id'] in claimed]
+            if not students:
+                return report
+            try:
+                return await self._deactivate_claimed(students, report)
+            finally:
+                failed = [(sid, periods[sid]) for sid in claimed if report[sid]['status'] == 'failed']
+                await asyncio.to_thread(self.ledger.release_many, "account_deactivation", failed)
+        return await self._deactivate_claimed(students, report)
+
+    async def _deactivate_claimed(self, students: List[dict], report: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Pasos 1 a 4 de `deactivate_firebase_users`; actualiza `report` en el lugar.
+        """
+        # 1. Resolver UIDs
+        emails = list({student['email'].lower() for student in students if student.get('email')})
+        try:
+            uids = await self._resolve_uids_by_email(emails)
+        except Exception as e:
+            logger.error("Failed to resolve Firebase Auth users: %s", e)
+            for student in students:
+                report[student['id']]['error'] = f"UID lookup failed: {e}"
+            return report
+
+        # 2. Deshabilitar en Firebase Auth
+        async def disable(student: dict):
+            entry = report[student['id']]
+            uid = uids.get((student.get('email') or '').lower())
+            if uid is None:
+                entry['status'] = 'not_found_in_auth'
+                return None
+            entry['uid'] = uid
+            try:
+                await self.auth.update_user(uid, disabled=True)
+            except Exception as e:
+                entry['error'] = str(e)
+                return False
+            entry['status'] = 'deactivated'
+            return True
+
+        await cron_executor.run("disable_auth_users", students, disable)
+
+        # 3. Actualizar Firestore (también para los que no existen en Auth, como en el flujo individual)
+        to_update = [sid for sid, entry in report.items() if entry['status'] in ('deactivated', 'not_found_in_auth')]
+        batch_errors = await asyncio.to_thread(self._commit_inactive_status, to_update)
+        for student_id, error in batch_errors.items():
+            report[student_id]['status'] = 'failed'
+            report[student_id]['error'] = f"Firestore update failed: {error}"
+
+        # 4. Encolar correos para las cuentas deshabilitadas. Auth y Firestore ya se
+        # actualizaron: un registro inválido o un fallo del outbox se reporta por
+        # alumno en lugar de perder las notificaciones del resto y abortar la tarea.
+        notifications = []
+        for student in students:
+            entry = report[student['id']]
+            if entry['status'] != 'deactivated':
+                continue
+            try:
+                notifications.append((student['id'], self._build_deactivation_email(student)))
+            except Exception as e:
+                entry['error'] = f"Invalid notification data: {e}"
+                logger.warning("Skipping deactivation email: %s", e, extra={"student_id": student['id']})
+        try:
+            await email_outbox.enqueue_many(("account_deactivation", details) for _, details in notifications)
+        except Exception as e:
+            logger.error("Failed to enqueue %d deactivation emails: %s", len(notifications), e)
+            for student_id, _ in notifications:
+                report[student_id]['error'] = f"Notification enqueue failed: {e}"
+
+        counts = {}
+        for entry in report.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        logger.info("Bulk deactivation finished for %d students: %s", len(students), counts, extra={"counts": counts})
+        return report
+
+    # --- Operaciones masivas por UID (panel de administración) ---
+
+    def _query_students_by_auth_uids(self, uids: List[str]) -> List[dict]:
+        query = self.users_ref.where(filter=firestore.FieldFilter('authUid', 'in', uids))
+        docs = list(query.stream())
+        FIRESTORE_READS.labels("students_by_auth_uid").inc(max(1, len(docs)))
+        return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+
+    async def find_students_by_auth_uids(self, uids: List[str]) -> Dict[str, dict]:
+        """
+        Perfiles de alumno por UID de Auth: del índice en memoria si está
+        listo o con consultas `in` de hasta 30 UID (el límite de Firestore)
+        lanzadas en paralelo, en lugar de una consulta por UID.
+        """
+        if not uids:
+            return {}
+        if self.index is not None and self.index.ready:
+            profiles = {uid: self.index.get_by_auth_uid(uid) for uid in uids}
+            return {uid: profile for uid, profile in profiles.items() if profile is not None}
+        chunks = [uids[i:i + FIRESTORE_IN_QUERY_SIZE] for i in range(0, len(uids), FIRESTORE_IN_QUERY_SIZE)]
+        results = await asyncio.gather(*(asyncio.to_thread(self._query_students_by_auth_uids, chunk) for chunk in chunks))
+        return {student['authUid']: student for result in results for student in result}
+
+    async def set_users_disabled(self, uids: List[str], disabled: bool) -> Dict[str, dict]:
+        """
+        Versión masiva de `PATCH /users/{uid}/status`:
+        1. Actualiza las cuentas en Auth en paralelo (con concurrencia acotada).
+        2. Busca los perfiles de los alumnos con consultas `in`.
+        3. Encola todos los correos de notificación en una sola transacción.
+
+        Devuelve un reporte por UID con `status` ('updated', 'not_found' o
+        'failed'), `notified` y `error`.
+        """
+        report = {uid: {'status': 'failed', 'notified': False, 'error': None} for uid in uids}
+        auth_emails = {}
+
+        # 1. Actualizar en Firebase Auth
+        async def update(uid: str):
+            entry = report[uid]
+            try:
+                user = await self.auth.update_user(uid, disabled=disabled)
+            except auth.UserNotFoundError:
+                entry['status'] = 'not_found'
+                entry['error'] = "User not found in Firebase Authentication."
+                return None
+            except Exception as e:
+                entry['error'] = str(e)
+                return False
+            entry['status'] = 'updated'
+            auth_emails[uid] = user.email
+            return True
+
+        await cron_executor.run("update_auth_users_status", uids, update)
+        updated = [uid for uid in uids if report[uid]['status'] == 'updated']
+
+        # 2. Perfiles de los alumnos para los correos
+        try:
+            profiles = await self.find_students_by_auth_uids(updated)
+        except Exception as e:
+            logger.error("Failed to look up student profiles for %d users: %s", len(updated), e)
+            profiles = {}
+            for uid in updated:
+                report[uid]['error'] = f"Profile lookup failed: {e}"
+
+        # 3. Encolar los correos
+        recipients = []
+        for uid in updated:
+            student = profiles.get(uid)
+            email = auth_emails.get(uid) or (student or {}).get('email')
+            if student and email:
+                recipients.append((uid, student_contact(student, email)))
+        status_text = "desactivada" if disabled else "activada"
+        batch = email_payloads.build_many(AccountStatusNotificationEmail, [(contact, {'status': status_text}) for _, contact in recipients])
+        notifications = []
+        for index, (uid, _) in enumerate(recipients):
+            if batch.items[index] is None:
+                report[uid]['error'] = f"Invalid notification data: {describe_errors(batch.errors[index])}"
+            else:
+                notifications.append((uid, batch.items[index]))
+        # Auth ya se actualizó: un fallo del outbox se reporta por usuario y la
+        # petición responde igualmente con el reporte.
+        try:
+            await email_outbox.enqueue_many(("account_status", details) for _, details in notifications)
+        except Exception as e:
+            logger.error("Failed to enqueue %d status emails: %s", len(notifications), e)
+            for uid, _ in notifications:
+                report[uid]['error'] = f"Notification enqueue failed: {e}"
+        else:
+            for uid, _ in notifications:
+                report[uid]['notified'] = True
+
+        logger.info(
+            "Bulk status change (disabled=%s) for %d users: %d updated, %d notified.",
+            disabled, len(uids), len(updated), len(notifications),
+            extra={"disabled": disabled, "updated": len(updated), "notified": len(notifications)},
+        )
+        return report
+
+    async def delete_auth_users(self, uids: List[str]) -> Dict[str, dict]:
+        """
+        Elimina cuentas de Firebase Auth con `auth.delete_users`, hasta 1000
+        UID por llamada. Las llamadas van una tras otra porque la API limita
+        su frecuencia. Devuelve un reporte por UID con `status` ('deleted' o
+        'failed') y `error`; los UID que no existían cuentan como eliminados.
+        """
+        report = {uid: {'status': 'deleted', 'error': None} for uid in uids}
+        for i in range(0, len(uids), AUTH_DELETE_USERS_CHUNK_SIZE):
+            chunk = uids[i:i + AUTH_DELETE_USERS_CHUNK_SIZE]
+            try:
+                result = await self.auth.delete_users(chunk)
+            except Exception as e:
+                logger.error("Failed to delete a chunk of %d Firebase Auth users: %s", len(chunk), e)
+                for uid in chunk:
+                    report[uid] = {'status': 'failed', 'error': str(e)}
+                continue
+            for error in result.errors:
+                report[chunk[error.index]] = {'status': 'failed', 'error': error.reason}
+        deleted = sum(1 for entry in report.values() if entry['status'] == 'deleted')
+        logger.info("Bulk delete of %d Firebase Auth users: %d deleted.", len(uids), deleted)
+        return report
+
+    async def deactivate_overdue_students(self, shard: Optional[Shard] = None) -> Dict[str, dict]:
+        """
+        Desactiva a todos los alumnos morosos (o solo a los de `shard`) procesando
+        la consulta página por página con la ruta masiva. Devuelve el reporte
+        combinado por alumno.
+        """
+        report = {}
+        async for page in self.iter_overdue_student_pages(shard=shard):
+            report.update(await self.deactivate_firebase_users(page))
+        return report
+
+user_service = UserService(db=firestore_db, auth_client=async_auth, index=student_index, ledger=send_ledger)
\ No newline at end of file
@@ -0,0 +1,71 @@
+# app/utils/auth_cache.py
+
+import hashlib
+import time
+from typing import Optional
+from cachetools import TLRUCache, TTLCache
+from app.core.config import settings
+
+
+class AuthCache:
+    """
+    Caché en memoria para `get_current_admin_user`.
+
+    - Tokens decodificados, indexados por el SHA-256 del token y válidos
+      hasta su `exp`, para no repetir la verificación de la firma.
+    - Roles por UID con un TTL corto, para no leer `users/{uid}` en cada
+      request. Se puede invalidar explícitamente tras un cambio de rol.
+    """
+
+    def __init__(self, token_maxsize: int, role_maxsize: int, role_ttl: float):
+        self._tokens = TLRUCache(
+            maxsize=token_maxsize,
+            ttu=lambda _key, decoded, _now: decoded.get("exp", 0),
+            timer=time.time,
+        )
+        self._roles = TTLCache(maxsize=role_maxsize, ttl=role_ttl)
+        self.stats = {"token_hits": 0, "token_misses": 0, "role_hits": 0, "role_misses": 0}
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get_token(self, token: str) -> Optional[dict]:
+        decoded = self._tokens.get(self._token_key(token))
+        self.stats["token_hits" if decoded is not None else "token_misses"] += 1
+        return decoded
+
+    def set_token(self, token: str, decoded: dict):
+        if decoded.get("exp", 0) > time.time():
+            self._tokens[self._token_key(token)] = decoded
+
+    def get_role(self, uid: str) -> Optional[str]:
+        role = self._roles.get(uid)
+        self.stats["role_hits" if role is not None else "role_misses"] += 1
+        return role
+
+    def set_role(self, uid: str, role: str):
+        self._roles[uid] = role
+
+    def invalidate_role(self, uid: Optional[str] = None):
+        """
+        Elimina el rol cacheado de un usuario, o de todos si no se indica UID.
+        """
+        if uid is None:
+            self._roles.clear()
+        else:
+            self._roles.pop(uid, None)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "tokens_cached": len(self._tokens),
+            "roles_cached": len(self._roles),
+        }
+
+
+auth_cache = AuthCache(
+    token_maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+    role_maxsize=settings.AUTH_ROLE_CACHE_SIZE,
+    role_ttl=settings.AUTH_ROLE_CACHE_TTL,
+)
@@ -1,28 +1,73 @@
 # app/utils/security.py
 
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from firebase_admin import auth
-from app.firebase.firebase_admin import db as firestore_db
+from app.firebase.firebase_admin import auth, async_db, async_auth, ensure_firebase
+from app.utils.auth_cache import auth_cache
+from app.core.metrics import AUTH_CACHE, FIRESTORE_READS
+import logging
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_admin_user(token: str = Depends(oauth2_scheme)):
+async def verify_token(token: str) -> dict:
+    """
+    Verifica un token de Firebase ID, o lo toma del caché si ya se verificó.
+    Lanza `auth.InvalidIdTokenError` si no es válido.
+    """
+    decoded_token = auth_cache.get_token(token)
+    if decoded_token is None:
+        AUTH_CACHE.labels("token", "miss").inc()
+        decoded_token = await async_auth.verify_id_token(token)
+        auth_cache.set_token(token, decoded_token)
+    else:
+        AUTH_CACHE.labels("token", "hit").inc()
+    return decoded_token
+
+async def verified_uid(authorization: Optional[str]) -> Optional[str]:
+    """
+    UID del token Bearer de una cabecera Authorization, o None si no trae
+    uno o no se puede verificar. El token queda en el caché, así que el
+    endpoint no vuelve a verificarlo.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        await ensure_firebase()
+        return (await verify_token(token)).get("uid")
+    except Exception as e:
+        logger.debug("Could not verify bearer token: %s", e)
+        return None
+
+async def get_current_admin_user(token: str = Depends(oauth2_scheme), _firebase: None = Depends(ensure_firebase)):
     """
     Decodifica el token de Firebase ID y verifica si el usuario tiene el rol de 'admin'.
+    El token verificado y el rol se cachean en memoria (ver `AuthCache`).
+    `ensure_firebase` inicializa Firebase fuera del event loop si aún no lo está.
     """
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await verify_token(token)
         uid = decoded_token.get("uid")
         
-        # Consultar el rol desde Firestore
-        user_doc = firestore_db.collection('users').document(uid).get()
-        if not user_doc.exists:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="El usuario no tiene un rol definido."
-            )
-        user_role = user_doc.to_dict().get('role')
+        # Consultar el rol desde Firestore si no está en caché
+        user_role = auth_cache.get_role(uid)
+        if user_role is None:
+            AUTH_CACHE.labels("role", "miss").inc()
+            user_doc = await async_db.collection('users').document(uid).get()
+            FIRESTORE_READS.labels("user_role").inc()
+            if not user_doc.exists:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="El usuario no tiene un rol definido."
+                )
+            user_role = user_doc.to_dict().get('role')
+            if user_role is not None:
+                auth_cache.set_role(uid, user_role)
+        else:
+            AUTH_CACHE.labels("role", "hit").inc()
         
         if user_role not in ['admin', 'caja']:
             raise HTTPException(
@@ -0,0 +1,13 @@
+# benchmarks/__init__.py
+"""
+Suite de benchmarks de las rutas críticas del backend, sin red: Firebase
+(Auth y Firestore) se reemplaza por fakes en memoria y Gmail por un servidor
+SMTP local.
+
+Uso:
+    python -m benchmarks                       # todos los escenarios, 100 / 1k / 10k alumnos
+    python -m benchmarks --sizes 100,1000 --scenarios scan,email
+    python -m benchmarks --smtp-latency 0.02 --smtp-failure-rate 0.05 --json results.json
+
+Ver `python -m benchmarks --help` para el resto de opciones.
+"""
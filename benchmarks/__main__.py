@@ -0,0 +1,102 @@
+# benchmarks/__main__.py
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import tracemalloc
+from benchmarks.bootstrap import configure_environment
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks de las rutas críticas sin red.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Números de alumnos sintéticos, separados por comas.")
+    parser.add_argument("--scenarios", default="scan,deactivate,deactivate_bulk,email,auth", help="Escenarios a ejecutar, separados por comas.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Operaciones simultáneas (por defecto CRON_CONCURRENCY).")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones del escenario 'scan'.")
+    parser.add_argument("--firestore-latency", type=float, default=0.005, help="Segundos simulados por RPC de Firestore.")
+    parser.add_argument("--auth-latency", type=float, default=0.005, help="Segundos simulados por llamada a Firebase Auth.")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="Segundos que tarda el sink SMTP en aceptar cada mensaje.")
+    parser.add_argument("--smtp-failure-rate", type=float, default=0.0, help="Probabilidad de que el sink rechace un mensaje.")
+    parser.add_argument("--smtp-failure-code", type=int, default=451, help="Código SMTP de los rechazos inyectados.")
+    parser.add_argument("--smtp-pool-size", type=int, default=None, help="Conexiones del pool SMTP (por defecto SMTP_POOL_SIZE).")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla de los datos sintéticos y de los fallos inyectados.")
+    parser.add_argument("--no-memory", action="store_true", help="No medir el pico de memoria (tracemalloc ralentiza la ejecución).")
+    parser.add_argument("--json", dest="json_path", help="Ruta donde guardar los resultados en JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs de la aplicación.")
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace) -> int:
+    # `app` lee la configuración al importarse: el entorno debe estar listo antes.
+    configure_environment()
+    from benchmarks.measure import format_table
+    from benchmarks.scenarios import SCENARIOS, BenchmarkOptions, run_scenarios
+    from benchmarks.smtp_sink import SMTPSink
+    from app.firebase.firebase_admin import auth, firestore
+    from app.core.logs import configure_logging
+
+    # La aplicación importa el SDK de Firebase en su primer uso; se carga antes de medir.
+    auth._load()
+    firestore._load()
+
+    # Cada envío y cada fallo inyectado generan un log; sin --verbose solo se muestran los resultados.
+    configure_logging(format="text")
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}", file=sys.stderr)
+        return 2
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    options = BenchmarkOptions(
+        repeat=args.repeat,
+        firestore_latency=args.firestore_latency,
+        auth_latency=args.auth_latency,
+        smtp_latency=args.smtp_latency,
+        smtp_failure_rate=args.smtp_failure_rate,
+        smtp_failure_code=args.smtp_failure_code,
+        seed=args.seed,
+    )
+    if args.concurrency:
+        options.concurrency = args.concurrency
+    if args.smtp_pool_size:
+        options.smtp_pool_size = args.smtp_pool_size
+
+    sink = SMTPSink(
+        latency=options.smtp_latency,
+        failure_rate=options.smtp_failure_rate,
+        failure_code=options.smtp_failure_code,
+        seed=options.seed,
+    ).start()
+    if not args.no_memory:
+        tracemalloc.start()
+    try:
+        results = await run_scenarios(
+            names, sizes, options, sink,
+            on_result=lambda r: print(f"  {r.scenario} @ {r.students}: {r.throughput:.1f} {r.unit}, p95 {r.p95_ms:.2f} ms", file=sys.stderr),
+        )
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        sink.stop()
+
+    print(format_table(results))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "options": vars(options),
+                "results": [result.as_dict() for result in results],
+            }, f, indent=2)
+        print(f"Results written to {args.json_path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,55 @@
+# benchmarks/bootstrap.py
+
+import json
+import os
+import tempfile
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+def _write_service_account(path: str):
+    """
+    Genera una cuenta de servicio desechable: el Admin SDK la necesita para
+    inicializarse, pero los benchmarks nunca llegan a usarla contra Google.
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode()
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account",
+            "project_id": "aurora-mentis-benchmark",
+            "private_key_id": "benchmark",
+            "private_key": pem,
+            "client_email": "benchmark@aurora-mentis-benchmark.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }, f)
+
+
+def configure_environment() -> str:
+    """
+    Configura las variables de entorno que lee `app.core.config` antes de
+    importar cualquier módulo de `app`. Las variables de entorno tienen
+    prioridad sobre el `.env`, de modo que nunca se usan credenciales reales.
+    El estado local (SQLite, locks) va a un directorio temporal.
+    """
+    workdir = tempfile.mkdtemp(prefix="aurora-bench-")
+    service_account = os.path.join(workdir, "service-account.json")
+    _write_service_account(service_account)
+    os.environ.update({
+        "FIREBASE_SERVICE_ACCOUNT_KEY_PATH": service_account,
+        "FIREBASE_DATABASE_URL": "https://aurora-mentis-benchmark.firebaseio.com",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": "0",
+        "SMTP_USER": "benchmark@example.com",
+        "SMTP_PASSWORD": "benchmark",
+        "FRONTEND_URL": "http://localhost:3000",
+        "LOCAL_DB_PATH": os.path.join(workdir, "benchmark.db"),
+        "CLUSTER_LOCK_DIR": os.path.join(workdir, "cluster"),
+        "CLUSTER_MODE": "single",
+    })
+    return workdir
@@ -0,0 +1,536 @@
+# benchmarks/fakes.py
+
+import asyncio
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from firebase_admin import auth
+
+# --- Firestore ---
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+
+def _get_field(data: dict, path: str):
+    value = data
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _project(data: dict, paths) -> dict:
+    projected: dict = {}
+    for path in paths:
+        value = _get_field(data, path)
+        if value is _MISSING:
+            continue
+        target = projected
+        *parents, leaf = path.split(".")
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = value
+    return projected
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _get_field(self._data or {}, field_path)
+        return None if value is _MISSING else value
+
+
+class FakeDocumentReference:
+    def __init__(self, store: "FakeFirestore", collection: str, doc_id: str):
+        self._store = store
+        self.collection_name = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, transaction=None, blocking: bool = True) -> FakeDocumentSnapshot:
+        self._store._rpc("get", reads=1, blocking=blocking)
+        data = self._store._collection(self.collection_name).get(self.id)
+        return FakeDocumentSnapshot(self, dict(data) if data is not None else None)
+
+    def set(self, data: dict, merge: bool = False, blocking: bool = True):
+        self._store._rpc("set", writes=1, blocking=blocking)
+        self._store._apply_set(self, data, merge)
+
+    def update(self, data: dict, blocking: bool = True):
+        self._store._rpc("update", writes=1, blocking=blocking)
+        self._store._apply_update(self, data)
+
+    def delete(self, blocking: bool = True):
+        self._store._rpc("delete", writes=1, blocking=blocking)
+        self._store._collection(self.collection_name).pop(self.id, None)
+
+
+class FakeQuery:
+    """
+    Consulta inmutable con el subconjunto de la API de Firestore que usa el
+    backend: `where(filter=FieldFilter(...))`, `order_by`, `limit`,
+    `start_after`, `select` y `stream`. Como en Firestore, los documentos a
+    los que les falta un campo filtrado u ordenado no aparecen en el
+    resultado, y el id del documento desempata el orden.
+    """
+
+    def __init__(self, store: "FakeFirestore", collection: str, filters=(), orders=(), limit_to=None, cursor=None, projection=None):
+        self._store = store
+        self._collection_name = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_to
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes) -> "FakeQuery":
+        values = dict(filters=self._filters, orders=self._orders, limit_to=self._limit, cursor=self._cursor, projection=self._projection)
+        values.update(changes)
+        return FakeQuery(self._store, self._collection_name, **values)
+
+    def where(self, field_path: str = None, op_string: str = None, value: Any = None, *, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, _OPERATORS[op_string], value),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit_to=count)
+
+    def start_after(self, snapshot: FakeDocumentSnapshot) -> "FakeQuery":
+        return self._copy(cursor=snapshot)
+
+    def select(self, field_paths) -> "FakeQuery":
+        return self._copy(projection=tuple(field_paths))
+
+    def _sort_key(self, doc_id: str, data: dict):
+        return tuple(_get_field(data, field) for field, _ in self._orders) + (doc_id,)
+
+    def _matches(self, data: dict) -> bool:
+        for field, op, value in self._filters:
+            current = _get_field(data, field)
+            if current is _MISSING:
+                return False
+            try:
+                if not op(current, value):
+                    return False
+            except TypeError:
+                return False
+        return all(_get_field(data, field) is not _MISSING for field, _ in self._orders)
+
+    def _run(self, blocking: bool = True) -> List[FakeDocumentSnapshot]:
+        documents = self._store._collection(self._collection_name)
+        matched = sorted((item for item in documents.items() if self._matches(item[1])), key=lambda item: item[0])
+        for index in reversed(range(len(self._orders))):
+            field, descending = self._orders[index]
+            matched.sort(key=lambda item: _get_field(item[1], field), reverse=descending)
+        if self._cursor is not None:
+            cursor_key = self._sort_key(self._cursor.id, self._cursor._data or {})
+            position = next((i for i, (doc_id, data) in enumerate(matched) if self._sort_key(doc_id, data) == cursor_key), None)
+            matched = matched[position + 1:] if position is not None else matched
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        self._store._rpc("query", reads=max(1, len(matched)), blocking=blocking)
+        return [
+            FakeDocumentSnapshot(
+                FakeDocumentReference(self._store, self._collection_name, doc_id),
+                _project(data, self._projection) if self._projection is not None else dict(data),
+            )
+            for doc_id, data in matched
+        ]
+
+    def stream(self, transaction=None):
+        return iter(self._run())
+
+    def get(self, transaction=None) -> List[FakeDocumentSnapshot]:
+        return self._run()
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store: "FakeFirestore", collection: str):
+        super().__init__(store, collection)
+        self.id = collection
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._store, self._collection_name, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: dict):
+        reference = self.document()
+        reference.set(data)
+        return None, reference
+
+
+class FakeWriteBatch:
+    MAX_WRITES = 500
+
+    def __init__(self, store: "FakeFirestore"):
+        self._store = store
+        self._writes = []
+
+    def _add(self, write):
+        if len(self._writes) >= self.MAX_WRITES:
+            raise ValueError(f"A write batch can have at most {self.MAX_WRITES} writes.")
+        self._writes.append(write)
+
+    def set(self, reference: FakeDocumentReference, data: dict, merge: bool = False):
+        self._add(lambda: self._store._apply_set(reference, data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: dict):
+        self._add(lambda: self._store._apply_update(reference, data))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._add(lambda: self._store._collection(reference.collection_name).pop(reference.id, None))
+
+    def commit(self):
+        self._store._rpc("batch_commit", writes=len(self._writes))
+        with self._store._lock:
+            for write in self._writes:
+                write()
+        self._writes = []
+
+
+class FakeFirestore:
+    """
+    Firestore en memoria, compatible con el cliente síncrono en lo que usa
+    `UserService`. Cada llamada equivale a un RPC: espera `latency` segundos
+    (para simular la red) y se cuenta en `stats`.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: Dict[str, Dict[str, dict]] = {}
+        self.stats: Counter = Counter()
+        self._lock = threading.RLock()
+
+    def _collection(self, name: str) -> Dict[str, dict]:
+        return self.data.setdefault(name, {})
+
+    def _rpc(self, kind: str, reads: int = 0, writes: int = 0, blocking: bool = True):
+        """
+        Cuenta un RPC. Las llamadas síncronas esperan la latencia aquí; las
+        del cliente asíncrono la esperan con `asyncio.sleep`.
+        """
+        with self._lock:
+            self.stats["rpcs"] += 1
+            self.stats[kind] += 1
+            self.stats["reads"] += reads
+            self.stats["writes"] += writes
+        if blocking and self.latency:
+            time.sleep(self.latency)
+
+    def _apply_set(self, reference: FakeDocumentReference, data: dict, merge: bool):
+        with self._lock:
+            documents = self._collection(reference.collection_name)
+            if merge and reference.id in documents:
+                documents[reference.id].update(data)
+            else:
+                documents[reference.id] = dict(data)
+
+    def _apply_update(self, reference: FakeDocumentReference, data: dict):
+        with self._lock:
+            documents = self._collection(reference.collection_name)
+            if reference.id not in documents:
+                raise KeyError(f"No document to update: {reference.path}")
+            documents[reference.id].update(data)
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def document(self, path: str) -> FakeDocumentReference:
+        collection, doc_id = path.split("/", 1)
+        return FakeDocumentReference(self, collection, doc_id)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        self._rpc("get_all", reads=len(references))
+        for reference in references:
+            data = self._collection(reference.collection_name).get(reference.id)
+            if data is not None:
+                data = _project(data, field_paths) if field_paths is not None else dict(data)
+            yield FakeDocumentSnapshot(reference, data)
+
+
+class _AsyncDocumentReference:
+    def __init__(self, reference: FakeDocumentReference):
+        self._reference = reference
+        self.id = reference.id
+        self.path = reference.path
+
+    async def _rpc(self, method: str, *args, **kwargs):
+        result = getattr(self._reference, method)(*args, blocking=False, **kwargs)
+        if self._reference._store.latency:
+            await asyncio.sleep(self._reference._store.latency)
+        return result
+
+    async def get(self, transaction=None) -> FakeDocumentSnapshot:
+        return await self._rpc("get")
+
+    async def set(self, data: dict, merge: bool = False):
+        await self._rpc("set", data, merge=merge)
+
+    async def update(self, data: dict):
+        await self._rpc("update", data)
+
+    async def delete(self):
+        await self._rpc("delete")
+
+
+class _AsyncQuery:
+    def __init__(self, query: FakeQuery):
+        self._query = query
+
+    def where(self, *args, **kwargs) -> "_AsyncQuery":
+        return _AsyncQuery(self._query.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs) -> "_AsyncQuery":
+        return _AsyncQuery(self._query.order_by(*args, **kwargs))
+
+    def limit(self, count: int) -> "_AsyncQuery":
+        return _AsyncQuery(self._query.limit(count))
+
+    def start_after(self, snapshot) -> "_AsyncQuery":
+        return _AsyncQuery(self._query.start_after(snapshot))
+
+    def select(self, field_paths) -> "_AsyncQuery":
+        return _AsyncQuery(self._query.select(field_paths))
+
+    async def get(self, transaction=None) -> List[FakeDocumentSnapshot]:
+        documents = self._query._run(blocking=False)
+        if self._query._store.latency:
+            await asyncio.sleep(self._query._store.latency)
+        return documents
+
+    async def stream(self, transaction=None):
+        for snapshot in await self.get():
+            yield snapshot
+
+
+class _AsyncCollectionReference(_AsyncQuery):
+    def __init__(self, collection: FakeCollectionReference):
+        super().__init__(collection)
+        self.id = collection.id
+
+    def document(self, doc_id: Optional[str] = None) -> _AsyncDocumentReference:
+        return _AsyncDocumentReference(self._query.document(doc_id))
+
+
+class FakeAsyncFirestore:
+    """
+    Cliente asíncrono (equivalente a `firestore_async.client()`) sobre el
+    mismo almacenamiento que un `FakeFirestore`.
+    """
+
+    def __init__(self, store: FakeFirestore):
+        self.store = store
+
+    def collection(self, name: str) -> _AsyncCollectionReference:
+        return _AsyncCollectionReference(self.store.collection(name))
+
+    def document(self, path: str) -> _AsyncDocumentReference:
+        return _AsyncDocumentReference(self.store.document(path))
+
+
+# --- Firebase Auth ---
+
+class FakeAuth:
+    """
+    Reemplazo en memoria de `AsyncAuth`. Cada llamada espera `latency`
+    segundos y, como el pool de hilos real, no hay más de `max_workers`
+    llamadas en curso a la vez. Las excepciones son las del SDK
+    (`auth.UserNotFoundError`, `auth.InvalidIdTokenError`).
+    """
+
+    def __init__(self, latency: float = 0.0, max_workers: int = 16):
+        self.latency = latency
+        self.max_workers = max_workers
+        self.users: Dict[str, SimpleNamespace] = {}
+        self.uids_by_email: Dict[str, str] = {}
+        self.tokens: Dict[str, dict] = {}
+        self.stats: Counter = Counter()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def add_user(self, uid: str, email: str, disabled: bool = False) -> SimpleNamespace:
+        user = SimpleNamespace(uid=uid, email=email, disabled=disabled, display_name=None)
+        self.users[uid] = user
+        self.uids_by_email[email.lower()] = uid
+        return user
+
+    def issue_token(self, uid: str, token: Optional[str] = None, ttl: float = 3600) -> str:
+        token = token or f"token-{uid}"
+        self.tokens[token] = {"uid": uid, "exp": time.time() + ttl}
+        return token
+
+    async def _call(self, method: str):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        self.stats["rpcs"] += 1
+        self.stats[method] += 1
+        async with self._slots:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+    def _user(self, uid: str) -> SimpleNamespace:
+        if uid not in self.users:
+            raise auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}.")
+        return self.users[uid]
+
+    async def verify_id_token(self, id_token: str, check_revoked: bool = False) -> dict:
+        await self._call("verify_id_token")
+        claims = self.tokens.get(id_token)
+        if claims is None:
+            raise auth.InvalidIdTokenError("Invalid ID token.")
+        return dict(claims)
+
+    async def get_user(self, uid: str):
+        await self._call("get_user")
+        return self._user(uid)
+
+    async def get_user_by_email(self, email: str):
+        await self._call("get_user_by_email")
+        uid = self.uids_by_email.get(email.lower())
+        if uid is None:
+            raise auth.UserNotFoundError(f"No user record found for the provided email: {email}.")
+        return self.users[uid]
+
+    async def get_users(self, identifiers: list):
+        await self._call("get_users")
+        if len(identifiers) > 100:
+            raise ValueError("identifiers parameter must have <= 100 entries.")
+        found, not_found = [], []
+        for identifier in identifiers:
+            if isinstance(identifier, auth.EmailIdentifier):
+                uid = self.uids_by_email.get(identifier.email.lower())
+            else:
+                uid = getattr(identifier, "uid", None)
+            if uid in self.users:
+                found.append(self.users[uid])
+            else:
+                not_found.append(identifier)
+        return SimpleNamespace(users=found, not_found=not_found)
+
+    async def update_user(self, uid: str, **kwargs):
+        await self._call("update_user")
+        user = self._user(uid)
+        for key, value in kwargs.items():
+            setattr(user, key, value)
+        return user
+
+    async def delete_user(self, uid: str):
+        await self._call("delete_user")
+        user = self.users.pop(self._user(uid).uid)
+        self.uids_by_email.pop((user.email or "").lower(), None)
+
+    async def delete_users(self, uids: list):
+        await self._call("delete_users")
+        if len(uids) > 1000:
+            raise ValueError("uids parameter must have <= 1000 entries.")
+        for uid in uids:
+            user = self.users.pop(uid, None)
+            if user is not None:
+                self.uids_by_email.pop((user.email or "").lower(), None)
+        return SimpleNamespace(success_count=len(uids), failure_count=0, errors=[])
+
+    def shutdown(self):
+        pass
+
+
+# --- Datos sintéticos ---
+
+ADMIN_UID = "benchmark-admin"
+ADMIN_TOKEN = "benchmark-admin-token"
+
+
+def seed_students(
+    db: FakeFirestore,
+    auth_client: FakeAuth,
+    count: int,
+    overdue_ratio: float = 0.3,
+    scholarship_ratio: float = 0.05,
+    guardian_ratio: float = 0.5,
+    missing_in_auth_ratio: float = 0.02,
+    seed: int = 42,
+) -> List[dict]:
+    """
+    Crea `count` alumnos con la forma de `app.schemas.user.Student` y su
+    cuenta en Auth. Con la misma semilla se generan siempre los mismos datos.
+    Devuelve los documentos creados (con su `id`).
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    students = db._collection("students")
+    created = []
+    for i in range(count):
+        student_id = f"student-{i:06d}"
+        overdue = rng.random() < overdue_ratio
+        monthly_fee = float(rng.choice([150, 180, 200, 250, 300]))
+        next_payment = today + timedelta(days=-rng.randint(1, 60) if overdue else rng.randint(0, 30))
+        student = {
+            "first_name": f"Alumno{i}",
+            "last_name": f"Benchmark{i % 97}",
+            "email": f"alumno{i}@example.com",
+            "phone_number": f"9{i:08d}",
+            "start_date": (today - timedelta(days=rng.randint(30, 720))).isoformat(),
+            "monthly_fee": monthly_fee,
+            "debt": monthly_fee if overdue else 0.0,
+            "assigned_platforms": rng.sample(["Flyfar", "Moodle", "Khan Academy", "Duolingo"], k=2),
+            "status": "active",
+            "next_payment_date": next_payment.isoformat(),
+            "scholarship": None,
+            "guardian": None,
+        }
+        if rng.random() < scholarship_ratio:
+            student["scholarship"] = {
+                "percentage": rng.choice([25, 50, 100]),
+                "start_date": (today - timedelta(days=30)).isoformat(),
+                "end_date": (today + timedelta(days=180)).isoformat(),
+            }
+        if rng.random() < guardian_ratio:
+            student["guardian"] = {"name": f"Apoderado{i}", "email": f"apoderado{i}@example.com", "phone_number": None}
+        students[student_id] = student
+        if rng.random() >= missing_in_auth_ratio:
+            auth_client.add_user(uid=f"uid-{i:06d}", email=student["email"])
+        created.append({**student, "id": student_id})
+    return created
+
+
+def seed_admin(db: FakeFirestore, auth_client: FakeAuth, role: str = "admin") -> str:
+    """
+    Crea el usuario administrador y devuelve un ID token válido para él.
+    """
+    auth_client.add_user(uid=ADMIN_UID, email="admin@example.com")
+    db._collection("users")[ADMIN_UID] = {"role": role, "email": "admin@example.com"}
+    return auth_client.issue_token(ADMIN_UID, token=ADMIN_TOKEN)
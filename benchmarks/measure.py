@@ -0,0 +1,140 @@
+# benchmarks/measure.py
+
+import asyncio
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    students: int
+    operations: int
+    errors: int
+    seconds: float
+    throughput: float
+    unit: str
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    peak_memory_mb: Optional[float]
+    details: dict = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class Recorder:
+    """
+    Acumula la latencia y el resultado de cada operación de un escenario, y
+    mide el pico de memoria con `tracemalloc` si está activo.
+    """
+
+    def __init__(self, scenario: str, students: int, unit: str):
+        self.scenario = scenario
+        self.students = students
+        self.unit = unit
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.items = 0
+        self.details: dict = {}
+        self._started = 0.0
+        self._finished = 0.0
+
+    def __enter__(self) -> "Recorder":
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._finished = time.perf_counter()
+        self._peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        return False
+
+    async def time_async(self, operation: Awaitable, items: int = 1) -> Any:
+        started = time.perf_counter()
+        try:
+            return await operation
+        except Exception:
+            self.errors += 1
+            return None
+        finally:
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            self.items += items
+
+    def time_sync(self, func: Callable[[], Any], items: int = 1) -> Any:
+        started = time.perf_counter()
+        try:
+            return func()
+        except Exception:
+            self.errors += 1
+            return None
+        finally:
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            self.items += items
+
+    def result(self) -> ScenarioResult:
+        seconds = self._finished - self._started
+        latencies = sorted(self.latencies)
+        return ScenarioResult(
+            scenario=self.scenario,
+            students=self.students,
+            operations=len(latencies),
+            errors=self.errors,
+            seconds=round(seconds, 4),
+            throughput=round(self.items / seconds, 1) if seconds > 0 else 0.0,
+            unit=self.unit,
+            p50_ms=round(percentile(latencies, 50), 3),
+            p95_ms=round(percentile(latencies, 95), 3),
+            p99_ms=round(percentile(latencies, 99), 3),
+            max_ms=round(latencies[-1], 3) if latencies else 0.0,
+            peak_memory_mb=round(self._peak / 1024 / 1024, 2) if self._peak is not None else None,
+            details=self.details,
+        )
+
+
+async def run_concurrently(items: Iterable[Any], unit: Callable[[Any], Awaitable[Any]], concurrency: int, recorder: Recorder):
+    """
+    Ejecuta `unit` sobre cada elemento con `concurrency` workers, registrando
+    la latencia de cada llamada. Una llamada que devuelve False cuenta como error.
+    """
+    source = iter(items)
+    done = object()
+
+    async def worker():
+        while True:
+            item = next(source, done)
+            if item is done:
+                return
+            outcome = await recorder.time_async(unit(item))
+            if outcome is False:
+                recorder.errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+
+def format_table(results: List[ScenarioResult]) -> str:
+    headers = ["scenario", "students", "ops", "errors", "seconds", "throughput", "p50 ms", "p95 ms", "p99 ms", "peak MB"]
+    rows = [
+        [
+            r.scenario, str(r.students), str(r.operations), str(r.errors), f"{r.seconds:.3f}",
+            f"{r.throughput:.1f} {r.unit}", f"{r.p50_ms:.2f}", f"{r.p95_ms:.2f}", f"{r.p99_ms:.2f}",
+            f"{r.peak_memory_mb:.2f}" if r.peak_memory_mb is not None else "-",
+        ]
+        for r in results
+    ]
+    widths = [max(len(h), *(len(row[i]) for row in rows)) if rows else len(h) for i, h in enumerate(headers)]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(headers, widths)), "  ".join("-" * w for w in widths)]
+    lines += ["  ".join(cell.ljust(w) for cell, w in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
@@ -0,0 +1,238 @@
+# benchmarks/scenarios.py
+
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+from app.core.config import settings
+from app.schemas.email import PaymentReminderEmail
+from app.schemas.email_payloads import EmailPayloadBuilder, student_contact
+from app.services.email_outbox import EMAIL_KINDS
+from app.services.email_service import EmailService
+from app.services.smtp_pool import SMTPConnectionPool
+from app.services.user_service import UserService
+from app.utils import security
+from app.utils.auth_cache import AuthCache
+from benchmarks.fakes import FakeAsyncFirestore, FakeAuth, FakeFirestore, seed_admin, seed_students
+from benchmarks.measure import Recorder, ScenarioResult, run_concurrently
+from benchmarks.smtp_sink import SMTPSink
+
+
+@dataclass
+class BenchmarkOptions:
+    concurrency: int = settings.CRON_CONCURRENCY
+    repeat: int = 5
+    firestore_latency: float = 0.005
+    auth_latency: float = 0.005
+    auth_workers: int = settings.AUTH_THREAD_POOL_SIZE
+    smtp_latency: float = 0.0
+    smtp_failure_rate: float = 0.0
+    smtp_failure_code: int = 451
+    smtp_pool_size: int = settings.SMTP_POOL_SIZE
+    seed: int = 42
+
+
+def _environment(size: int, options: BenchmarkOptions):
+    db = FakeFirestore(latency=options.firestore_latency)
+    auth_client = FakeAuth(latency=options.auth_latency, max_workers=options.auth_workers)
+    students = seed_students(db, auth_client, size, seed=options.seed)
+    return db, auth_client, students
+
+
+@contextmanager
+def inject(module, **attributes):
+    """
+    Sustituye temporalmente atributos de un módulo (p. ej. los clientes de
+    Firebase que usa `app.utils.security`).
+    """
+    previous = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(module, name, value)
+
+
+# --- Firestore / Auth ---
+
+async def scan_overdue(size: int, options: BenchmarkOptions, sink: SMTPSink) -> List[ScenarioResult]:
+    db, auth_client, _ = _environment(size, options)
+    service = UserService(db=db, auth_client=auth_client)
+    with Recorder("get_active_students_with_due_payments", size, "students/s") as recorder:
+        for _ in range(options.repeat):
+            overdue = recorder.time_sync(service.get_active_students_with_due_payments, items=size)
+    recorder.details = {
+        "overdue": len(overdue or []),
+        "firestore_rpcs_per_call": db.stats["rpcs"] / options.repeat,
+        "firestore_reads_per_call": db.stats["reads"] / options.repeat,
+    }
+    return [recorder.result()]
+
+
+async def deactivate_one_by_one(size: int, options: BenchmarkOptions, sink: SMTPSink) -> List[ScenarioResult]:
+    db, auth_client, _ = _environment(size, options)
+    service = UserService(db=db, auth_client=auth_client)
+    overdue = service.get_active_students_with_due_payments()
+    db.stats.clear()
+    with Recorder("deactivate_firebase_user", size, "students/s") as recorder:
+        await run_concurrently(overdue, service.deactivate_firebase_user, options.concurrency, recorder)
+    recorder.details = {
+        "overdue": len(overdue),
+        "auth_rpcs": auth_client.stats["rpcs"],
+        "firestore_rpcs": db.stats["rpcs"],
+    }
+    return [recorder.result()]
+
+
+async def deactivate_bulk(size: int, options: BenchmarkOptions, sink: SMTPSink) -> List[ScenarioResult]:
+    db, auth_client, _ = _environment(size, options)
+    service = UserService(db=db, auth_client=auth_client)
+    overdue = service.get_active_students_with_due_payments()
+    db.stats.clear()
+    with Recorder("deactivate_firebase_users", size, "students/s") as recorder:
+        report = await recorder.time_async(service.deactivate_firebase_users(overdue), items=len(overdue))
+    statuses: Dict[str, int] = {}
+    for entry in (report or {}).values():
+        statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+    recorder.details = {
+        "overdue": len(overdue),
+        "statuses": statuses,
+        "auth_rpcs": auth_client.stats["rpcs"],
+        "firestore_rpcs": db.stats["rpcs"],
+    }
+    return [recorder.result()]
+
+
+async def admin_auth(size: int, options: BenchmarkOptions, sink: SMTPSink) -> List[ScenarioResult]:
+    """
+    `size` peticiones autenticadas de un administrador con la caché de
+    tokens y roles vacía al empezar.
+    """
+    db = FakeFirestore(latency=options.firestore_latency)
+    auth_client = FakeAuth(latency=options.auth_latency, max_workers=options.auth_workers)
+    async_db = FakeAsyncFirestore(db)
+    token = seed_admin(db, auth_client)
+    cache = AuthCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_ROLE_CACHE_SIZE, settings.AUTH_ROLE_CACHE_TTL)
+    with inject(security, async_auth=auth_client, async_db=async_db, auth_cache=cache):
+        with Recorder("get_current_admin_user", size, "requests/s") as recorder:
+            await run_concurrently(range(size), lambda _: security.get_current_admin_user(token), options.concurrency, recorder)
+    recorder.details = {"auth_rpcs": auth_client.stats["rpcs"], "firestore_rpcs": db.stats["rpcs"]}
+    return [recorder.result()]
+
+
+# --- Correos ---
+
+def _guardian(student: dict) -> dict:
+    guardian = student.get("guardian") or {}
+    return {"guardian_name": guardian.get("name"), "guardian_email": guardian.get("email")}
+
+
+def _base(student: dict) -> dict:
+    return {"student_name": f"{student['first_name']} {student['last_name']}", "student_email": student["email"], **_guardian(student)}
+
+
+EMAIL_PAYLOADS: Dict[str, Callable[[dict], dict]] = {
+    "payment_notification": lambda s: {
+        **_base(s), "payment_amount": s["monthly_fee"], "payment_date": s["start_date"],
+        "amount_due": s["debt"], "payment_deadline": s["next_payment_date"],
+    },
+    "payment_reminder": lambda s: {**_base(s), "due_date": s["next_payment_date"], "amount_due": s["monthly_fee"]},
+    "scholarship_notification": lambda s: {
+        **_base(s), "percentage": 50, "new_monthly_fee": s["monthly_fee"] / 2, "next_payment_date": s["next_payment_date"],
+    },
+    "account_deactivation": lambda s: {**_base(s), "amount_due": s["debt"]},
+    "account_status": lambda s: {**_base(s), "status": "desactivada" if s["debt"] else "activada"},
+    "platform_assignment": lambda s: {
+        **_base(s), "platforms": [{"name": name, "url": f"https://{name.lower().replace(' ', '')}.example.com"} for name in s["assigned_platforms"]],
+    },
+}
+
+
+async def send_emails(size: int, options: BenchmarkOptions, sink: SMTPSink) -> List[ScenarioResult]:
+    _, _, students = _environment(size, options)
+    pool = SMTPConnectionPool(
+        hostname=sink.host,
+        port=sink.port,
+        username=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD,
+        size=options.smtp_pool_size,
+        idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT,
+        max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+        healthcheck_interval=settings.SMTP_POOL_HEALTHCHECK_INTERVAL,
+        timeout=settings.SMTP_TIMEOUT,
+        start_tls=False,
+    )
+    service = EmailService(pool=pool)
+    await service.start()
+    results = []
+    try:
+        for kind, (schema, method_name) in EMAIL_KINDS.items():
+            payloads = [schema.model_validate(EMAIL_PAYLOADS[kind](student)) for student in students]
+            send = getattr(service, method_name)
+            sink.reset_counters()
+            with Recorder(f"EmailService.{method_name}", size, "emails/s") as recorder:
+                await run_concurrently(payloads, send, options.concurrency, recorder)
+            recorder.details = {"accepted": sink.messages, "rejected": sink.rejected, "smtp_connections": sink.connections}
+            results.append(recorder.result())
+    finally:
+        await service.close()
+    return results
+
+
+async def build_payloads(size: int, options: BenchmarkOptions, sink: SMTPSink) -> List[ScenarioResult]:
+    """
+    Coste por alumno de construir los recordatorios de pago: un constructor
+    validado por registro frente a `EmailPayloadBuilder` con la caché de
+    contactos vacía (primera ejecución) y llena (ejecuciones siguientes).
+    """
+    _, _, students = _environment(size, options)
+    fields = [{"due_date": s["next_payment_date"], "amount_due": s["monthly_fee"]} for s in students]
+    builder = EmailPayloadBuilder(cache_size=size)
+
+    def per_record():
+        return [PaymentReminderEmail(**EMAIL_PAYLOADS["payment_reminder"](s)) for s in students]
+
+    def warm_cache():
+        return builder.build_many(PaymentReminderEmail, [(student_contact(s), extra) for s, extra in zip(students, fields)]).items
+
+    def cold_cache():
+        builder.clear()
+        return warm_cache()
+
+    runs = [
+        ("PaymentReminderEmail per record", per_record),
+        ("EmailPayloadBuilder cold cache", cold_cache),
+        ("EmailPayloadBuilder warm cache", warm_cache),
+    ]
+    results = []
+    for name, run in runs:
+        with Recorder(name, size, "payloads/s") as recorder:
+            for _ in range(options.repeat):
+                payloads = recorder.time_sync(run, items=size)
+        recorder.details = {"payloads": len(payloads or []), "us_per_payload": round(sum(recorder.latencies) * 1000 / (options.repeat * size), 2)}
+        results.append(recorder.result())
+    return results
+
+
+SCENARIOS = {
+    "scan": scan_overdue,
+    "deactivate": deactivate_one_by_one,
+    "deactivate_bulk": deactivate_bulk,
+    "email": send_emails,
+    "payloads": build_payloads,
+    "auth": admin_auth,
+}
+
+
+async def run_scenarios(names: List[str], sizes: List[int], options: BenchmarkOptions, sink: SMTPSink, on_result=None) -> List[ScenarioResult]:
+    results = []
+    for size in sizes:
+        for name in names:
+            for result in await SCENARIOS[name](size, options, sink):
+                results.append(result)
+                if on_result:
+                    on_result(result)
+            await asyncio.sleep(0)
+    return results
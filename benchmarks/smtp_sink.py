@@ -0,0 +1,119 @@
+# benchmarks/smtp_sink.py
+
+import asyncio
+import random
+import threading
+from typing import Iterable, Optional
+
+
+class SMTPSink:
+    """
+    Servidor SMTP mínimo que acepta (y descarta) todos los correos.
+
+    Corre en su propio hilo y event loop para no competir con el código
+    medido. Permite inyectar:
+    - `latency`: segundos de espera antes de responder a cada DATA.
+    - `failure_rate`: probabilidad de rechazar un mensaje con `failure_code`
+      (por defecto 451, un error temporal; 550 simula un rechazo permanente).
+    - `bounce_recipients`: direcciones rechazadas en RCPT TO con 550 5.1.1.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_code: int = 451,
+        seed: int = 0,
+        bounce_recipients: Iterable[str] = (),
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.bounce_recipients = {email.lower() for email in bounce_recipients}
+        self.messages = 0
+        self.rejected = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        writer.write(b"220 benchmark-sink ESMTP\r\n")
+        in_data = False
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if in_data:
+                    if line != b".\r\n":
+                        continue
+                    in_data = False
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    if self.failure_rate and self._random.random() < self.failure_rate:
+                        self.rejected += 1
+                        writer.write(f"{self.failure_code} Injected failure\r\n".encode())
+                    else:
+                        self.messages += 1
+                        writer.write(b"250 OK: queued\r\n")
+                else:
+                    command = line[:4].upper()
+                    if command in (b"EHLO", b"HELO"):
+                        writer.write(b"250-benchmark-sink\r\n250-8BITMIME\r\n250 AUTH PLAIN\r\n")
+                    elif command == b"AUTH":
+                        writer.write(b"235 Authentication successful\r\n")
+                    elif command == b"RCPT" and self._bounces(line):
+                        writer.write(b"550 5.1.1 Recipient address rejected: user unknown\r\n")
+                    elif command == b"DATA":
+                        in_data = True
+                        writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    elif command == b"QUIT":
+                        writer.write(b"221 Bye\r\n")
+                        await writer.drain()
+                        break
+                    else:
+                        writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _bounces(self, line: bytes) -> bool:
+        if not self.bounce_recipients:
+            return False
+        address = line.decode(errors="replace").partition("<")[2].partition(">")[0]
+        return address.lower() in self.bounce_recipients
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    def start(self) -> "SMTPSink":
+        self._thread = threading.Thread(target=self._run, name="smtp-sink", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+
+    def reset_counters(self):
+        self.messages = self.rejected = self.connections = 0
@@ -0,0 +1,23 @@
+# tests/conftest.py
+
+import os
+
+# La configuración exige las credenciales de Firebase y SMTP al importarse;
+# las pruebas no se conectan a ninguno de los dos.
+os.environ.setdefault("FIREBASE_SERVICE_ACCOUNT_KEY_PATH", "/nonexistent/service-account.json")
+os.environ.setdefault("FIREBASE_DATABASE_URL", "https://example.firebaseio.com")
+os.environ.setdefault("SMTP_HOST", "127.0.0.1")
+os.environ.setdefault("SMTP_PORT", "2525")
+os.environ.setdefault("SMTP_USER", "bot@example.com")
+os.environ.setdefault("SMTP_PASSWORD", "secret")
+os.environ.setdefault("FRONTEND_URL", "http://localhost:3000")
+
+import pytest
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    """
+    Base SQLite local propia de cada prueba.
+    """
+    return str(tmp_path / "local.db")
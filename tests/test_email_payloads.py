@@ -0,0 +1,102 @@
+# tests/test_email_payloads.py
+
+import pytest
+from app.schemas import email_payloads as payloads
+from app.schemas.email import EmailBase, PaymentReminderEmail
+from app.schemas.email_payloads import EmailPayloadBuilder, describe_errors, student_contact, validate_many
+
+
+def _contact(name: str = "Ana Pérez", email: str = "ana@example.com", **extra) -> dict:
+    return {"student_name": name, "student_email": email, "guardian_name": None, "guardian_email": None, **extra}
+
+
+def test_validate_many_reports_invalid_records_and_keeps_the_rest():
+    records = [_contact(), _contact(email="not-an-email"), _contact(name="Luis", email="luis@example.com")]
+
+    batch = validate_many(EmailBase, records)
+
+    assert [item is not None for item in batch.items] == [True, False, True]
+    assert batch.items[2].student_name == "Luis"
+    assert list(batch.errors) == [1]
+    assert batch.errors[1][0]["loc"] == ["student_email"]
+
+
+def test_validate_many_without_errors():
+    batch = validate_many(EmailBase, [_contact()])
+
+    assert batch.errors == {}
+    assert batch.items[0].student_email == "ana@example.com"
+
+
+def test_describe_errors():
+    batch = validate_many(EmailBase, [{"student_email": "ana@example.com"}])
+
+    assert describe_errors(batch.errors[0]).startswith("student_name: ")
+
+
+def test_student_contact():
+    student = {"first_name": "Ana", "last_name": None, "email": "ana@example.com", "guardian": {"name": "Rosa", "email": ""}}
+
+    assert student_contact(student) == {
+        "student_name": "Ana",
+        "student_email": "ana@example.com",
+        "guardian_name": "Rosa",
+        "guardian_email": "",
+    }
+    assert student_contact({}, email="auth@example.com")["student_email"] == "auth@example.com"
+    assert student_contact({})["student_name"] is None
+
+
+def test_build_many_builds_valid_payloads_and_reports_each_invalid_one():
+    builder = EmailPayloadBuilder()
+    records = [
+        (_contact(guardian_email=""), {"due_date": "2024-05-01", "amount_due": "120.5"}),
+        (_contact(email="bad"), {"due_date": "2024-05-01", "amount_due": 10}),
+        (_contact(), {"due_date": "2024-05-01", "amount_due": "abc"}),
+    ]
+
+    batch = builder.build_many(PaymentReminderEmail, records)
+
+    reminder = batch.items[0]
+    assert isinstance(reminder, PaymentReminderEmail)
+    assert reminder.amount_due == 120.5
+    assert reminder.guardian_email is None
+    assert batch.items[1] is None and batch.items[2] is None
+    assert batch.errors[1][0]["loc"] == ["student_email"]
+    assert batch.errors[2][0]["loc"] == ["amount_due"]
+
+
+def test_contacts_are_validated_once(monkeypatch):
+    builder = EmailPayloadBuilder()
+    calls = []
+    original = payloads.validate_many
+
+    def counting(model, records):
+        calls.append((model, len(records)))
+        return original(model, records)
+
+    monkeypatch.setattr(payloads, "validate_many", counting)
+    records = [(_contact(), {"due_date": "2024-05-01", "amount_due": 1}), (_contact(), {"due_date": "2024-06-01", "amount_due": 2})]
+    builder.build_many(PaymentReminderEmail, records)
+    builder.build_many(PaymentReminderEmail, records)
+
+    contact_validations = [count for model, count in calls if model is EmailBase]
+    assert contact_validations == [1] # Un contacto repetido, validado una sola vez
+
+
+def test_contact_cache_is_bounded():
+    builder = EmailPayloadBuilder(cache_size=2)
+
+    builder.contacts([_contact(email=f"s{i}@example.com") for i in range(3)])
+
+    assert len(builder._contacts) == 2
+    builder.clear()
+    assert len(builder._contacts) == 0
+
+
+def test_build_raises_on_invalid_records():
+    builder = EmailPayloadBuilder()
+
+    assert builder.build(PaymentReminderEmail, _contact(), due_date="2024-05-01", amount_due=10).amount_due == 10
+    with pytest.raises(ValueError, match="Invalid PaymentReminderEmail"):
+        builder.build(PaymentReminderEmail, _contact(), due_date="2024-05-01")
@@ -0,0 +1,97 @@
+# tests/test_email_templates.py
+
+from app.services.email_templates import Fragment, html_to_text, load_default_templates
+
+templates = load_default_templates()
+
+# Marcado que generaba email_service antes del registro de plantillas
+BASELINE_DEBT = (
+    "<p><strong>Importante:</strong> Tienes un saldo pendiente de <strong>S/ 150.00</strong>. "
+    "Tienes hasta el <strong>2024-05-10</strong> para completarlo.</p>"
+)
+BASELINE_NO_DEBT = "<p>¡Excelente! No tienes deudas pendientes.</p>"
+BASELINE_ACTIVATED = "<p>Nos complace informarte que tu acceso a la plataforma ha sido restaurado. ¡Ya puedes ingresar!</p>"
+BASELINE_DEACTIVATED = (
+    "<p>Te informamos que tu acceso a la plataforma ha sido desactivado por un administrador. "
+    "Si crees que es un error, por favor comunícate con nosotros.</p>"
+)
+BASELINE_PLATFORM = "<li><strong>Aula:</strong> <a href='https://aula.example.com'>Acceder aquí</a></li>"
+
+
+def test_user_values_are_escaped_in_the_html_only():
+    rendered = templates.render(
+        "account_status",
+        student_name="<script>alert('x')</script> & Co",
+        status_text="ha sido activada",
+        message_body=templates.fragment("account_status_activated"),
+    )
+
+    assert "<script>" not in rendered.html
+    assert "&lt;script&gt;alert(&#x27;x&#x27;)&lt;/script&gt; &amp; Co" in rendered.html
+    assert "<script>alert('x')</script> & Co" in rendered.text
+    assert rendered.subject == "Tu cuenta de AD Academy ha sido activada"
+
+
+def test_attribute_values_cannot_break_out_of_quotes():
+    item = templates.fragment("platform_item", name="Aula", url="https://x.example.com/' onclick='steal()")
+
+    assert "href='https://x.example.com/&#x27; onclick=&#x27;steal()'" in item.html
+
+
+def test_fragments_match_the_baseline_markup():
+    assert templates.fragment("payment_debt_pending", amount_due="150.00", payment_deadline="2024-05-10").html == BASELINE_DEBT
+    assert templates.fragment("payment_no_debt").html == BASELINE_NO_DEBT
+    assert templates.fragment("account_status_activated").html == BASELINE_ACTIVATED
+    assert templates.fragment("account_status_deactivated").html == BASELINE_DEACTIVATED
+    assert templates.fragment("platform_item", name="Aula", url="https://aula.example.com").html == BASELINE_PLATFORM
+
+
+def test_fragments_are_inserted_without_escaping():
+    platforms = Fragment.join([
+        templates.fragment("platform_item", name="Aula", url="https://aula.example.com"),
+        templates.fragment("platform_item", name="Flyfar", url="https://flyfar.example.com"),
+    ])
+
+    rendered = templates.render("platform_assignment", student_name="Ana", platforms=platforms)
+
+    assert f"<ul>{BASELINE_PLATFORM}<li><strong>Flyfar:</strong>" in rendered.html
+    assert rendered.html.startswith("<html><body><h2>¡Bienvenido, Ana!</h2>")
+    assert rendered.html.endswith("<p>Atentamente,<br>El equipo de <strong>AD Academy</strong>.</p></body></html>")
+    assert "- Aula: Acceder aquí (https://aula.example.com)\n- Flyfar: Acceder aquí (https://flyfar.example.com)" in rendered.text
+
+
+def test_plain_text_part():
+    rendered = templates.render("payment_reminder", student_name="Ana", amount_due="150.00", due_date="2024-05-10")
+
+    assert rendered.text == (
+        "Recordatorio de Pago, Ana\n\n"
+        "Te escribimos para recordarte que tienes un pago pendiente con la academia.\n\n"
+        "- Monto a Pagar: S/ 150.00\n"
+        "- Fecha de Vencimiento: 2024-05-10\n\n"
+        "Por favor, realiza tu pago a la brevedad para evitar la desactivación de tu cuenta.\n\n"
+        "Atentamente,\nEl equipo de AD Academy."
+    )
+
+
+def test_payment_notification_has_no_signature():
+    rendered = templates.render(
+        "payment_notification",
+        student_name="Ana",
+        payment_amount="200.00",
+        payment_date="2024-05-01",
+        debt_message=templates.fragment("payment_no_debt"),
+    )
+
+    assert "Atentamente" not in rendered.html
+    assert rendered.text.endswith("¡Excelente! No tienes deudas pendientes.\n\nGracias por ser parte de AD Academy.")
+
+
+def test_html_to_text():
+    assert html_to_text("<p>Hola   <strong>Ana</strong>,</p>\n<p>línea<br>nueva &amp; más</p>") == "Hola Ana,\n\nlínea\nnueva & más"
+    assert html_to_text("<a href='https://a.example.com'>aquí</a>") == "aquí (https://a.example.com)"
+
+
+def test_registry_lookup():
+    assert "payment_reminder" in templates
+    assert "unknown" not in templates
+    assert set(templates.names()) >= {"payment_notification", "platform_item", "account_status"}
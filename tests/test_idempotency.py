@@ -0,0 +1,135 @@
+# tests/test_idempotency.py
+
+import asyncio
+import time
+from app.firebase.firebase_admin import auth
+from app.services.idempotency import IdempotencyStore, SendLedger, StoredResponse, billing_period, request_scope
+from app.utils import security
+
+FINGERPRINT = IdempotencyStore.fingerprint("POST", "/emails/send?", b'{"to": "ana@example.com"}')
+
+
+def test_first_claim_runs_and_repeats_replay_the_stored_response(db_path):
+    store = IdempotencyStore(db_path)
+    scope = request_scope("Bearer token")
+
+    assert store.claim(scope, "key-1", FINGERPRINT).outcome == "new"
+    assert store.claim(scope, "key-1", FINGERPRINT).outcome == "in_progress"
+
+    store.complete(scope, "key-1", StoredResponse(201, "application/json", b'{"ok": true}'))
+    claim = store.claim(scope, "key-1", FINGERPRINT)
+
+    assert claim.outcome == "replay"
+    assert claim.response == StoredResponse(201, "application/json", b'{"ok": true}')
+    assert store.stats() == {"keys": 1, "completed": 1, "in_progress": 0}
+
+
+def test_a_key_reused_with_another_request_is_a_mismatch(db_path):
+    store = IdempotencyStore(db_path)
+    store.claim("scope", "key-1", FINGERPRINT)
+
+    other = IdempotencyStore.fingerprint("POST", "/emails/send?", b'{"to": "luis@example.com"}')
+
+    assert store.claim("scope", "key-1", other).outcome == "mismatch"
+
+
+def test_keys_are_scoped_per_client(db_path):
+    store = IdempotencyStore(db_path)
+    store.claim(request_scope("Bearer a"), "key-1", FINGERPRINT)
+
+    assert store.claim(request_scope("Bearer b"), "key-1", FINGERPRINT).outcome == "new"
+
+
+class FakeVerifier:
+    def __init__(self, tokens: dict):
+        self.tokens = tokens
+
+    async def verify_id_token(self, token: str) -> dict:
+        if token not in self.tokens:
+            raise auth.InvalidIdTokenError("invalid token")
+        return self.tokens[token]
+
+
+def test_a_refreshed_token_keeps_the_scope_of_its_user(db_path, monkeypatch):
+    expires = time.time() + 3600
+    tokens = {"old": {"uid": "u1", "exp": expires}, "new": {"uid": "u1", "exp": expires}, "other": {"uid": "u2", "exp": expires}}
+
+    async def ready():
+        pass
+
+    monkeypatch.setattr(security, "ensure_firebase", ready)
+    monkeypatch.setattr(security, "async_auth", FakeVerifier(tokens))
+
+    def scope(authorization):
+        return request_scope(authorization, uid=asyncio.run(security.verified_uid(authorization)))
+
+    store = IdempotencyStore(db_path)
+    store.claim(scope("Bearer old"), "key-1", FINGERPRINT)
+    store.complete(scope("Bearer old"), "key-1", StoredResponse(201, None, b""))
+
+    assert store.claim(scope("Bearer new"), "key-1", FINGERPRINT).outcome == "replay"
+    assert store.claim(scope("Bearer other"), "key-1", FINGERPRINT).outcome == "new"
+    assert scope("Bearer forged") == request_scope("Bearer forged") # Sin token válido, la cabecera
+    assert scope(None) == request_scope(None)
+
+
+def test_released_and_abandoned_keys_can_be_claimed_again(db_path):
+    store = IdempotencyStore(db_path)
+    store.claim("scope", "released", FINGERPRINT)
+    store.release("scope", "released")
+
+    abandoned = IdempotencyStore(db_path, lock_timeout=0)
+    abandoned.claim("scope", "abandoned", FINGERPRINT)
+
+    assert store.claim("scope", "released", FINGERPRINT).outcome == "new"
+    assert store.claim("scope", "abandoned", FINGERPRINT).outcome == "new"
+
+
+def test_release_keeps_completed_responses(db_path):
+    store = IdempotencyStore(db_path)
+    store.claim("scope", "key-1", FINGERPRINT)
+    store.complete("scope", "key-1", StoredResponse(200, None, b""))
+
+    store.release("scope", "key-1")
+
+    assert store.claim("scope", "key-1", FINGERPRINT).outcome == "replay"
+
+
+def test_expired_keys_are_purged(db_path):
+    store = IdempotencyStore(db_path, ttl=1)
+    store.claim("scope", "key-1", FINGERPRINT)
+
+    assert store.purge(time.time() + 2) == 1
+    assert store.stats()["keys"] == 0
+
+
+def test_ledger_claims_each_send_once(db_path):
+    ledger = SendLedger(db_path)
+
+    first = ledger.claim_many("payment_reminder", [("s1", "2024-05"), ("s2", "2024-05")])
+    second = ledger.claim_many("payment_reminder", [("s1", "2024-05"), ("s1", "2024-06"), ("s3", "2024-05")])
+
+    assert first == ["s1", "s2"]
+    assert second == ["s1", "s3"]
+    assert ledger.claim("s1", "account_deactivation", "2024-05")
+    assert ledger.stats() == {"payment_reminder": 4, "account_deactivation": 1}
+
+
+def test_ledger_is_shared_between_instances(db_path):
+    assert SendLedger(db_path).claim("s1", "payment_reminder", "2024-05")
+    assert not SendLedger(db_path).claim("s1", "payment_reminder", "2024-05")
+
+
+def test_released_sends_can_be_claimed_again(db_path):
+    ledger = SendLedger(db_path)
+    ledger.claim_many("payment_reminder", [("s1", "2024-05"), ("s2", "2024-05")])
+
+    ledger.release_many("payment_reminder", [("s1", "2024-05")])
+
+    assert ledger.claim_many("payment_reminder", [("s1", "2024-05"), ("s2", "2024-05")]) == ["s1"]
+    assert ledger.claim_many("payment_reminder", []) == []
+
+
+def test_billing_period():
+    assert billing_period({"next_payment_date": "2024-05-10"}) == "2024-05"
+    assert billing_period({}) == time.strftime("%Y-%m")
@@ -0,0 +1,70 @@
+# tests/test_logs.py
+
+import json
+import logging
+from app.core import logs
+from app.core.logs import ContextFilter, JsonFormatter, LogSampler, log_context
+
+
+def _record(name: str = "app.services.user_service", level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "message %s", ("arg",), None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_warnings_always_pass():
+    sampler = LogSampler({"app": 0.0}, rate_limit=0.001, burst=1)
+
+    assert all(sampler.filter(_record(level=logging.WARNING)) for _ in range(5))
+
+
+def test_sample_rates_match_the_longest_logger_prefix():
+    sampler = LogSampler({"app": 1.0, "app.services": 0.0}, rate_limit=0, burst=1)
+
+    assert not sampler.filter(_record("app.services.user_service"))
+    assert not sampler.filter(_record("app.services"))
+    assert sampler.filter(_record("app.servicesx"))
+    assert sampler.filter(_record("app.routers.users"))
+
+
+def test_rate_limit_counts_suppressed_records(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logs.time, "monotonic", clock)
+    sampler = LogSampler({}, rate_limit=1.0, burst=2)
+
+    assert [sampler.filter(_record()) for _ in range(5)] == [True, True, False, False, False]
+    clock.now += 1.0
+    record = _record()
+
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+
+
+def test_rate_limit_is_per_logger(monkeypatch):
+    monkeypatch.setattr(logs.time, "monotonic", FakeClock())
+    sampler = LogSampler({}, rate_limit=1.0, burst=1)
+
+    assert sampler.filter(_record("app.a"))
+    assert not sampler.filter(_record("app.a"))
+    assert sampler.filter(_record("app.b"))
+
+
+def test_json_formatter_includes_context_and_extra_fields():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "sent %d", (3,), None)
+    record.student_id = "s1"
+    with log_context(request_id="req-1"):
+        ContextFilter().filter(record)
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == "sent 3"
+    assert entry["request_id"] == "req-1"
+    assert entry["student_id"] == "s1"
+    assert "run_id" not in entry
+    assert logs.request_id_var.get() is None
@@ -0,0 +1,56 @@
+# tests/test_reports.py
+
+import csv
+import io
+import json
+import pytest
+from app.services.reports import ReportEncoder, firestore_fields, parse_fields
+
+STUDENT = {
+    "id": "s1",
+    "first_name": "Ana",
+    "email": "ana@example.com",
+    "debt": 120.5,
+    "guardian": {"email": "rosa@example.com"},
+    "assigned_platforms": [{"name": "Aula", "url": "https://aula.example.com"}],
+}
+
+
+def test_ndjson_rows_follow_the_requested_fields():
+    encoder = ReportEncoder(["id", "guardian.email", "guardian.phone_number", "scholarship.percentage"], "ndjson")
+
+    lines = encoder.encode_rows([STUDENT, {"id": "s2", "guardian": None}]).splitlines()
+
+    assert encoder.header() == ""
+    assert encoder.media_type == "application/x-ndjson"
+    assert json.loads(lines[0]) == {"id": "s1", "guardian.email": "rosa@example.com", "guardian.phone_number": None, "scholarship.percentage": None}
+    assert json.loads(lines[1])["guardian.email"] is None
+
+
+def test_csv_header_and_rows():
+    encoder = ReportEncoder(["id", "first_name", "debt", "assigned_platforms", "scholarship.percentage"], "csv")
+
+    body = encoder.header() + encoder.encode_rows([STUDENT, {"id": "s2", "first_name": 'Luis, "el grande"'}])
+    rows = list(csv.reader(io.StringIO(body)))
+
+    assert rows[0] == ["id", "first_name", "debt", "assigned_platforms", "scholarship.percentage"]
+    assert rows[1][:3] == ["s1", "Ana", "120.5"]
+    assert json.loads(rows[1][3]) == STUDENT["assigned_platforms"]
+    assert rows[1][4] == ""
+    assert rows[2][1] == 'Luis, "el grande"'
+
+
+def test_empty_page_encodes_to_nothing():
+    assert ReportEncoder(["id"], "csv").encode_rows([]) == ""
+    assert ReportEncoder(["id"], "ndjson").encode_rows([]) == ""
+
+
+def test_parse_fields():
+    assert parse_fields(" id, email ,id,,guardian.email") == ["id", "email", "guardian.email"]
+    assert "debt" in parse_fields(None)
+    with pytest.raises(ValueError, match="password"):
+        parse_fields("id,password")
+
+
+def test_firestore_fields_drop_the_document_id():
+    assert firestore_fields(["id", "email", "guardian.email"]) == ["email", "guardian.email"]
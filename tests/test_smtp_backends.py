@@ -0,0 +1,166 @@
+# tests/test_smtp_backends.py
+
+import asyncio
+import time
+from email.message import EmailMessage
+from typing import List, Optional
+import aiosmtplib
+import pytest
+from app.services.smtp_backends import SMTPBackend, SMTPBackendSet, SMTPBackendsUnavailable
+from app.services.smtp_governor import SendDeferred
+
+
+class FakePool:
+    """
+    Pool que registra los mensajes enviados o lanza `error`.
+    """
+
+    def __init__(self, error: Optional[BaseException] = None):
+        self.hostname = "smtp.example.com"
+        self.port = 587
+        self.error = error
+        self.sent: List[EmailMessage] = []
+
+    async def send_message(self, message):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(message)
+        return ({}, "OK")
+
+
+class FakeGovernor:
+    def __init__(self, delay: float = 0.0, deferred: Optional[SendDeferred] = None):
+        self.delay = delay
+        self.deferred = deferred
+
+    def send_delay(self) -> float:
+        return self.delay
+
+    async def acquire(self, recipients: int):
+        if self.deferred is not None:
+            raise self.deferred
+
+    def on_success(self, latency: float):
+        pass
+
+    async def on_failure(self, recipients, code, message):
+        return None
+
+    async def release(self, recipients: int):
+        pass
+
+    async def refresh_usage(self):
+        pass
+
+
+def _backend(name: str, weight: float = 1.0, pool: Optional[FakePool] = None, governor=None) -> SMTPBackend:
+    return SMTPBackend(name, pool or FakePool(), sender=f"{name}@example.com", governor=governor, weight=weight, retry_base=10, retry_max=60)
+
+
+def _message() -> EmailMessage:
+    message = EmailMessage()
+    message["To"] = "student@example.com"
+    message["Subject"] = "Test"
+    message.set_content("Hola")
+    return message
+
+
+def test_pick_is_a_smooth_weighted_round_robin():
+    backends = SMTPBackendSet([_backend("a", weight=2), _backend("b", weight=1)])
+
+    picks = [backends._pick(set()).name for _ in range(6)]
+
+    assert picks == ["a", "b", "a", "a", "b", "a"]
+
+
+def test_pick_skips_excluded_down_and_zero_weight_backends():
+    down = _backend("down")
+    down.down_until = time.monotonic() + 60
+    backends = SMTPBackendSet([down, _backend("off", weight=0), _backend("tried"), _backend("ok")])
+
+    assert backends._pick({"tried"}).name == "ok"
+    assert backends._pick({"tried", "ok"}) is None
+
+
+def test_pick_prefers_backends_whose_governor_allows_sending_now():
+    backends = SMTPBackendSet([_backend("waiting", governor=FakeGovernor(delay=5)), _backend("ready", governor=FakeGovernor())])
+
+    assert {backends._pick(set()).name for _ in range(4)} == {"ready"}
+
+
+def test_pick_falls_back_to_waiting_backends():
+    backends = SMTPBackendSet([_backend("waiting", governor=FakeGovernor(delay=5))])
+
+    assert backends._pick(set()).name == "waiting"
+
+
+def test_send_fails_over_on_connection_errors():
+    broken = _backend("broken", weight=10, pool=FakePool(aiosmtplib.SMTPServerDisconnected("gone")))
+    healthy_pool = FakePool()
+    backends = SMTPBackendSet([broken, _backend("healthy", pool=healthy_pool)])
+
+    backend, refused = asyncio.run(backends.send(_message(), 1))
+
+    assert backend.name == "healthy"
+    assert refused == {}
+    assert healthy_pool.sent[0]["From"] == "healthy@example.com"
+    assert not broken.available()
+    assert broken.consecutive_failures == 1
+
+
+def test_authentication_errors_take_the_backend_out_for_retry_max():
+    broken = _backend("broken", weight=10, pool=FakePool(aiosmtplib.SMTPAuthenticationError(535, "bad credentials")))
+    backends = SMTPBackendSet([broken, _backend("healthy")])
+
+    asyncio.run(backends.send(_message(), 1))
+
+    assert broken.down_until - time.monotonic() > 50
+
+
+def test_message_rejections_are_not_retried_on_another_backend():
+    rejected = _backend("rejected", weight=10, pool=FakePool(aiosmtplib.SMTPResponseException(550, "no such user")))
+    other_pool = FakePool()
+    backends = SMTPBackendSet([rejected, _backend("other", pool=other_pool)])
+
+    with pytest.raises(aiosmtplib.SMTPResponseException):
+        asyncio.run(backends.send(_message(), 1))
+
+    assert other_pool.sent == []
+    assert rejected.available()
+
+
+def test_when_every_backend_defers_the_earliest_retry_wins():
+    backends = SMTPBackendSet([
+        _backend("a", governor=FakeGovernor(deferred=SendDeferred("later", retry_after=60, reason="rate"))),
+        _backend("b", governor=FakeGovernor(deferred=SendDeferred("sooner", retry_after=5, reason="rate"))),
+    ])
+
+    with pytest.raises(SendDeferred) as deferred:
+        asyncio.run(backends.send(_message(), 1))
+
+    assert deferred.value.retry_after == 5
+
+
+def test_all_backends_down():
+    backend = _backend("a")
+    backend.down_until = time.monotonic() + 30
+    backends = SMTPBackendSet([backend])
+
+    with pytest.raises(SMTPBackendsUnavailable):
+        asyncio.run(backends.send(_message(), 1))
+    assert 0 < backends.send_delay() <= 30
+
+
+def test_last_connection_error_is_raised_when_every_backend_fails():
+    backends = SMTPBackendSet([
+        _backend("a", pool=FakePool(aiosmtplib.SMTPConnectError("refused"))),
+        _backend("b", pool=FakePool(aiosmtplib.SMTPConnectError("refused"))),
+    ])
+
+    with pytest.raises(aiosmtplib.SMTPConnectError):
+        asyncio.run(backends.send(_message(), 1))
+
+
+def test_backend_names_must_be_unique():
+    with pytest.raises(ValueError):
+        SMTPBackendSet([_backend("a"), _backend("a")])
@@ -0,0 +1,130 @@
+# tests/test_smtp_governor.py
+
+import asyncio
+import pytest
+from app.services.smtp_governor import SendDeferred, SendGovernor
+
+
+def _governor(db_path: str, **overrides) -> SendGovernor:
+    options = dict(
+        name="test",
+        rate=0,
+        burst=10,
+        daily_limit=0,
+        min_concurrency=1,
+        max_concurrency=4,
+        latency_target=1.0,
+        cooldown=0.0,
+        max_wait=0.0,
+        db_path=db_path,
+    )
+    options.update(overrides)
+    return SendGovernor(**options)
+
+
+def _send(governor: SendGovernor, recipients: int = 1, latency: float = 0.01):
+    asyncio.run(governor.acquire(recipients))
+    governor.on_success(latency)
+
+
+def test_daily_budget_is_shared_between_instances(db_path):
+    first = _governor(db_path, daily_limit=3)
+    second = _governor(db_path, daily_limit=3)
+
+    _send(first, recipients=2)
+    _send(second)
+    with pytest.raises(SendDeferred) as deferred:
+        asyncio.run(first.acquire(1))
+
+    assert deferred.value.reason == "daily_budget"
+    assert second.used == 3
+    assert second.stats()["used_today"] == 3
+
+
+def test_daily_budget_rejects_a_send_that_does_not_fit(db_path):
+    governor = _governor(db_path, daily_limit=3)
+    _send(governor, recipients=2)
+
+    with pytest.raises(SendDeferred):
+        asyncio.run(governor.acquire(2))
+    _send(governor, recipients=1)
+
+    assert governor.remaining_today() == 0
+
+
+def test_failed_and_released_sends_are_refunded(db_path):
+    governor = _governor(db_path, daily_limit=5)
+
+    asyncio.run(governor.acquire(2))
+    assert asyncio.run(governor.on_failure(2, 550, "mailbox unavailable")) is None
+    asyncio.run(governor.acquire(1))
+    asyncio.run(governor.release(1))
+
+    assert governor.remaining_today() == 5
+    assert governor.stats()["in_flight"] == 0
+
+    other = _governor(db_path, daily_limit=5)
+    asyncio.run(other.refresh_usage())
+    assert other.remaining_today() == 5
+
+
+def test_quota_error_exhausts_the_day_for_every_instance(db_path):
+    governor = _governor(db_path, daily_limit=100)
+    asyncio.run(governor.acquire(1))
+
+    deferred = asyncio.run(governor.on_failure(1, 550, "5.4.5 Daily user sending limit exceeded"))
+    other = _governor(db_path, daily_limit=100)
+    asyncio.run(other.refresh_usage())
+
+    assert deferred is not None and deferred.reason == "daily_budget"
+    assert governor.remaining_today() == 0
+    assert other.remaining_today() == 0
+    assert other.send_delay() > 0
+
+
+def test_rate_limit_defers_when_the_wait_exceeds_max_wait(db_path):
+    governor = _governor(db_path, rate=0.001, burst=1)
+    _send(governor)
+
+    with pytest.raises(SendDeferred) as deferred:
+        asyncio.run(governor.acquire(1))
+
+    assert deferred.value.reason == "rate"
+    assert deferred.value.retry_after > 0
+    assert governor.stats()["in_flight"] == 0
+
+
+def test_throttling_halves_concurrency_and_pauses(db_path):
+    governor = _governor(db_path, max_concurrency=8, cooldown=30.0)
+    asyncio.run(governor.acquire(1))
+
+    deferred = asyncio.run(governor.on_failure(1, 421, "try again later"))
+
+    assert deferred is not None and deferred.reason == "throttled"
+    assert governor.concurrency_limit == 4
+    assert governor.send_delay() > 0
+
+
+def test_slow_sends_decrease_and_fast_sends_increase_concurrency(db_path):
+    governor = _governor(db_path, max_concurrency=4)
+    _send(governor, latency=5.0)
+    assert governor.concurrency_limit == 2
+
+    for _ in range(10):
+        _send(governor, latency=0.01)
+    assert governor.concurrency_limit == 4
+
+
+def test_concurrency_limit_blocks_extra_sends():
+    async def scenario():
+        governor = _governor(":memory:", max_concurrency=1)
+        await governor.acquire(1)
+        waiting = asyncio.ensure_future(governor.acquire(1))
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+        governor.on_success(0.01)
+        await asyncio.wait_for(waiting, timeout=1)
+        governor.on_success(0.01)
+        return blocked
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,61 @@
+# tests/test_suppression.py
+
+from app.services.suppression import SuppressionList, is_hard_bounce
+
+
+def test_add_normalizes_and_keeps_the_first_record(db_path):
+    suppressions = SuppressionList(db_path)
+
+    assert suppressions.add("  Student@Example.com ", reason="manual block")
+    assert not suppressions.add("student@example.com", source="bounce")
+
+    assert suppressions.is_suppressed("STUDENT@example.com")
+    [entry] = suppressions.list()
+    assert entry["email"] == "student@example.com"
+    assert entry["source"] == "manual"
+
+
+def test_only_hard_bounces_are_recorded(db_path):
+    suppressions = SuppressionList(db_path)
+
+    assert suppressions.record_bounce("gone@example.com", 550, "5.1.1 user unknown")
+    assert not suppressions.record_bounce("full@example.com", 552, "mailbox full")
+    assert not suppressions.record_bounce("quota@example.com", 550, "5.4.5 Daily user sending limit exceeded")
+    assert not suppressions.record_bounce("later@example.com", 450, "try again")
+
+    assert suppressions.stats() == {"total": 1, "by_source": {"bounce": 1}}
+
+
+def test_is_hard_bounce():
+    assert is_hard_bounce(553, "mailbox name not allowed")
+    assert not is_hard_bounce(None, "connection lost")
+
+
+def test_remove(db_path):
+    suppressions = SuppressionList(db_path)
+    suppressions.add("student@example.com")
+
+    assert suppressions.remove("Student@Example.com")
+    assert not suppressions.remove("student@example.com")
+    assert not suppressions.is_suppressed("student@example.com")
+
+
+def test_changes_from_other_workers_are_seen_after_the_refresh_interval(db_path):
+    reader = SuppressionList(db_path, refresh_interval=3600)
+    writer = SuppressionList(db_path)
+    assert not reader.is_suppressed("student@example.com")
+
+    writer.add("student@example.com")
+    assert not reader.is_suppressed("student@example.com") # Copia en memoria aún vigente
+
+    reader.refresh_interval = 0
+    assert reader.is_suppressed("student@example.com")
+
+
+def test_list_filters_by_source(db_path):
+    suppressions = SuppressionList(db_path)
+    suppressions.add("a@example.com")
+    suppressions.record_bounce("b@example.com", 550, "user unknown")
+
+    assert [entry["email"] for entry in suppressions.list(source="bounce")] == ["b@example.com"]
+    assert len(suppressions.list(limit=1)) == 1